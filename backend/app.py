@@ -1,22 +1,49 @@
 import os
 import shutil
+import asyncio
 import tempfile
 import uuid
+from collections import deque
 from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.formparsers import MultiPartParser
 from pydantic import BaseModel
 import uvicorn
 
 from modules.word_processor import WordProcessor
 from modules.excel_processor import ExcelProcessor
 from modules.file_renamer import FileRenamer
-from modules.image_processor import ImageProcessor
+from modules.image_processor import ImageProcessor, ImageTooLarge, DERIVATIVE_SIZES
+from modules.worker_pool import WorkerPool, FileResult
+from modules.dispatcher import Dispatcher
+from modules.zip_stream import ZipStream, output_arcname, public_error, CHUNK_SIZE
+from modules.job_manager import JobManager
+from modules.result_cache import ResultCache
+from modules.upload_store import UploadStore
+from modules.upload_limits import UploadLimits, UploadLimitMiddleware
+from modules.janitor import TempJanitor
 
 app = FastAPI(title="批量工具箱API", description="提供文档处理、文件重命名和图像处理功能")
 
+# 上传限制：每个请求体的最大字节数（MB）和文件数，同时接收请求体的最大上传数，超出的上传排队等待
+MAX_UPLOAD_BYTES = int(os.environ.get("BATCH_TOOLBOX_MAX_UPLOAD_MB", "512")) * 1024 * 1024
+MAX_UPLOAD_FILES = int(os.environ.get("BATCH_TOOLBOX_MAX_UPLOAD_FILES", "500"))
+UPLOAD_CONCURRENCY = int(os.environ.get("BATCH_TOOLBOX_UPLOAD_CONCURRENCY", "8"))
+upload_limits = UploadLimits(MAX_UPLOAD_BYTES, MAX_UPLOAD_FILES, UPLOAD_CONCURRENCY)
+# 必须在CORS之前添加，使413响应也带有CORS响应头
+app.add_middleware(UploadLimitMiddleware, limits=upload_limits)
+
+# 表单解析时不超过该大小（KB）的上传文件只保存在内存中，更大的文件才写入临时文件
+UPLOAD_SPOOL_BYTES = int(os.environ.get("BATCH_TOOLBOX_UPLOAD_SPOOL_KB", "1024")) * 1024
+# Starlette 0.27中该阈值为max_file_size，之后的版本改名为spool_max_size
+for attribute in ("spool_max_size", "max_file_size"):
+    if hasattr(MultiPartParser, attribute):
+        setattr(MultiPartParser, attribute, UPLOAD_SPOOL_BYTES)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,24 +51,91 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 允许前端读取合并统计等自定义响应头
+    expose_headers=[
+        "Content-Disposition",
+        "X-Merge-Sheets",
+        "X-Merge-Rows",
+        "X-Merge-Duplicates-Removed",
+        "X-Merge-Seconds",
+        "X-Merge-Peak-Memory-MB",
+    ],
 )
 
-# 挂载静态文件目录
-# 由于应用程序是从backend目录启动的，使用相对路径"../"指向项目根目录
-app.mount("/", StaticFiles(directory="../", html=True), name="static")
-
 # 创建临时文件夹
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "batch-toolbox")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# 创建上传文件夹
+# 创建上传文件夹，上传文件按内容去重保存
 UPLOAD_DIR = os.path.join(TEMP_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+upload_store = UploadStore(UPLOAD_DIR)
 
 # 创建输出文件夹
 OUTPUT_DIR = os.path.join(TEMP_DIR, "outputs")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# 合并Excel时是否用tracemalloc统计峰值内存（X-Merge-Peak-Memory-MB响应头），会明显拖慢合并，仅用于调试
+EXCEL_MERGE_TRACE_MEMORY = os.environ.get("BATCH_TOOLBOX_TRACE_MERGE_MEMORY", "") == "1"
+
+# 批量处理进程池大小，可通过环境变量BATCH_TOOLBOX_WORKERS配置，默认使用CPU核心数
+WORKER_PROCESSES = int(os.environ.get("BATCH_TOOLBOX_WORKERS", "0")) or None
+worker_pool = WorkerPool(WORKER_PROCESSES)
+
+# 各路由的最大并发请求数，超出的请求排队等待，避免重型请求占满执行器而阻塞轻量请求
+DEFAULT_ROUTE_CONCURRENCY = int(os.environ.get("BATCH_TOOLBOX_ROUTE_CONCURRENCY", "4"))
+ROUTE_CONCURRENCY = {
+    "/api/word/batch-find-replace": 2,
+    "/api/word/batch-extract": 2,
+    "/api/word/merge": 2,
+    "/api/excel/batch-find-replace": 2,
+    "/api/excel/merge": 2,
+    "/api/image/batch-process": 2,
+    "/api/image/derivatives": 2,
+}
+dispatcher = Dispatcher(worker_pool, route_limits=ROUTE_CONCURRENCY, default_limit=DEFAULT_ROUTE_CONCURRENCY)
+
+# 异步任务的结果目录和保留时间（秒），结果过期后自动删除
+JOBS_DIR = os.path.join(OUTPUT_DIR, "jobs")
+JOB_TTL_SECONDS = int(os.environ.get("BATCH_TOOLBOX_JOB_TTL", "3600"))
+job_manager = JobManager(dispatcher, JOBS_DIR, JOB_TTL_SECONDS)
+
+# 处理结果缓存：相同文件和参数的请求直接返回缓存的结果，总大小（MB）超出上限时淘汰最近最少使用的结果，
+# 结果在BATCH_TOOLBOX_CACHE_TTL秒后过期；上限设为0时关闭缓存
+CACHE_DIR = os.path.join(TEMP_DIR, "cache")
+CACHE_MAX_BYTES = int(os.environ.get("BATCH_TOOLBOX_CACHE_MAX_MB", "1024")) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.environ.get("BATCH_TOOLBOX_CACHE_TTL", "3600"))
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+
+# 临时空间清理：上传和输出目录中超过保留时间（秒）的条目被删除，总大小（MB）超出上限时从最旧的开始删除；
+# 磁盘剩余空间（MB）低于下限时拒绝新请求并立即清理。异步任务和结果缓存各自管理过期，不在清理范围内
+TEMP_MAX_AGE_SECONDS = int(os.environ.get("BATCH_TOOLBOX_TEMP_MAX_AGE", "3600"))
+TEMP_MAX_BYTES = int(os.environ.get("BATCH_TOOLBOX_TEMP_MAX_MB", "4096")) * 1024 * 1024
+TEMP_MIN_FREE_BYTES = int(os.environ.get("BATCH_TOOLBOX_MIN_FREE_MB", "512")) * 1024 * 1024
+JANITOR_INTERVAL = 60
+janitor = TempJanitor(
+    TEMP_DIR, [UPLOAD_DIR, OUTPUT_DIR], TEMP_MAX_AGE_SECONDS, TEMP_MAX_BYTES, TEMP_MIN_FREE_BYTES,
+    exclude=[os.path.basename(JOBS_DIR)], in_use=upload_store.owns
+)
+
+def has_temp_space() -> bool:
+    """临时空间不足时立即在后台清理，本次请求被拒绝"""
+    if janitor.check_space():
+        return True
+    dispatcher.submit_io(janitor.sweep, True)
+    return False
+
+upload_limits.disk_guard = has_temp_space
+
+# 提取内容的输出格式对应的响应类型
+EXTRACT_MEDIA_TYPES = {
+    "text": "text/plain",
+    "markdown": "text/markdown",
+    "json": "application/json",
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
 # 定义请求模型
 class FindReplaceRequest(BaseModel):
     find_text: str
@@ -56,6 +150,7 @@ class ResizeImageRequest(BaseModel):
     width: Optional[int] = None
     height: Optional[int] = None
     keep_aspect_ratio: bool = True
+    resample_quality: str = "balanced"
 
 class WatermarkRequest(BaseModel):
     text: Optional[str] = None
@@ -73,15 +168,37 @@ class FilterRequest(BaseModel):
 
 # 工具函数
 def save_upload_file(upload_file: UploadFile) -> str:
-    """保存上传的文件并返回文件路径"""
-    file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_extension}")
+    """
+    保存上传的文件并返回文件路径
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
+    写入的同时计算SHA-256，内容相同的文件共用同一路径，用完后由remove_paths释放引用
+    """
+    return upload_store.save(upload_file.file, upload_file.filename)
+
+def save_upload_files(upload_files: List[UploadFile]) -> List[str]:
+    """保存多个上传的文件并返回文件路径列表"""
+    return [save_upload_file(upload_file) for upload_file in upload_files]
+
+def remove_paths(paths: List[Optional[str]]) -> None:
+    """删除临时文件或目录，忽略不存在的路径；上传文件只释放引用，最后一个引用释放时才删除"""
+    for path in paths:
+        if path and upload_store.owns(path):
+            upload_store.release([path])
+            continue
+        if not path or not os.path.exists(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def remove_after_response(paths: List[Optional[str]]) -> BackgroundTask:
+    """
+    响应发送完毕后删除输出文件或目录
     
-    return file_path
+    命中缓存时返回的是缓存中的文件，不在paths中，不会被删除
+    """
+    return BackgroundTask(dispatcher.run_io, remove_paths, paths)
 
 def create_output_path(original_filename: str, suffix: str = "") -> str:
     """创建输出文件路径"""
@@ -90,11 +207,260 @@ def create_output_path(original_filename: str, suffix: str = "") -> str:
     output_filename = f"{file_name}_{suffix}{file_extension}" if suffix else f"{file_name}{file_extension}"
     return os.path.join(OUTPUT_DIR, f"{file_id}_{output_filename}")
 
+def create_output_dir() -> str:
+    """创建唯一的输出目录"""
+    output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+async def lookup_cache(route: str, file_paths: List[str], params: Dict[str, Any]):
+    """计算缓存键并查找缓存，返回(缓存键, 缓存的结果)；缓存未启用时均为None"""
+    if not result_cache.enabled:
+        return None, None
+    key = result_cache.key(route, [upload_store.digest(path) for path in file_paths], params)
+    return key, result_cache.get(key)
+
+async def cached_result(route: str, file_paths: List[str], params: Dict[str, Any], func, *args,
+                        uncached_keys=()):
+    """
+    返回缓存的处理结果，未命中时在进程池中执行func并把结果加入缓存
+    
+    func返回结果文件路径或(结果文件路径, 附加数据)，命中时返回相同形式的值，路径指向缓存中的文件；
+    附加数据为字典时，uncached_keys中的键（只对本次执行有意义的测量值）不写入缓存，命中时不会出现
+    """
+    key, cached = await lookup_cache(route, file_paths, params)
+    if cached is not None:
+        path, extra = cached
+        return path if extra is None else (path, extra)
+    
+    result = await dispatcher.run_cpu(func, *args)
+    if key:
+        path, extra = result if isinstance(result, tuple) else (result, None)
+        if isinstance(extra, dict) and uncached_keys:
+            extra = {name: value for name, value in extra.items() if name not in uncached_keys}
+        await dispatcher.run_io(result_cache.put, key, path, extra)
+    return result
+
+async def iter_file_results(sources: List[str], outputs: List[str]):
+    """将已经完成的输出路径列表包装为FileResult序列"""
+    for source, output in zip(sources, outputs):
+        yield FileResult(source, output, None)
+
+async def iter_derivative_results(file_path: str, *args):
+    """在进程池中从一次解码生成全部缩略图，并将结果包装为FileResult序列；失败时产出一个错误结果"""
+    try:
+        outputs = await dispatcher.run_cpu(ImageProcessor.generate_derivatives, file_path, *args)
+    except Exception as e:
+        yield FileResult(file_path, None, str(e))
+        return
+    async for result in iter_file_results([file_path] * len(outputs), outputs):
+        yield result
+
+async def iter_rename_results(func, file_paths: List[str], *args):
+    """在I/O线程池中执行重命名，并将结果包装为FileResult序列"""
+    result_paths = await dispatcher.run_io(func, file_paths, *args)
+    async for result in iter_file_results(file_paths, result_paths):
+        yield result
+
+async def submit_job(kind: str, files: List[UploadFile], make_results) -> JSONResponse:
+    """
+    保存上传文件并在后台启动异步任务
+    
+    Args:
+        kind: 任务类型
+        files: 上传的文件列表
+        make_results: 接收(file_paths, output_dir)并返回FileResult异步迭代器的函数
+    """
+    try:
+        file_paths = await dispatcher.run_io(save_upload_files, files)
+        output_dir = create_output_dir()
+        job = job_manager.create(kind, [file.filename for file in files])
+    except Exception as e:
+        await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    job_manager.start(job, make_results(file_paths, output_dir), file_paths, [output_dir])
+    # 上传文件可能与其他请求共用，任务结束后只释放引用
+    job.task.add_done_callback(lambda task: dispatcher.submit_io(remove_paths, file_paths))
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job.id,
+            "status_url": f"/api/jobs/{job.id}",
+            "result_url": f"/api/jobs/{job.id}/result",
+        }
+    )
+
+def upload_names(file_paths: List[str], upload_files: List[UploadFile]) -> Dict[str, deque]:
+    """按保存后的路径列出用户上传时的文件名，内容相同的文件共用路径，按上传顺序排列"""
+    names = {}
+    for path, upload in zip(file_paths, upload_files):
+        names.setdefault(path, deque()).append(upload.filename)
+    return names
+
+def next_upload_name(names: Dict[str, deque], path: str) -> str:
+    """取出路径对应的下一个上传文件名，结果按上传顺序产出，每个上传文件对应一个结果"""
+    queue = names.get(path)
+    return queue.popleft() if queue else os.path.basename(path)
+
+def zip_streaming_response(route: str, results, upload_files: List[UploadFile], file_paths: List[str],
+                           filename: str, cleanup_paths: List[Optional[str]],
+                           cache_key: Optional[str] = None) -> StreamingResponse:
+    """
+    以流式ZIP返回批量处理结果
+    
+    每个文件处理完成后立即写入响应，失败的文件汇总到ZIP末尾的errors.txt中；
+    传输结束或客户端断开后删除上传文件和输出目录。指定cache_key时ZIP同时写入结果缓存，
+    全部文件成功且传输完成后才加入缓存。
+    """
+    original_names = upload_names(file_paths, upload_files)
+    
+    async def body():
+        zip_stream = ZipStream()
+        failures = []
+        writer = None
+        try:
+            async with dispatcher.slot(route):
+                if cache_key:
+                    writer = await dispatcher.run_io(result_cache.writer, cache_key)
+                async for result in results:
+                    original_name = next_upload_name(original_names, result.source)
+                    if result.error:
+                        failures.append(f"{original_name}: {public_error(original_name, result.source, result.error)}")
+                        continue
+                    
+                    chunks = zip_stream.add_file(result.output, output_arcname(original_name, result.source, result.output))
+                    if writer:
+                        chunks = writer.tee(chunks)
+                    while True:
+                        chunk = await dispatcher.run_io(next, chunks, None)
+                        if chunk is None:
+                            break
+                        yield chunk
+                
+                if failures:
+                    for chunk in zip_stream.add_bytes("\n".join(failures) + "\n", "errors.txt"):
+                        yield chunk
+                trailer = zip_stream.close()
+                if writer:
+                    writer.write(trailer)
+                yield trailer
+                
+                # 失败可能是暂时的，包含失败文件的结果不缓存
+                if writer and not failures:
+                    await dispatcher.run_io(writer.commit)
+                    writer = None
+        finally:
+            # 请求被取消时不能再等待，直接提交到线程池清理
+            if writer:
+                dispatcher.submit_io(writer.discard)
+            dispatcher.submit_io(remove_paths, cleanup_paths)
+    
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def extract_streaming_response(route: str, results, upload_files: List[UploadFile], file_paths: List[str],
+                               output_format: str, cleanup_paths: List[Optional[str]],
+                               cache_key: Optional[str] = None) -> StreamingResponse:
+    """
+    以流式NDJSON或Markdown返回批量提取结果
+    
+    每个文件提取完成后立即写入响应：NDJSON的每一行都带有"file"字段，提取失败的文件输出一行"error"；
+    Markdown中每个文件以文件名作为一级标题。传输结束或客户端断开后删除上传文件和输出目录。
+    指定cache_key时响应内容同时写入结果缓存，全部文件成功且传输完成后才加入缓存。
+    """
+    import json
+    original_names = upload_names(file_paths, upload_files)
+    
+    def read_chunks(path):
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    
+    def read_lines(path, prefix):
+        # 在每行JSON对象的开头插入文件名字段
+        with open(path, "rb") as f:
+            for line in f:
+                yield prefix + line[1:]
+    
+    async def body():
+        writer = None
+        failed = False
+        try:
+            async with dispatcher.slot(route):
+                if cache_key:
+                    writer = await dispatcher.run_io(result_cache.writer, cache_key)
+                async for result in results:
+                    original_name = next_upload_name(original_names, result.source)
+                    error = public_error(original_name, result.source, result.error) if result.error else None
+                    if output_format == "ndjson":
+                        if error:
+                            head = (json.dumps({"file": original_name, "error": error}, ensure_ascii=False) + "\n").encode("utf-8")
+                        else:
+                            head = None
+                            prefix = b'{"file": ' + json.dumps(original_name, ensure_ascii=False).encode("utf-8") + b", "
+                            chunks = read_lines(result.output, prefix)
+                    else:
+                        head = f"# {original_name}\n\n".encode("utf-8")
+                        if error:
+                            head += f"> 提取失败: {error}\n\n".encode("utf-8")
+                        else:
+                            chunks = read_chunks(result.output)
+                    
+                    if head:
+                        if writer:
+                            writer.write(head)
+                        yield head
+                    if result.error:
+                        failed = True
+                        continue
+                    
+                    if writer:
+                        chunks = writer.tee(chunks)
+                    while True:
+                        chunk = await dispatcher.run_io(next, chunks, None)
+                        if chunk is None:
+                            break
+                        yield chunk
+                    # 已发送的文件立即删除，输出目录不会随批次增大；重复上传的文件共用输出，最后一次发送后删除
+                    if not original_names.get(result.source):
+                        await dispatcher.run_io(remove_paths, [result.output])
+                
+                # 失败可能是暂时的，包含失败文件的结果不缓存
+                if writer and not failed:
+                    await dispatcher.run_io(writer.commit)
+                    writer = None
+        finally:
+            # 请求被取消时不能再等待，直接提交到线程池清理
+            if writer:
+                dispatcher.submit_io(writer.discard)
+            dispatcher.submit_io(remove_paths, cleanup_paths)
+    
+    media_type = "application/x-ndjson" if output_format == "ndjson" else "text/markdown; charset=utf-8"
+    return StreamingResponse(body(), media_type=media_type)
+
 # API路由
 @app.get("/api/status")
 def read_root():
     return {"message": "批量工具箱API服务正在运行"}
 
+@app.get("/api/metrics")
+def read_metrics():
+    """返回执行器队列深度和各路由的并发统计"""
+    return {
+        "dispatcher": dispatcher.metrics(),
+        "jobs": job_manager.metrics(),
+        "cache": result_cache.metrics(),
+        "uploads": dict(upload_store.metrics(), limits=upload_limits.metrics()),
+        "janitor": janitor.metrics(),
+    }
+
 # Word文档处理API
 @app.post("/api/word/find-replace")
 async def word_find_replace(
@@ -103,28 +469,34 @@ async def word_find_replace(
     replace_text: str = Form(...),
     use_regex: bool = Form(False)
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 创建输出路径
-        output_path = create_output_path(file.filename, "replaced")
-        
-        # 执行查找替换
-        result_path = WordProcessor.find_replace(file_path, find_text, replace_text, use_regex, os.path.dirname(output_path))
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=os.path.basename(output_path),
-            media_type="application/octet-stream"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    async with dispatcher.slot("/api/word/find-replace"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 创建输出路径，上传文件可能与其他请求共用，输出写入本次请求的目录
+            output_path = create_output_path(file.filename, "replaced")
+            output_dir = create_output_dir()
+            
+            # 执行查找替换
+            result_path = await cached_result(
+                "/api/word/find-replace", [file_path],
+                {"find_text": find_text, "replace_text": replace_text, "use_regex": use_regex},
+                WordProcessor.find_replace, file_path, find_text, replace_text, use_regex, output_dir
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=os.path.basename(output_path),
+                media_type="application/octet-stream",
+                background=remove_after_response([output_dir])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
 
 @app.post("/api/word/batch-find-replace")
 async def word_batch_find_replace(
@@ -132,97 +504,142 @@ async def word_batch_find_replace(
     request: str = Form(...)
 ):
     import json
-    try:
-        # 解析请求
-        req_data = json.loads(request)
-        replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
-        use_regex = req_data.get("use_regex", False)
-        
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行批量查找替换
-        result_paths = WordProcessor.batch_find_replace(file_paths, replacements, use_regex, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_batch_replaced.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="batch_replaced.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/word/batch-find-replace"):
+        try:
+            # 解析请求
+            req_data = json.loads(request)
+            replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
+            use_regex = req_data.get("use_regex", False)
+            
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 相同文件（含文件名）和参数的批次直接返回缓存的结果
+            cache_key, cached = await lookup_cache("/api/word/batch-find-replace", file_paths, {
+                "files": [file.filename for file in files], "replacements": replacements, "use_regex": use_regex
+            })
+            if cached is not None:
+                await dispatcher.run_io(remove_paths, file_paths)
+                return FileResponse(path=cached[0], filename="batch_replaced.zip", media_type="application/zip")
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # 在进程池中按文件并行执行批量查找替换，每个文件完成后立即写入ZIP响应
+    results = dispatcher.imap_cpu(WordProcessor.apply_replacements, file_paths, replacements, use_regex, output_dir)
+    return zip_streaming_response(
+        "/api/word/batch-find-replace", results, files, file_paths,
+        "batch_replaced.zip", file_paths + [output_dir], cache_key
+    )
 
 @app.post("/api/word/merge")
 async def word_merge(
     files: List[UploadFile] = File(...)
 ):
-    try:
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出路径
-        output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_merged.docx")
-        
-        # 执行合并
-        result_path = WordProcessor.merge_documents(file_paths, output_path)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename="merged.docx",
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
+    async with dispatcher.slot("/api/word/merge"):
+        try:
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 创建输出路径
+            output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_merged.docx")
+            
+            # 执行合并
+            result_path = await cached_result(
+                "/api/word/merge", file_paths, {}, WordProcessor.merge_documents, file_paths, output_path
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename="merged.docx",
+                media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                background=remove_after_response([output_path])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []))
 
 @app.post("/api/word/extract")
 async def word_extract(
     file: UploadFile = File(...),
-    extract_type: str = Form(...)
+    extract_type: str = Form(...),
+    output_format: str = Form("text")
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 创建输出路径
-        output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_extracted.txt")
-        
-        # 执行提取
-        result_path = WordProcessor.extract_content(file_path, output_path, extract_type)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename="extracted_content.txt",
-            media_type="text/plain"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    async with dispatcher.slot("/api/word/extract"):
+        try:
+            if output_format not in EXTRACT_MEDIA_TYPES:
+                raise ValueError(f"不支持的输出格式: {output_format}")
+            extension = WordProcessor.EXTRACT_FORMATS[output_format]
+            
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 创建输出路径
+            output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_extracted{extension}")
+            
+            # 执行提取
+            result_path = await cached_result(
+                "/api/word/extract", [file_path], {"extract_type": extract_type, "output_format": output_format},
+                WordProcessor.extract_content, file_path, output_path, extract_type, output_format
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=f"extracted_content{extension}",
+                media_type=EXTRACT_MEDIA_TYPES[output_format],
+                background=remove_after_response([output_path])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
+
+@app.post("/api/word/batch-extract")
+async def word_batch_extract(
+    files: List[UploadFile] = File(...),
+    extract_type: str = Form("all"),
+    output_format: str = Form("ndjson")
+):
+    async with dispatcher.slot("/api/word/batch-extract"):
+        try:
+            if output_format not in ("ndjson", "markdown"):
+                raise ValueError(f"批量提取不支持的输出格式: {output_format}")
+            if extract_type not in ("text", "tables", "all"):
+                raise ValueError(f"不支持的提取类型: {extract_type}")
+            
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 相同文件（含文件名）和参数的批次直接返回缓存的结果
+            cache_key, cached = await lookup_cache("/api/word/batch-extract", file_paths, {
+                "files": [file.filename for file in files], "extract_type": extract_type, "output_format": output_format
+            })
+            if cached is not None:
+                await dispatcher.run_io(remove_paths, file_paths)
+                return FileResponse(path=cached[0], media_type=EXTRACT_MEDIA_TYPES[output_format])
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # 在进程池中按文件并行提取，每个文件完成后立即把内容写入响应
+    results = dispatcher.imap_cpu(WordProcessor.extract_to_dir, file_paths, output_dir, extract_type, output_format)
+    return extract_streaming_response(
+        "/api/word/batch-extract", results, files, file_paths, output_format, file_paths + [output_dir], cache_key
+    )
 
 # Excel文档处理API
 @app.post("/api/excel/find-replace")
@@ -233,28 +650,34 @@ async def excel_find_replace(
     sheet_range: Optional[str] = Form(None),
     use_regex: bool = Form(False)
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 创建输出路径
-        output_path = create_output_path(file.filename, "replaced")
-        
-        # 执行查找替换
-        result_path = ExcelProcessor.find_replace(file_path, find_text, replace_text, sheet_range, use_regex, os.path.dirname(output_path))
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=os.path.basename(output_path),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    async with dispatcher.slot("/api/excel/find-replace"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 创建输出路径，上传文件可能与其他请求共用，输出写入本次请求的目录
+            output_path = create_output_path(file.filename, "replaced")
+            output_dir = create_output_dir()
+            
+            # 执行查找替换
+            result_path = await cached_result(
+                "/api/excel/find-replace", [file_path],
+                {"find_text": find_text, "replace_text": replace_text, "sheet_range": sheet_range, "use_regex": use_regex},
+                ExcelProcessor.find_replace, file_path, find_text, replace_text, sheet_range, use_regex, output_dir
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=os.path.basename(output_path),
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                background=remove_after_response([output_dir])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
 
 @app.post("/api/excel/batch-find-replace")
 async def excel_batch_find_replace(
@@ -262,42 +685,40 @@ async def excel_batch_find_replace(
     request: str = Form(...)
 ):
     import json
-    try:
-        # 解析请求
-        req_data = json.loads(request)
-        replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
-        sheet_range = req_data.get("sheet_range")
-        use_regex = req_data.get("use_regex", False)
-        
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行批量查找替换
-        result_paths = ExcelProcessor.batch_find_replace(file_paths, replacements, sheet_range, use_regex, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_batch_replaced.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="batch_replaced.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/excel/batch-find-replace"):
+        try:
+            # 解析请求
+            req_data = json.loads(request)
+            replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
+            sheet_range = req_data.get("sheet_range")
+            use_regex = req_data.get("use_regex", False)
+            
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 相同文件（含文件名）和参数的批次直接返回缓存的结果
+            cache_key, cached = await lookup_cache("/api/excel/batch-find-replace", file_paths, {
+                "files": [file.filename for file in files], "replacements": replacements,
+                "sheet_range": sheet_range, "use_regex": use_regex
+            })
+            if cached is not None:
+                await dispatcher.run_io(remove_paths, file_paths)
+                return FileResponse(path=cached[0], filename="batch_replaced.zip", media_type="application/zip")
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # 在进程池中按文件并行执行批量查找替换，每个文件完成后立即写入ZIP响应
+    results = dispatcher.imap_cpu(ExcelProcessor.apply_replacements, file_paths, replacements, sheet_range, use_regex, output_dir)
+    return zip_streaming_response(
+        "/api/excel/batch-find-replace", results, files, file_paths,
+        "batch_replaced.zip", file_paths + [output_dir], cache_key
+    )
 
 @app.post("/api/excel/merge")
 async def excel_merge(
@@ -305,29 +726,45 @@ async def excel_merge(
     merge_type: str = Form(...),
     remove_duplicates: bool = Form(False)
 ):
-    try:
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出路径
-        output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_merged.xlsx")
-        
-        # 执行合并
-        result_path = ExcelProcessor.merge_excel_files(file_paths, merge_type, output_path, remove_duplicates)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename="merged.xlsx",
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
+    async with dispatcher.slot("/api/excel/merge"):
+        try:
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 创建输出路径
+            output_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_merged.xlsx")
+            
+            # 执行合并，按工作表合并时工作表名称以用户上传时的文件名为前缀
+            file_names = [file.filename for file in files]
+            result_path, stats = await cached_result(
+                "/api/excel/merge", file_paths,
+                {"merge_type": merge_type, "remove_duplicates": remove_duplicates, "files": file_names},
+                ExcelProcessor.merge_excel_files, file_paths, merge_type, output_path, remove_duplicates, True,
+                EXCEL_MERGE_TRACE_MEMORY, file_names, uncached_keys=("seconds", "peak_memory_mb")
+            )
+            
+            # 返回处理后的文件，合并统计放在响应头中；命中缓存时没有耗时，只有开启内存跟踪时才有峰值内存
+            headers = {
+                "X-Merge-Sheets": str(stats["sheets"]),
+                "X-Merge-Rows": str(stats["rows"]),
+                "X-Merge-Duplicates-Removed": str(stats["duplicates_removed"]),
+            }
+            if "seconds" in stats:
+                headers["X-Merge-Seconds"] = str(stats["seconds"])
+            if "peak_memory_mb" in stats:
+                headers["X-Merge-Peak-Memory-MB"] = str(stats["peak_memory_mb"])
+            return FileResponse(
+                path=result_path,
+                filename="merged.xlsx",
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers=headers,
+                background=remove_after_response([output_path])
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []))
 
 # 文件重命名API
 @app.post("/api/rename/batch")
@@ -336,40 +773,29 @@ async def batch_rename(
     request: str = Form(...)
 ):
     import json
-    try:
-        # 解析请求
-        req_data = json.loads(request)
-        operations = req_data["operations"]
-        
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行批量重命名
-        result_paths = FileRenamer.batch_rename(file_paths, operations, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_renamed.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="renamed_files.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/rename/batch"):
+        try:
+            # 解析请求
+            req_data = json.loads(request)
+            operations = req_data["operations"]
+            
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+            # 执行批量重命名
+            result_paths = await dispatcher.run_io(FileRenamer.batch_rename, file_paths, operations, output_dir)
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return zip_streaming_response(
+        "/api/rename/batch", iter_file_results(file_paths, result_paths), files, file_paths,
+        "renamed_files.zip", file_paths + [output_dir]
+    )
 
 @app.post("/api/rename/sequence")
 async def sequence_rename(
@@ -379,36 +805,25 @@ async def sequence_rename(
     step: int = Form(1),
     padding: int = Form(1)
 ):
-    try:
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行序列重命名
-        result_paths = FileRenamer.sequence_rename(file_paths, pattern, start_number, step, padding, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_renamed.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="renamed_files.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/rename/sequence"):
+        try:
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+            # 执行序列重命名
+            result_paths = await dispatcher.run_io(FileRenamer.sequence_rename, file_paths, pattern, start_number, step, padding, output_dir)
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return zip_streaming_response(
+        "/api/rename/sequence", iter_file_results(file_paths, result_paths), files, file_paths,
+        "renamed_files.zip", file_paths + [output_dir]
+    )
 
 @app.post("/api/rename/date-sequence")
 async def date_sequence_rename(
@@ -418,36 +833,25 @@ async def date_sequence_rename(
     start_date: Optional[str] = Form(None),
     days_step: int = Form(1)
 ):
-    try:
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行日期序列重命名
-        result_paths = FileRenamer.date_sequence_rename(file_paths, pattern, date_format, start_date, days_step, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_renamed.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="renamed_files.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/rename/date-sequence"):
+        try:
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+            # 执行日期序列重命名
+            result_paths = await dispatcher.run_io(FileRenamer.date_sequence_rename, file_paths, pattern, date_format, start_date, days_step, output_dir)
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return zip_streaming_response(
+        "/api/rename/date-sequence", iter_file_results(file_paths, result_paths), files, file_paths,
+        "renamed_files.zip", file_paths + [output_dir]
+    )
 
 @app.post("/api/rename/from-excel")
 async def rename_from_excel(
@@ -455,39 +859,26 @@ async def rename_from_excel(
     excel_file: UploadFile = File(...),
     name_column: str = Form(...)
 ):
-    try:
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        excel_path = save_upload_file(excel_file)
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行从Excel导入重命名
-        result_paths = FileRenamer.rename_from_excel(file_paths, excel_path, name_column, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_renamed.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="renamed_files.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'excel_path' in locals() and os.path.exists(excel_path):
-            os.remove(excel_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+    async with dispatcher.slot("/api/rename/from-excel"):
+        try:
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            excel_path = await dispatcher.run_io(save_upload_file, excel_file)
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+            # 执行从Excel导入重命名
+            result_paths = await dispatcher.run_io(FileRenamer.rename_from_excel, file_paths, excel_path, name_column, output_dir)
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('excel_path'), locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return zip_streaming_response(
+        "/api/rename/from-excel", iter_file_results(file_paths, result_paths), files, file_paths,
+        "renamed_files.zip", file_paths + [excel_path, output_dir]
+    )
 
 # 图像处理API
 @app.post("/api/image/convert")
@@ -496,52 +887,72 @@ async def convert_image(
     target_format: str = Form(...),
     quality: int = Form(90)
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 执行格式转换
-        result_path = ImageProcessor.convert_format(file_path, target_format, quality)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=f"{os.path.splitext(file.filename)[0]}.{target_format}",
-            media_type="image/*"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    async with dispatcher.slot("/api/image/convert"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 输出写入本次请求的目录，不与共用同一上传文件的请求冲突
+            output_dir = create_output_dir()
+            
+            # 执行格式转换
+            result_path = await cached_result(
+                "/api/image/convert", [file_path], {"target_format": target_format, "quality": quality},
+                ImageProcessor.convert_format, file_path, target_format, quality, output_dir
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=f"{os.path.splitext(file.filename)[0]}.{target_format}",
+                media_type="image/*",
+                background=remove_after_response([output_dir])
+            )
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
 
 @app.post("/api/image/resize")
 async def resize_image(
     file: UploadFile = File(...),
     width: Optional[int] = Form(None),
     height: Optional[int] = Form(None),
-    keep_aspect_ratio: bool = Form(True)
+    keep_aspect_ratio: bool = Form(True),
+    resample_quality: str = Form("balanced")
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 执行调整大小
-        result_path = ImageProcessor.resize_image(file_path, width, height, keep_aspect_ratio)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=f"{os.path.splitext(file.filename)[0]}_resized{os.path.splitext(file.filename)[1]}",
-            media_type="image/*"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    async with dispatcher.slot("/api/image/resize"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 输出写入本次请求的目录，不与共用同一上传文件的请求冲突
+            output_dir = create_output_dir()
+            
+            # 执行调整大小
+            result_path = await cached_result(
+                "/api/image/resize", [file_path],
+                {"width": width, "height": height, "keep_aspect_ratio": keep_aspect_ratio, "resample_quality": resample_quality},
+                ImageProcessor.resize_image, file_path, width, height, keep_aspect_ratio, output_dir, resample_quality
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=f"{os.path.splitext(file.filename)[0]}_resized{os.path.splitext(file.filename)[1]}",
+                media_type="image/*",
+                background=remove_after_response([output_dir])
+            )
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
 
 @app.post("/api/image/watermark")
 async def add_watermark(
@@ -552,31 +963,39 @@ async def add_watermark(
     opacity: float = Form(0.5),
     rotation: int = Form(0)
 ):
-    try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        watermark_image_path = None
-        
-        if watermark_image:
-            watermark_image_path = save_upload_file(watermark_image)
-        
-        # 执行添加水印
-        result_path = ImageProcessor.add_watermark(file_path, watermark_text, watermark_image_path, position, opacity, rotation)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=f"{os.path.splitext(file.filename)[0]}_watermarked{os.path.splitext(file.filename)[1]}",
-            media_type="image/*"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-        if 'watermark_image_path' in locals() and watermark_image_path and os.path.exists(watermark_image_path):
-            os.remove(watermark_image_path)
+    async with dispatcher.slot("/api/image/watermark"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            watermark_image_path = None
+            
+            if watermark_image:
+                watermark_image_path = await dispatcher.run_io(save_upload_file, watermark_image)
+            
+            # 输出写入本次请求的目录，不与共用同一上传文件的请求冲突
+            output_dir = create_output_dir()
+            
+            # 执行添加水印
+            result_path = await cached_result(
+                "/api/image/watermark", [path for path in (file_path, watermark_image_path) if path],
+                {"watermark_text": watermark_text, "position": position, "opacity": opacity, "rotation": rotation},
+                ImageProcessor.add_watermark, file_path, watermark_text, watermark_image_path, position, opacity, rotation, output_dir
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=f"{os.path.splitext(file.filename)[0]}_watermarked{os.path.splitext(file.filename)[1]}",
+                media_type="image/*",
+                background=remove_after_response([output_dir])
+            )
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path'), locals().get('watermark_image_path')])
 
 @app.post("/api/image/filter")
 async def apply_filter(
@@ -584,28 +1003,172 @@ async def apply_filter(
     filter_type: str = Form(...),
     intensity: float = Form(1.0)
 ):
+    async with dispatcher.slot("/api/image/filter"):
+        try:
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 输出写入本次请求的目录，不与共用同一上传文件的请求冲突
+            output_dir = create_output_dir()
+            
+            # 执行应用滤镜
+            result_path = await cached_result(
+                "/api/image/filter", [file_path], {"filter_type": filter_type, "intensity": intensity},
+                ImageProcessor.apply_filter, file_path, filter_type, intensity, output_dir
+            )
+            
+            # 返回处理后的文件
+            return FileResponse(
+                path=result_path,
+                filename=f"{os.path.splitext(file.filename)[0]}_{filter_type}{os.path.splitext(file.filename)[1]}",
+                media_type="image/*",
+                background=remove_after_response([output_dir])
+            )
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path')])
+
+@app.post("/api/image/batch-process")
+async def batch_process_images(
+    files: List[UploadFile] = File(...),
+    request: str = Form(...)
+):
+    import json
+    async with dispatcher.slot("/api/image/batch-process"):
+        try:
+            # 解析请求
+            req_data = json.loads(request)
+            operations = req_data["operations"]
+            
+            # 保存上传的文件
+            file_paths = await dispatcher.run_io(save_upload_files, files)
+            
+            # 相同文件（含文件名）和参数的批次直接返回缓存的结果
+            cache_key, cached = await lookup_cache("/api/image/batch-process", file_paths, {
+                "files": [file.filename for file in files], "operations": operations
+            })
+            if cached is not None:
+                await dispatcher.run_io(remove_paths, file_paths)
+                return FileResponse(path=cached[0], filename="processed_images.zip", media_type="application/zip")
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, locals().get('file_paths', []) + [locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # 在进程池中按文件并行执行批量处理，每个文件完成后立即写入ZIP响应
+    results = dispatcher.imap_cpu(ImageProcessor.process_image, file_paths, operations, output_dir)
+    return zip_streaming_response(
+        "/api/image/batch-process", results, files, file_paths,
+        "processed_images.zip", file_paths + [output_dir], cache_key
+    )
+
+@app.post("/api/image/derivatives")
+async def generate_derivatives(
+    file: UploadFile = File(...),
+    sizes: Optional[str] = Form(None),
+    formats: Optional[str] = Form(None),
+    quality: int = Form(85),
+    resample_quality: str = Form("balanced")
+):
+    # 尺寸和格式以逗号分隔，如"2048,1024,512"和"jpg,webp"
+    try:
+        size_list = sorted({int(size) for size in sizes.split(",") if size.strip()} if sizes else set(DERIVATIVE_SIZES),
+                           reverse=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"缩略图尺寸必须是逗号分隔的整数: {sizes}")
+    if not size_list or size_list[-1] <= 0:
+        raise HTTPException(status_code=400, detail=f"缩略图尺寸必须大于0: {sizes}")
+    
+    async with dispatcher.slot("/api/image/derivatives"):
+        try:
+            format_list = list(dict.fromkeys(
+                file_format.strip().lower().strip('.') for file_format in formats.split(",") if file_format.strip()
+            )) if formats else None
+            
+            # 保存上传的文件
+            file_path = await dispatcher.run_io(save_upload_file, file)
+            
+            # 相同文件（含文件名）和参数的请求直接返回缓存的结果
+            cache_key, cached = await lookup_cache("/api/image/derivatives", [file_path], {
+                "filename": file.filename, "sizes": size_list, "formats": format_list,
+                "quality": quality, "resample_quality": resample_quality
+            })
+            if cached is not None:
+                await dispatcher.run_io(remove_paths, [file_path])
+                return FileResponse(path=cached[0], filename="derivatives.zip", media_type="application/zip")
+            
+            # 创建输出目录
+            output_dir = create_output_dir()
+            
+        except Exception as e:
+            # 清理临时文件
+            await dispatcher.run_io(remove_paths, [locals().get('file_path'), locals().get('output_dir')])
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    # 所有尺寸和格式由同一个工作进程从一次解码逐级生成，全部完成后写入同一个ZIP响应；
+    # 每个结果都对应上传的文件，ZIP中的文件名按上传时的文件名还原
+    # 超过原图像的尺寸合并为一个结果，实际的结果数可能少于count
+    count = len(size_list) * len(format_list or [None])
+    results = iter_derivative_results(file_path, size_list, format_list, quality, output_dir, resample_quality)
+    return zip_streaming_response(
+        "/api/image/derivatives", results, [file] * count, [file_path] * count,
+        "derivatives.zip", [file_path, output_dir], cache_key
+    )
+
+# 异步任务API
+@app.post("/api/jobs/word/batch-find-replace")
+async def submit_word_batch_find_replace(
+    files: List[UploadFile] = File(...),
+    request: str = Form(...)
+):
+    import json
     try:
-        # 保存上传的文件
-        file_path = save_upload_file(file)
-        
-        # 执行应用滤镜
-        result_path = ImageProcessor.apply_filter(file_path, filter_type, intensity)
-        
-        # 返回处理后的文件
-        return FileResponse(
-            path=result_path,
-            filename=f"{os.path.splitext(file.filename)[0]}_{filter_type}{os.path.splitext(file.filename)[1]}",
-            media_type="image/*"
+        # 解析请求
+        req_data = json.loads(request)
+        replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
+        use_regex = req_data.get("use_regex", False)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await submit_job(
+        "word/batch-find-replace", files,
+        lambda file_paths, output_dir: dispatcher.imap_cpu(
+            WordProcessor.apply_replacements, file_paths, replacements, use_regex, output_dir
         )
+    )
+
+@app.post("/api/jobs/excel/batch-find-replace")
+async def submit_excel_batch_find_replace(
+    files: List[UploadFile] = File(...),
+    request: str = Form(...)
+):
+    import json
+    try:
+        # 解析请求
+        req_data = json.loads(request)
+        replacements = [(item["find_text"], item["replace_text"]) for item in req_data["replacements"]]
+        sheet_range = req_data.get("sheet_range")
+        use_regex = req_data.get("use_regex", False)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await submit_job(
+        "excel/batch-find-replace", files,
+        lambda file_paths, output_dir: dispatcher.imap_cpu(
+            ExcelProcessor.apply_replacements, file_paths, replacements, sheet_range, use_regex, output_dir
+        )
+    )
 
-@app.post("/api/image/batch-process")
-async def batch_process_images(
+@app.post("/api/jobs/rename/batch")
+async def submit_batch_rename(
     files: List[UploadFile] = File(...),
     request: str = Form(...)
 ):
@@ -614,36 +1177,65 @@ async def batch_process_images(
         # 解析请求
         req_data = json.loads(request)
         operations = req_data["operations"]
-        
-        # 保存上传的文件
-        file_paths = [save_upload_file(file) for file in files]
-        
-        # 创建输出目录
-        output_dir = os.path.join(OUTPUT_DIR, str(uuid.uuid4()))
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 执行批量处理
-        result_paths = ImageProcessor.batch_process(file_paths, operations, output_dir)
-        
-        # 创建ZIP文件
-        zip_path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4()}_processed.zip")
-        shutil.make_archive(zip_path[:-4], 'zip', output_dir)
-        
-        # 返回ZIP文件
-        return FileResponse(
-            path=zip_path,
-            filename="processed_images.zip",
-            media_type="application/zip"
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await submit_job(
+        "rename/batch", files,
+        lambda file_paths, output_dir: iter_rename_results(
+            FileRenamer.batch_rename, file_paths, operations, output_dir
         )
+    )
+
+@app.post("/api/jobs/image/batch-process")
+async def submit_batch_process_images(
+    files: List[UploadFile] = File(...),
+    request: str = Form(...)
+):
+    import json
+    try:
+        # 解析请求
+        req_data = json.loads(request)
+        operations = req_data["operations"]
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # 清理临时文件
-        for file_path in locals().get('file_paths', []):
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        if 'output_dir' in locals() and os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await submit_job(
+        "image/batch-process", files,
+        lambda file_paths, output_dir: dispatcher.imap_cpu(
+            ImageProcessor.process_image, file_paths, operations, output_dir
+        )
+    )
+
+@app.get("/api/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """返回任务状态、逐文件进度和吞吐量"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job_manager.describe(job)
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """下载已完成任务的结果ZIP"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"任务尚未完成，当前状态: {job.status}")
+    
+    return FileResponse(
+        path=job.archive_path,
+        filename=f"{job.kind.replace('/', '_')}_{job.id}.zip",
+        media_type="application/zip"
+    )
+
+@app.delete("/api/jobs/{job_id}")
+def delete_job(job_id: str):
+    """取消任务并删除其结果"""
+    if not job_manager.delete(job_id):
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return {"job_id": job_id, "deleted": True}
 
 # 定期清理临时文件
 @app.on_event("startup")
@@ -659,6 +1251,39 @@ async def startup_event():
                     shutil.rmtree(item_path)
             except Exception as e:
                 print(f"清理临时文件时出错: {str(e)}")
+    
+    # 清理后重新创建上传和输出目录
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    
+    # 启动临时空间清理
+    app.state.janitor_task = asyncio.ensure_future(clean_temp_periodically())
+
+async def clean_temp_periodically():
+    """定期删除结果已过期的异步任务，并清理上传和输出目录中遗留的文件"""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL)
+        job_manager.purge_expired()
+        try:
+            await dispatcher.run_io(janitor.sweep)
+        except Exception as e:
+            print(f"清理临时文件时出错: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 停止临时空间清理
+    janitor_task = getattr(app.state, "janitor_task", None)
+    if janitor_task is not None:
+        janitor_task.cancel()
+    
+    # 关闭线程池和进程池
+    dispatcher.shutdown()
+
+# 挂载静态文件目录
+# 由于应用程序是从backend目录启动的，使用相对路径"../"指向项目根目录
+# 必须在所有API路由之后挂载，否则根路径会拦截/api请求
+app.mount("/", StaticFiles(directory="../", html=True), name="static")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import os
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Dispatcher:
+    """
+    统一的阻塞任务调度层
+
+    磁盘I/O交给有界线程池，CPU密集的文档/图像处理交给WorkerPool进程池，
+    每个路由通过信号量限制并发请求数，并统计排队和执行中的任务数量。
+    """
+
+    def __init__(self, worker_pool, io_workers=None, route_limits=None, default_limit=4):
+        """
+        Args:
+            worker_pool: 执行CPU任务的WorkerPool
+            io_workers: I/O线程池大小，为None时使用min(32, CPU核心数 + 4)
+            route_limits: 路由名称到最大并发请求数的映射
+            default_limit: 未在route_limits中配置的路由的最大并发请求数
+        """
+        self.worker_pool = worker_pool
+        self.io_workers = io_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.route_limits = dict(route_limits or {})
+        self.default_limit = default_limit
+        self._io_executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="batch-toolbox-io")
+        self._semaphores = {}
+        self._route_stats = {}
+        self._executor_stats = {
+            "io": {"workers": self.io_workers, "pending": 0, "completed": 0, "failed": 0},
+            "cpu": {"workers": worker_pool.max_workers, "pending": 0, "completed": 0, "failed": 0},
+        }
+
+    def _route(self, route):
+        if route not in self._semaphores:
+            limit = self.route_limits.get(route, self.default_limit)
+            # 信号量在事件循环中首次使用时创建
+            self._semaphores[route] = asyncio.Semaphore(limit)
+            self._route_stats[route] = {"limit": limit, "waiting": 0, "active": 0, "completed": 0, "failed": 0}
+        return self._semaphores[route], self._route_stats[route]
+
+    @asynccontextmanager
+    async def slot(self, route):
+        """
+        占用路由的一个并发名额，名额用尽时排队等待
+
+        Args:
+            route: 路由名称
+        """
+        semaphore, stats = self._route(route)
+        stats["waiting"] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+
+        stats["active"] += 1
+        try:
+            yield
+        except BaseException:
+            stats["failed"] += 1
+            raise
+        else:
+            stats["completed"] += 1
+        finally:
+            stats["active"] -= 1
+            semaphore.release()
+
+    async def _track(self, kind, future):
+        # pending为已提交但尚未完成的任务数，超过工作线程/进程数的部分即为排队深度
+        stats = self._executor_stats[kind]
+        stats["pending"] += 1
+        try:
+            result = await future
+        except BaseException:
+            stats["failed"] += 1
+            raise
+        else:
+            stats["completed"] += 1
+            return result
+        finally:
+            stats["pending"] -= 1
+
+    async def run_io(self, func, *args, **kwargs):
+        """在I/O线程池中执行阻塞函数（文件复制、打包、删除等）"""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._io_executor, functools.partial(func, *args, **kwargs))
+        return await self._track("io", future)
+
+    def submit_io(self, func, *args, **kwargs):
+        """
+        向I/O线程池提交任务但不等待结果，用于请求取消后仍需执行的清理工作
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return self._io_executor.submit(func, *args, **kwargs)
+
+    async def run_cpu(self, func, *args, **kwargs):
+        """
+        在进程池中执行CPU密集函数
+
+        Args:
+            func: 可被pickle的函数（模块级函数或类的静态方法）
+        """
+        return await self._track("cpu", self.worker_pool.submit(func, *args, **kwargs))
+
+    async def imap_cpu(self, func, items, *args, **kwargs):
+        """
+        在进程池中按文件并行执行，按输入顺序逐个产出结果，单个文件失败不会中断整个批次
+
+        Yields:
+            FileResult
+        """
+        stats = self._executor_stats["cpu"]
+        remaining = len(items)
+        stats["pending"] += remaining
+        try:
+            async for result in self.worker_pool.imap(func, items, *args, **kwargs):
+                remaining -= 1
+                stats["pending"] -= 1
+                stats["failed" if result.error else "completed"] += 1
+                yield result
+        finally:
+            stats["pending"] -= remaining
+
+    async def map_cpu(self, func, items, *args, **kwargs):
+        """
+        在进程池中按文件并行执行，结果顺序与items一致
+
+        Returns:
+            FileResult列表
+        """
+        return [result async for result in self.imap_cpu(func, items, *args, **kwargs)]
+
+    def metrics(self):
+        """返回各执行器和路由的队列深度与计数"""
+        executors = {}
+        for kind, stats in self._executor_stats.items():
+            executors[kind] = dict(stats, queue_depth=max(0, stats["pending"] - stats["workers"]))
+        return {
+            "executors": executors,
+            "routes": {route: dict(stats) for route, stats in self._route_stats.items()},
+        }
+
+    def shutdown(self):
+        """关闭线程池和进程池"""
+        self._io_executor.shutdown(wait=False)
+        self.worker_pool.shutdown()
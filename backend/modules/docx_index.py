@@ -0,0 +1,70 @@
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import PartFactory, XmlPart
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+_W_P = qn("w:p")
+
+# 正文之外包含文本的部件的关系类型
+STORY_RELTYPES = (RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES)
+
+
+def register_note_parts():
+    """
+    把脚注和尾注部件注册为XmlPart，必须在用python-docx打开文档之前调用
+
+    python-docx默认不解析脚注和尾注，注册后部件的element可以修改，保存文档时写回修改后的XML。
+    """
+    PartFactory.part_type_for.setdefault(CT.WML_FOOTNOTES, XmlPart)
+    PartFactory.part_type_for.setdefault(CT.WML_ENDNOTES, XmlPart)
+
+
+class _StoryParent:
+    """页眉、页脚、脚注等部件中段落的父对象，只提供段落和run需要的part"""
+
+    def __init__(self, part):
+        self.part = part
+
+
+class DocumentIndex:
+    """
+    Word文档的段落索引，供python-docx备用替换路径使用
+
+    一次性列出文档中每个包含文本的段落：正文（含嵌套表格和文本框）、页眉、页脚、脚注和尾注，
+    每个段落只出现一次。直接按XML中的<w:p>元素遍历，合并单元格不会像row.cells那样被重复访问；
+    多个节共用的页眉页脚部件也只访问一次。兼容性备用内容（mc:Fallback，如文本框的VML副本）中的
+    段落同样列出，替换后两份内容保持一致。
+    """
+
+    def __init__(self, doc):
+        """
+        Args:
+            doc: Document对象
+        """
+        self.doc = doc
+        self._paragraphs = []
+
+        self._add_story(doc.element.body, doc._body)
+        seen_parts = {doc.part}
+        for reltype in STORY_RELTYPES:
+            for rel in doc.part.rels.values():
+                if rel.is_external or rel.reltype != reltype:
+                    continue
+                part = rel.target_part
+                if part in seen_parts or not hasattr(part, "element"):
+                    continue
+                seen_parts.add(part)
+                self._add_story(part.element, _StoryParent(part))
+
+    def _add_story(self, root, parent):
+        self._paragraphs.extend(Paragraph(p, parent) for p in root.iter(_W_P))
+
+    def paragraphs(self):
+        """
+        按文档顺序返回段落
+
+        Returns:
+            Paragraph列表
+        """
+        return list(self._paragraphs)
@@ -0,0 +1,379 @@
+import io
+import re
+import copy
+
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import XmlPart
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.parts.numbering import NumberingPart
+
+from modules.docx_index import register_note_parts
+
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# VML图片（旧版文本框、水印等）使用的关系属性
+VML_RELID = "{urn:schemas-microsoft-com:office:office}relid"
+WP_DOC_PR = "{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}docPr"
+
+_W_SECT_PR = qn("w:sectPr")
+_W_VAL = qn("w:val")
+_W_ID = qn("w:id")
+_STYLE_REFS = frozenset(qn(tag) for tag in ("w:pStyle", "w:rStyle", "w:tblStyle"))
+_BOOKMARKS = frozenset(qn(tag) for tag in ("w:bookmarkStart", "w:bookmarkEnd"))
+_COMMENT_MARKS = frozenset(qn(tag) for tag in ("w:commentRangeStart", "w:commentRangeEnd", "w:commentReference"))
+# 脚注/尾注引用 -> (文本部分, 关系类型, 注释元素)
+_NOTE_REFS = {
+    qn("w:footnoteReference"): ("footnotes", RT.FOOTNOTES, qn("w:footnote")),
+    qn("w:endnoteReference"): ("endnotes", RT.ENDNOTES, qn("w:endnote")),
+}
+_NOTE_PARTS = {
+    "footnotes": ("/word/footnotes.xml", CT.WML_FOOTNOTES),
+    "endnotes": ("/word/endnotes.xml", CT.WML_ENDNOTES),
+}
+_PARTNAME_INDEX_RE = re.compile(r"(\d*)(\.\w+)$")
+
+_EMPTY_NUMBERING = (
+    '<w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'
+)
+
+
+def _related(part, reltype):
+    try:
+        return part.part_related_by(reltype)
+    except KeyError:
+        return None
+
+
+def _max_id(elements, attribute=_W_ID):
+    return max((int(value) for value in (el.get(attribute) for el in elements) if value and value.lstrip("-").isdigit()),
+               default=0)
+
+
+class DocxMerger:
+    """
+    按正文元素合并Word文档
+
+    以第一个文档为基础，后续文档的正文元素（段落、表格、内容控件等）整体移入合并后的文档，
+    不逐个重建段落和单元格，格式、图片、超链接、表格样式都会保留。每个文档保留自己的节属性
+    （纸张、页边距、页眉页脚），文档之间以分节符（下一页）分隔。
+
+    移入的元素中引用的关系（图片、超链接、页眉页脚、图表等）、编号定义、样式、脚注和尾注
+    都会导入并重新编号；图片按内容去重；批注标记会被去掉。
+    """
+
+    def merge(self, file_paths, output_path):
+        """
+        合并文档
+
+        Args:
+            file_paths: Word文档路径列表
+            output_path: 输出文件路径
+
+        Returns:
+            合并后的文件路径
+        """
+        if not file_paths:
+            raise ValueError("没有提供要合并的文档")
+
+        # 脚注和尾注部件的内容需要被修改并保存
+        register_note_parts()
+        self.doc = Document(file_paths[0])
+        self.part = self.doc.part
+        self.package = self.part.package
+        self._body = self.doc.element.body
+        self._partnames = {str(part.partname) for part in self.package.iter_parts()}
+
+        # 合并后的文档中必须唯一的编号，从基础文档中已有的最大值开始递增
+        self._next_doc_pr = _max_id(self._body.iter(WP_DOC_PR), "id") + 1
+        self._next_bookmark = _max_id(self._body.iter(*_BOOKMARKS)) + 1
+
+        self._styles = self.doc.styles.element
+        self._style_ids = {style.get(qn("w:styleId")) for style in self._styles.iterchildren(qn("w:style"))}
+        self._numbering = None
+        self._notes = {}
+
+        for file_path in file_paths[1:]:
+            self._append(Document(file_path))
+
+        self.doc.save(output_path)
+        return output_path
+
+    def _append(self, source):
+        """把一个文档的正文追加到合并文档末尾"""
+        # 每个源文档的导入缓存：源关系ID、编号、样式只导入一次
+        self._source = source
+        self._rel_map = {}
+        self._num_map = {}
+        self._abstract_map = {}
+        self._imported_parts = {}
+        self._bookmark_offset = self._next_bookmark
+
+        source_body = source.element.body
+        final_sect_pr = self._body.find(_W_SECT_PR)
+
+        # 前一个文档的节到此结束：把末尾的节属性复制到分节段落中
+        section_break = self._body.makeelement(qn("w:p"), {})
+        if final_sect_pr is not None:
+            p_pr = section_break.makeelement(qn("w:pPr"), {})
+            p_pr.append(copy.deepcopy(final_sect_pr))
+            section_break.append(p_pr)
+            final_sect_pr.addprevious(section_break)
+        else:
+            self._body.append(section_break)
+
+        # 源文档即将丢弃，直接移动元素而不复制
+        for element in list(source_body):
+            if element.tag == _W_SECT_PR:
+                continue
+            self._import_markup(element, source.part, self.part)
+            if final_sect_pr is not None:
+                final_sect_pr.addprevious(element)
+            else:
+                self._body.append(element)
+
+        # 源文档的节属性成为合并文档新的末尾节属性
+        source_sect_pr = source_body.find(_W_SECT_PR)
+        if source_sect_pr is not None:
+            self._import_markup(source_sect_pr, source.part, self.part)
+            if final_sect_pr is not None:
+                self._body.replace(final_sect_pr, source_sect_pr)
+            else:
+                self._body.append(source_sect_pr)
+
+    def _import_markup(self, root, source_part, target_part):
+        """
+        改写从source_part移入target_part的XML：关系ID、样式、编号、注释引用、绘图和书签编号
+
+        target_part为None时XML随部件整体导入，关系ID保持不变
+        """
+        comment_marks = []
+        for element in root.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+
+            for key, value in element.attrib.items() if target_part is not None else ():
+                if key.startswith(R_NS) or key == VML_RELID:
+                    element.set(key, self._rel_id(source_part, target_part, value))
+
+            if tag in _STYLE_REFS:
+                self._import_style(element.get(_W_VAL))
+            elif tag == qn("w:numId"):
+                element.set(_W_VAL, self._import_num(element.get(_W_VAL)))
+            elif tag in _NOTE_REFS:
+                element.set(_W_ID, self._import_note(tag, element.get(_W_ID)))
+            elif tag == WP_DOC_PR:
+                element.set("id", str(self._next_doc_pr))
+                self._next_doc_pr += 1
+            elif tag in _BOOKMARKS:
+                bookmark_id = self._bookmark_offset + int(element.get(_W_ID, "0"))
+                element.set(_W_ID, str(bookmark_id))
+                self._next_bookmark = max(self._next_bookmark, bookmark_id + 1)
+            elif tag in _COMMENT_MARKS:
+                comment_marks.append(element)
+
+        # 批注内容不随正文导入，去掉引用批注的标记
+        for element in comment_marks:
+            parent = element.getparent()
+            if element.tag == qn("w:commentReference") and parent.tag == qn("w:r") and len(parent) <= 2:
+                element = parent
+                parent = element.getparent()
+            if parent is not None:
+                parent.remove(element)
+
+    def _rel_id(self, source_part, target_part, rel_id):
+        """把source_part中的关系导入target_part，返回新的关系ID"""
+        key = (id(source_part), id(target_part), rel_id)
+        if key in self._rel_map:
+            return self._rel_map[key]
+
+        rel = source_part.rels.get(rel_id)
+        if rel is None:
+            new_id = rel_id
+        elif rel.is_external:
+            new_id = target_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        else:
+            new_id = target_part.relate_to(self._import_part(rel.target_part, rel.reltype), rel.reltype)
+        self._rel_map[key] = new_id
+        return new_id
+
+    def _import_part(self, part, reltype=None):
+        """
+        把源文档的部件及其引用的部件加入合并文档，部件名冲突时重新编号；图片按内容去重
+        """
+        if id(part) in self._imported_parts:
+            return self._imported_parts[id(part)]
+
+        if reltype == RT.IMAGE:
+            try:
+                image_part = self.package.get_or_add_image_part(io.BytesIO(part.blob))
+                self._partnames.add(str(image_part.partname))
+                self._imported_parts[id(part)] = image_part
+                return image_part
+            except Exception:
+                # python-docx无法识别的图片格式（如EMF）按普通部件导入
+                pass
+
+        self._imported_parts[id(part)] = part
+        partname = str(part.partname)
+        if partname in self._partnames:
+            template = _PARTNAME_INDEX_RE.sub(r"%d\2", partname)
+            index = 1
+            while template % index in self._partnames:
+                index += 1
+            partname = template % index
+            part.partname = PackURI(partname)
+        self._partnames.add(partname)
+        part._package = self.package
+
+        # 页眉页脚等部件中的样式、编号和绘图同样需要导入
+        if reltype in (RT.HEADER, RT.FOOTER) and hasattr(part, "element"):
+            self._import_markup(part.element, part, None)
+        for rel in list(part.rels.values()):
+            if not rel.is_external:
+                imported = self._import_part(rel.target_part, rel.reltype)
+                if imported is not rel.target_part:
+                    rel._target = imported
+        return part
+
+    def _import_style(self, style_id):
+        """合并文档中没有的样式从源文档复制，已有的样式以合并文档为准"""
+        if not style_id or style_id in self._style_ids:
+            return
+        self._style_ids.add(style_id)
+
+        source_styles = self._source.styles.element
+        style = next(
+            (el for el in source_styles.iterchildren(qn("w:style")) if el.get(qn("w:styleId")) == style_id),
+            None
+        )
+        if style is None:
+            return
+        style = copy.deepcopy(style)
+        self._styles.append(style)
+        for tag in ("w:basedOn", "w:next", "w:link"):
+            reference = style.find(qn(tag))
+            if reference is not None:
+                self._import_style(reference.get(_W_VAL))
+        for num_id in style.iter(qn("w:numId")):
+            num_id.set(_W_VAL, self._import_num(num_id.get(_W_VAL)))
+
+    def _numbering_root(self):
+        if self._numbering is None:
+            numbering_part = _related(self.part, RT.NUMBERING)
+            if numbering_part is None:
+                numbering_part = NumberingPart(
+                    PackURI("/word/numbering.xml"), CT.WML_NUMBERING, parse_xml(_EMPTY_NUMBERING), self.package
+                )
+                self.part.relate_to(numbering_part, RT.NUMBERING)
+                self._partnames.add("/word/numbering.xml")
+            root = numbering_part.element
+            self._numbering = {
+                "root": root,
+                "next_num": _max_id(root.iterchildren(qn("w:num")), qn("w:numId")) + 1,
+                "next_abstract": _max_id(root.iterchildren(qn("w:abstractNum")), qn("w:abstractNumId")) + 1,
+            }
+        return self._numbering
+
+    def _import_num(self, num_id):
+        """复制源文档的编号定义，返回合并文档中的新编号ID；0表示无编号，保持不变"""
+        if not num_id or num_id == "0":
+            return num_id
+        if num_id in self._num_map:
+            return self._num_map[num_id]
+
+        source_numbering = _related(self._source.part, RT.NUMBERING)
+        num = None
+        if source_numbering is not None:
+            num = next(
+                (el for el in source_numbering.element.iterchildren(qn("w:num")) if el.get(qn("w:numId")) == num_id),
+                None
+            )
+        if num is None:
+            self._num_map[num_id] = num_id
+            return num_id
+
+        numbering = self._numbering_root()
+        root = numbering["root"]
+        num = copy.deepcopy(num)
+        abstract_ref = num.find(qn("w:abstractNumId"))
+        if abstract_ref is not None:
+            abstract_ref.set(_W_VAL, self._import_abstract(source_numbering, abstract_ref.get(_W_VAL)))
+
+        new_id = str(numbering["next_num"])
+        numbering["next_num"] += 1
+        num.set(qn("w:numId"), new_id)
+        root.append(num)
+        self._num_map[num_id] = new_id
+        return new_id
+
+    def _import_abstract(self, source_numbering, abstract_id):
+        if abstract_id in self._abstract_map:
+            return self._abstract_map[abstract_id]
+
+        abstract = next(
+            (el for el in source_numbering.element.iterchildren(qn("w:abstractNum"))
+             if el.get(qn("w:abstractNumId")) == abstract_id),
+            None
+        )
+        if abstract is None:
+            return abstract_id
+
+        numbering = self._numbering_root()
+        root = numbering["root"]
+        abstract = copy.deepcopy(abstract)
+        new_id = str(numbering["next_abstract"])
+        numbering["next_abstract"] += 1
+        abstract.set(qn("w:abstractNumId"), new_id)
+        self._abstract_map[abstract_id] = new_id
+
+        # 架构要求abstractNum全部位于num之前
+        first_num = root.find(qn("w:num"))
+        if first_num is not None:
+            first_num.addprevious(abstract)
+        else:
+            root.append(abstract)
+        for style_ref in abstract.iter(qn("w:pStyle")):
+            self._import_style(style_ref.get(_W_VAL))
+        return new_id
+
+    def _notes_part(self, story, reltype, source_part):
+        """返回合并文档的脚注或尾注部件，没有时以源文档的部件为模板创建（只保留分隔符）"""
+        if story in self._notes:
+            return self._notes[story]
+
+        part = _related(self.part, reltype)
+        if part is None:
+            partname, content_type = _NOTE_PARTS[story]
+            root = copy.deepcopy(source_part.element)
+            for note in list(root):
+                if note.get(qn("w:type")) in (None, "normal"):
+                    root.remove(note)
+            part = XmlPart(PackURI(partname), content_type, root, self.package)
+            self.part.relate_to(part, reltype)
+            self._partnames.add(partname)
+        notes = {"part": part, "next_id": _max_id(part.element) + 1}
+        self._notes[story] = notes
+        return notes
+
+    def _import_note(self, tag, note_id):
+        """复制源文档中被引用的脚注或尾注，返回新的编号"""
+        story, reltype, note_tag = _NOTE_REFS[tag]
+        source_part = _related(self._source.part, reltype)
+        if source_part is None or not hasattr(source_part, "element"):
+            return note_id
+        note = next((el for el in source_part.element.iterchildren(note_tag) if el.get(_W_ID) == note_id), None)
+        if note is None:
+            return note_id
+
+        notes = self._notes_part(story, reltype, source_part)
+        note = copy.deepcopy(note)
+        new_id = str(notes["next_id"])
+        notes["next_id"] += 1
+        note.set(_W_ID, new_id)
+        self._import_markup(note, source_part, notes["part"])
+        notes["part"].element.append(note)
+        return new_id
@@ -0,0 +1,371 @@
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from modules.xlsx_stream import CHUNK_SIZE, _rels_of
+
+WORD_MAIN_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+_W_P = f"{{{WORD_MAIN_NS}}}p"
+_W_T = f"{{{WORD_MAIN_NS}}}t"
+_W_R = f"{{{WORD_MAIN_NS}}}r"
+_W_TBL = f"{{{WORD_MAIN_NS}}}tbl"
+_W_TR = f"{{{WORD_MAIN_NS}}}tr"
+_W_TC = f"{{{WORD_MAIN_NS}}}tc"
+_W_VAL = f"{{{WORD_MAIN_NS}}}val"
+_W_BODY = f"{{{WORD_MAIN_NS}}}body"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+# 提取文本时run中表示空白的元素
+_RUN_CHARS = {
+    f"{{{WORD_MAIN_NS}}}tab": "\t",
+    f"{{{WORD_MAIN_NS}}}ptab": "\t",
+    f"{{{WORD_MAIN_NS}}}br": "\n",
+    f"{{{WORD_MAIN_NS}}}cr": "\n",
+}
+# 段落中的制表符和换行把文本分成互不相连的几段，匹配不会跨越它们
+_BREAK_TAGS = frozenset(f"{{{WORD_MAIN_NS}}}{tag}" for tag in ("tab", "br", "cr", "ptab"))
+_TEXTBOX_PATH = f".//{{{WORD_MAIN_NS}}}txbxContent"
+# 除正文外需要处理的部件类型 -> 文本部分名称
+_TEXT_PART_TYPES = {"/header": "header", "/footer": "footer", "/footnotes": "footnotes", "/endnotes": "endnotes"}
+_XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_TAG_NAME_RE = re.compile(rb"<([^\s/>]+)")
+
+
+class UnsupportedDocument(Exception):
+    """文档结构不适合直接处理XML，调用方应改用python-docx"""
+
+
+def _text_groups(paragraph):
+    """
+    返回段落自身的文本节点，按制表符和换行分组；嵌套段落（如文本框）的文本不包含在内
+    """
+    groups = [[]]
+    if paragraph.find(_TEXTBOX_PATH) is None:
+        # 没有文本框时不会有嵌套段落，直接遍历所有后代节点
+        for element in paragraph.iter(_W_T, *_BREAK_TAGS):
+            if element.tag == _W_T:
+                groups[-1].append(element)
+            else:
+                groups.append([])
+        return groups
+
+    stack = [iter(paragraph)]
+    while stack:
+        for element in stack[-1]:
+            tag = element.tag
+            if tag == _W_T:
+                groups[-1].append(element)
+            elif tag in _BREAK_TAGS:
+                groups.append([])
+            elif tag != _W_P and len(element):
+                stack.append(iter(element))
+                break
+        else:
+            stack.pop()
+    return groups
+
+
+def _namespace_declarations(nsmap):
+    """命名空间映射在开始标签中的声明，如b' xmlns:w="..."'"""
+    return [
+        b' xmlns%s="%s"' % (b":" + prefix.encode("utf-8") if prefix else b"", escape(uri, {'"': "&quot;"}).encode("utf-8"))
+        for prefix, uri in nsmap.items()
+    ]
+
+
+def _strip_declarations(data, declarations):
+    """去掉data中第一个开始标签里的命名空间声明，这些声明已由外层元素给出"""
+    end = data.index(b">")
+    tag = data[:end]
+    for declaration in declarations:
+        tag = tag.replace(declaration, b"")
+    return tag + data[end:]
+
+
+def _start_tag(element, declarations=None):
+    """
+    元素的开始标签和结束标签，不含子元素；declarations不为None时去掉其中已由外层元素给出的命名空间声明
+    """
+    empty = etree.tostring(etree.Element(element.tag, dict(element.attrib), nsmap=element.nsmap))
+    if declarations is not None:
+        empty = _strip_declarations(empty, declarations)
+    return empty[:-2] + b">", b"</%s>" % _TAG_NAME_RE.match(empty).group(1)
+
+
+class DocxStream:
+    """
+    直接处理DOCX容器中的XML部件，不经过python-docx的对象模型
+
+    正文、页眉、页脚、脚注和尾注部件用lxml增量解析：替换时逐段落在<w:t>节点上完成，匹配可以跨越run，
+    每个顶层块（正文中的段落、表格，页眉页脚中的段落，脚注等）结束后立即写出并释放，内存占用取决于
+    最大的单个顶层块（如一个很大的表格）而不是部件大小；没有变化的部件和其他所有部件原样复制。
+    提取时按文档顺序流式产出段落和表格行。
+    """
+
+    def __init__(self, file_path, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            file_path: DOCX文件路径
+            chunk_size: 复制部件时每次读取的字节数
+        """
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._zin = zipfile.ZipFile(file_path)
+        try:
+            self._read_document()
+        except Exception:
+            self._zin.close()
+            raise
+
+    def close(self):
+        self._zin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_document(self):
+        names = set(self._zin.namelist())
+        package_rels = _rels_of(self._zin, "")
+        document_part = next(
+            (target for rel_type, target in package_rels.values() if rel_type.endswith("/officeDocument")),
+            None
+        )
+        if document_part is None or document_part not in names:
+            raise UnsupportedDocument("找不到文档正文部件")
+        self.document_part = document_part
+
+        # 包含文本的部件 -> 文本部分名称（"body"、"header"、"footer"、"footnotes"、"endnotes"），
+        # 按正文、页眉、页脚、脚注、尾注的顺序
+        parts = {}
+        for rel_type, target in _rels_of(self._zin, document_part).values():
+            story = _TEXT_PART_TYPES.get(rel_type[rel_type.rfind("/"):])
+            if story and target in names and target != document_part:
+                parts.setdefault(target, story)
+        story_order = list(_TEXT_PART_TYPES.values())
+        self.text_parts = {document_part: "body"}
+        self.text_parts.update(sorted(parts.items(), key=lambda item: story_order.index(item[1])))
+
+    def iter_content(self, stories=None):
+        """
+        按文档顺序流式提取段落和表格行，解析过的元素随即释放，内存占用与文档大小无关
+
+        表格行中合并单元格的内容只出现一次，被合并覆盖的位置为空字符串；
+        嵌套表格按开始的先后编号，其行在最外层表格的所有行之后产出。文本框的兼容性备用内容会被跳过。
+
+        Args:
+            stories: 只提取这些文本部分，None表示全部；依次为正文、页眉、页脚、脚注、尾注
+
+        Yields:
+            段落：{"story", "type": "paragraph", "style", "text"}
+            表格行：{"story", "type": "row", "table", "row", "cells"}
+        """
+        table_count = [0]  # 各部件连续编号表格
+        for part, story in self.text_parts.items():
+            if stories is not None and story not in stories:
+                continue
+            with self._zin.open(part) as stream:
+                yield from self._iter_part_content(stream, story, table_count)
+
+    def _iter_part_content(self, stream, story, table_count):
+        paragraphs = []  # 未结束的段落：(文本片段, 开始时所在的备用内容层数)
+        tables = []  # 未结束的表格：[编号, 已产出的行数]
+        rows = []  # 未结束的行的单元格文本
+        cells = []  # 未结束的单元格中的段落文本
+        nested_rows = []  # 嵌套表格的行，最外层表格结束后产出
+        fallback = 0
+
+        context = etree.iterparse(stream, events=("start", "end"), huge_tree=True)
+        for event, element in context:
+            tag = element.tag
+            if event == "start":
+                if tag == _W_P:
+                    paragraphs.append(([], fallback))
+                elif tag == _W_TBL:
+                    table_count[0] += 1
+                    tables.append([table_count[0], 0])
+                elif tag == _W_TR:
+                    rows.append([])
+                elif tag == _W_TC:
+                    cells.append([])
+                elif tag == _MC_FALLBACK:
+                    fallback += 1
+                continue
+
+            if tag == _W_T or tag in _RUN_CHARS:
+                # 只统计run中的文本；不在同一层备用内容中的文本是兼容性副本
+                if paragraphs and paragraphs[-1][1] == fallback and element.getparent().tag == _W_R:
+                    paragraphs[-1][0].append((element.text or "") if tag == _W_T else _RUN_CHARS[tag])
+            elif tag == _W_P:
+                parts, depth = paragraphs.pop()
+                if depth == 0:
+                    style_element = element.find(f"{{{WORD_MAIN_NS}}}pPr/{{{WORD_MAIN_NS}}}pStyle")
+                    style = style_element.get(_W_VAL) if style_element is not None else None
+                    text = "".join(parts)
+                    if cells and element.getparent().tag == _W_TC:
+                        cells[-1].append(text)
+                    elif text.strip():
+                        yield {"story": story, "type": "paragraph", "style": style, "text": text}
+            elif tag == _W_TC:
+                text = "\n".join(cells.pop())
+                tc_pr = element.find(f"{{{WORD_MAIN_NS}}}tcPr")
+                span = 1
+                if tc_pr is not None:
+                    grid_span = tc_pr.find(f"{{{WORD_MAIN_NS}}}gridSpan")
+                    if grid_span is not None:
+                        span = int(grid_span.get(_W_VAL, 1))
+                    v_merge = tc_pr.find(f"{{{WORD_MAIN_NS}}}vMerge")
+                    # 纵向合并的后续单元格
+                    if v_merge is not None and v_merge.get(_W_VAL, "continue") == "continue":
+                        text = ""
+                if rows:
+                    rows[-1].extend([text] + [""] * (span - 1))
+            elif tag == _W_TR:
+                row = rows.pop()
+                tr_pr = element.find(f"{{{WORD_MAIN_NS}}}trPr")
+                grid_before = tr_pr.find(f"{{{WORD_MAIN_NS}}}gridBefore") if tr_pr is not None else None
+                if grid_before is not None:
+                    row = [""] * int(grid_before.get(_W_VAL, 0)) + row
+                if tables:
+                    table = tables[-1]
+                    item = {"story": story, "type": "row", "table": table[0], "row": table[1], "cells": row}
+                    table[1] += 1
+                    if len(tables) > 1:
+                        nested_rows.append(item)
+                    else:
+                        yield item
+            elif tag == _W_TBL:
+                tables.pop()
+                if not tables and nested_rows:
+                    # 嵌套表格按编号排列，同一表格的行保持原有顺序
+                    nested_rows.sort(key=lambda item: item["table"])
+                    yield from nested_rows
+                    nested_rows = []
+            elif tag == _MC_FALLBACK:
+                fallback -= 1
+
+            # 释放已经处理完的顶层段落和表格
+            if tag in (_W_P, _W_TBL) and not paragraphs and not tables:
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    def replace(self, output_path, replacer):
+        """
+        对文档应用替换规则并写入输出文件
+
+        Args:
+            output_path: 输出文件路径，可以与源文件相同
+            replacer: 编译后的TextReplacer
+
+        Returns:
+            发生变化的段落数
+        """
+        changed = 0
+
+        temp_path = output_path + ".tmp"
+        try:
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+                for info in self._zin.infolist():
+                    if not replacer or info.filename not in self.text_parts:
+                        self._copy_entry(info, zout)
+                        continue
+                    with tempfile.SpooledTemporaryFile(self.chunk_size * 16) as spool:
+                        part_changed = self._replace_part(info, replacer, spool)
+                        changed += part_changed
+                        if not part_changed:
+                            # 没有变化的部件原样复制，不重新序列化
+                            self._copy_entry(info, zout)
+                            continue
+                        spool.seek(0)
+                        with zout.open(self._entry_info(info), "w", force_zip64=True) as dest:
+                            shutil.copyfileobj(spool, dest, self.chunk_size)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return changed
+
+    def _replace_part(self, info, replacer, output):
+        """
+        在一个部件中替换文本，新的部件内容写入output
+
+        根元素和正文<w:body>的子元素是顶层块：每个顶层块结束时替换其中全部段落的文本，序列化后写出，
+        再从树中删除，已经写出的内容不再占用内存。
+
+        Returns:
+            发生变化的段落数
+        """
+        changed = 0
+        root = None
+        containers = []  # 未结束的根元素和<w:body>：(元素, 结束标签)
+        declarations = None
+        with self._zin.open(info) as stream:
+            for event, element in etree.iterparse(stream, events=("start", "end"), huge_tree=True):
+                if event == "start":
+                    if root is None:
+                        root = element
+                        declarations = _namespace_declarations(root.nsmap)
+                        start, end = _start_tag(root)
+                        output.write(_XML_DECLARATION + start)
+                        containers.append((root, end))
+                    elif element.tag == _W_BODY and element.getparent() is root:
+                        start, end = _start_tag(element, declarations)
+                        output.write(start)
+                        containers.append((element, end))
+                    continue
+
+                if containers and element is containers[-1][0]:
+                    output.write(containers.pop()[1])
+                    continue
+                parent = element.getparent()
+                if not containers or parent is not containers[-1][0]:
+                    continue
+
+                # 嵌套段落（如文本框）的文本不属于外层段落，各段落分别处理
+                for paragraph in element.iter(_W_P):
+                    if self._replace_paragraph(paragraph, replacer):
+                        changed += 1
+                output.write(_strip_declarations(etree.tostring(element, encoding="UTF-8"), declarations))
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+        return changed
+
+    @staticmethod
+    def _replace_paragraph(paragraph, replacer):
+        """替换段落自身的文本，返回段落是否发生变化"""
+        paragraph_changed = False
+        for group in _text_groups(paragraph):
+            if not group:
+                continue
+            texts = [node.text or "" for node in group]
+            new_texts = replacer.replace_segments(texts)
+            if new_texts is None:
+                continue
+            for node, text, new_text in zip(group, texts, new_texts):
+                if new_text != text:
+                    node.text = new_text
+                    if new_text != new_text.strip():
+                        node.set(XML_SPACE, "preserve")
+                    paragraph_changed = True
+        return paragraph_changed
+
+    def _entry_info(self, info):
+        zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+        zinfo.compress_type = info.compress_type
+        zinfo.external_attr = info.external_attr
+        return zinfo
+
+    def _copy_entry(self, info, zout):
+        with self._zin.open(info) as src, zout.open(self._entry_info(info), "w",
+                                                    force_zip64=info.file_size * 2 > zipfile.ZIP64_LIMIT) as dest:
+            shutil.copyfileobj(src, dest, self.chunk_size)
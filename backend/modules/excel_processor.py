@@ -1,12 +1,28 @@
 import os
-import re
+import time
+import pickle
+import hashlib
+import numbers
+import itertools
+import zipfile
+import tempfile
+import tracemalloc
 import openpyxl
 import pandas as pd
-from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from modules.text_replacer import TextReplacer
+from modules.xlsx_stream import XlsxStream, UnsupportedWorkbook
+from modules.xlsx_merger import XlsxMerger
+
+# 按行合并时每次序列化到临时文件的行数
+SPOOL_BATCH_ROWS = 10000
 
 class ExcelProcessor:
     @staticmethod
-    def find_replace(file_path, find_text, replace_text, sheet_range=None, use_regex=False, output_dir=None):
+    def find_replace(file_path, find_text, replace_text, sheet_range=None, use_regex=False, output_dir=None,
+                     engine="stream"):
         """
         在Excel文件中查找并替换文本
         
@@ -17,72 +33,21 @@ class ExcelProcessor:
             sheet_range: 工作表范围，格式为"Sheet1!A1:C10"，如果为None则处理所有工作表
             use_regex: 是否使用正则表达式
             output_dir: 输出目录，如果为None则覆盖原文件
+            engine: 处理引擎，"stream"直接流式改写XLSX中的XML，"openpyxl"加载完整工作簿
             
         Returns:
             处理后的文件路径
         """
         try:
-            # 创建输出文件路径
-            if output_dir:
-                output_path = os.path.join(output_dir, os.path.basename(file_path))
-            else:
-                output_path = file_path
-                
-            # 如果输出路径与输入路径不同，先复制文件
-            if output_path != file_path:
-                wb = openpyxl.load_workbook(file_path)
-                wb.save(output_path)
-            else:
-                wb = openpyxl.load_workbook(file_path)
-            
-            # 解析工作表范围
-            if sheet_range:
-                parts = sheet_range.split('!')
-                sheet_name = parts[0]
-                cell_range = parts[1] if len(parts) > 1 else None
-                
-                if sheet_name not in wb.sheetnames:
-                    raise ValueError(f"工作表 '{sheet_name}' 不存在")
-                
-                sheets = [wb[sheet_name]]
-            else:
-                sheets = wb.worksheets
-                cell_range = None
-            
-            # 处理每个工作表
-            for sheet in sheets:
-                # 如果指定了单元格范围
-                if cell_range:
-                    cells = sheet[cell_range]
-                    # 如果是单个单元格
-                    if not isinstance(cells, tuple):
-                        cells = [[cells]]
-                    
-                    for row in cells:
-                        for cell in row:
-                            if cell.value and isinstance(cell.value, str):
-                                if use_regex:
-                                    cell.value = re.sub(find_text, replace_text, cell.value)
-                                else:
-                                    cell.value = cell.value.replace(find_text, replace_text)
-                else:
-                    # 处理整个工作表
-                    for row in sheet.iter_rows():
-                        for cell in row:
-                            if cell.value and isinstance(cell.value, str):
-                                if use_regex:
-                                    cell.value = re.sub(find_text, replace_text, cell.value)
-                                else:
-                                    cell.value = cell.value.replace(find_text, replace_text)
-            
-            # 保存工作簿
-            wb.save(output_path)
-            return output_path
+            return ExcelProcessor.apply_replacements(
+                file_path, [(find_text, replace_text)], sheet_range, use_regex, output_dir, engine
+            )
         except Exception as e:
             raise Exception(f"处理Excel文件时出错: {str(e)}")
     
     @staticmethod
-    def batch_find_replace(file_paths, replacements, sheet_range=None, use_regex=False, output_dir=None):
+    def batch_find_replace(file_paths, replacements, sheet_range=None, use_regex=False, output_dir=None,
+                           engine="stream"):
         """
         批量处理多个Excel文件的查找替换
         
@@ -92,144 +57,355 @@ class ExcelProcessor:
             sheet_range: 工作表范围，格式为"Sheet1!A1:C10"，如果为None则处理所有工作表
             use_regex: 是否使用正则表达式
             output_dir: 输出目录
+            engine: 处理引擎，"stream"或"openpyxl"
             
         Returns:
             处理后的文件路径列表
         """
-        processed_files = []
+        return [
+            ExcelProcessor.apply_replacements(file_path, replacements, sheet_range, use_regex, output_dir, engine)
+            for file_path in file_paths
+        ]
+    
+    @staticmethod
+    def apply_replacements(file_path, replacements, sheet_range=None, use_regex=False, output_dir=None,
+                           engine="stream"):
+        """
+        对单个Excel文件应用全部替换规则，供批量处理和进程池按文件调用
         
-        for file_path in file_paths:
-            # 创建输出文件路径
-            if output_dir:
-                output_path = os.path.join(output_dir, os.path.basename(file_path))
-            else:
-                output_path = file_path
-                
-            # 如果输出路径与输入路径不同，先复制文件
-            if output_path != file_path:
-                wb = openpyxl.load_workbook(file_path)
-                wb.save(output_path)
-            else:
-                wb = openpyxl.load_workbook(file_path)
+        Args:
+            file_path: Excel文件路径
+            replacements: 替换规则列表，每个规则是一个(find_text, replace_text)元组
+            sheet_range: 工作表范围，格式为"Sheet1!A1:C10"，如果为None则处理所有工作表
+            use_regex: 是否使用正则表达式
+            output_dir: 输出目录，如果为None则覆盖原文件
+            engine: 处理引擎，"stream"直接流式改写XLSX中的XML，内存占用与行数无关，
+                    不支持的文件自动改用openpyxl；"openpyxl"加载完整工作簿
             
-            # 解析工作表范围
-            if sheet_range:
-                parts = sheet_range.split('!')
-                sheet_name = parts[0]
-                cell_range = parts[1] if len(parts) > 1 else None
-                
-                if sheet_name not in wb.sheetnames:
-                    raise ValueError(f"工作表 '{sheet_name}' 不存在")
-                
-                sheets = [wb[sheet_name]]
+        Returns:
+            处理后的文件路径
+        """
+        # 创建输出文件路径
+        if output_dir:
+            output_path = os.path.join(output_dir, os.path.basename(file_path))
+        else:
+            output_path = file_path
+        
+        # 所有规则编译为一个替换引擎，每个单元格只访问一次
+        replacer = TextReplacer.compile(replacements, use_regex)
+        
+        if engine == "stream":
+            try:
+                ExcelProcessor._apply_streaming(file_path, output_path, replacer, sheet_range)
+                return output_path
+            except (UnsupportedWorkbook, zipfile.BadZipFile):
+                pass
+        elif engine != "openpyxl":
+            raise ValueError(f"不支持的处理引擎: {engine}")
+        
+        ExcelProcessor._apply_with_openpyxl(file_path, output_path, replacer, sheet_range)
+        return output_path
+    
+    @staticmethod
+    def _apply_streaming(file_path, output_path, replacer, sheet_range=None):
+        """流式改写XLSX中的文本单元格"""
+        sheet_name, cell_range = None, None
+        if sheet_range:
+            parts = sheet_range.split('!')
+            sheet_name = parts[0]
+            cell_range = parts[1] if len(parts) > 1 else None
+        
+        with XlsxStream(file_path) as stream:
+            stream.replace(output_path, replacer, sheet_name, cell_range)
+    
+    @staticmethod
+    def _apply_with_openpyxl(file_path, output_path, replacer, sheet_range=None):
+        """加载完整工作簿后替换文本单元格"""
+        wb = openpyxl.load_workbook(file_path)
+        
+        # 解析工作表范围
+        if sheet_range:
+            parts = sheet_range.split('!')
+            sheet_name = parts[0]
+            cell_range = parts[1] if len(parts) > 1 else None
+            
+            if sheet_name not in wb.sheetnames:
+                raise ValueError(f"工作表 '{sheet_name}' 不存在")
+            
+            sheets = [wb[sheet_name]]
+        else:
+            sheets = wb.worksheets
+            cell_range = None
+        
+        # 处理每个工作表
+        for sheet in sheets:
+            # 如果指定了单元格范围
+            if cell_range:
+                cells = sheet[cell_range]
+                # 如果是单个单元格
+                if not isinstance(cells, tuple):
+                    cells = [[cells]]
+                # 如果是单行或单列
+                elif cells and not isinstance(cells[0], tuple):
+                    cells = [cells]
+                rows = cells
             else:
-                sheets = wb.worksheets
-                cell_range = None
-            
-            # 应用所有替换规则
-            for find_text, replace_text in replacements:
-                # 处理每个工作表
-                for sheet in sheets:
-                    # 如果指定了单元格范围
-                    if cell_range:
-                        cells = sheet[cell_range]
-                        # 如果是单个单元格
-                        if not isinstance(cells, tuple):
-                            cells = [[cells]]
-                        
-                        for row in cells:
-                            for cell in row:
-                                if cell.value and isinstance(cell.value, str):
-                                    if use_regex:
-                                        cell.value = re.sub(find_text, replace_text, cell.value)
-                                    else:
-                                        cell.value = cell.value.replace(find_text, replace_text)
-                    else:
-                        # 处理整个工作表
-                        for row in sheet.iter_rows():
-                            for cell in row:
-                                if cell.value and isinstance(cell.value, str):
-                                    if use_regex:
-                                        cell.value = re.sub(find_text, replace_text, cell.value)
-                                    else:
-                                        cell.value = cell.value.replace(find_text, replace_text)
-            
-            # 保存工作簿
-            wb.save(output_path)
-            processed_files.append(output_path)
+                # 处理整个工作表
+                rows = sheet.iter_rows()
+            
+            for row in rows:
+                for cell in row:
+                    # 与流式引擎一致，公式单元格保持不变
+                    if cell.value and isinstance(cell.value, str) and cell.data_type != 'f':
+                        new_value = replacer.apply(cell.value)
+                        if new_value != cell.value:
+                            cell.value = new_value
         
-        return processed_files
+        # 保存工作簿
+        wb.save(output_path)
     
     @staticmethod
-    def merge_excel_files(file_paths, merge_type="rows", output_path=None, remove_duplicates=False):
+    def merge_excel_files(file_paths, merge_type="rows", output_path=None, remove_duplicates=False,
+                          return_stats=False, trace_memory=False, file_names=None):
         """
         合并多个Excel文件
         
+        按行或按列合并时每个工作簿只解析一次，数据逐行追加写入输出文件，
+        内存占用取决于最大的单个工作表而不是文件总数。
+        
         Args:
             file_paths: Excel文件路径列表
             merge_type: 合并类型，可以是"rows"（按行合并）、"columns"（按列合并）或"sheets"（按工作表合并）
             output_path: 输出文件路径
             remove_duplicates: 是否删除重复项
+            return_stats: 是否同时返回合并统计（工作表数、行数、删除的重复行数和耗时）
+            trace_memory: 是否用tracemalloc统计本次合并的峰值内存（统计项peak_memory_mb），
+                          跟踪每次内存分配会明显拖慢合并，只用于调试
+            file_names: 与file_paths对应的用户上传时的文件名，按工作表合并时用作工作表名称的前缀，
+                        为None时使用file_paths中的文件名
             
         Returns:
-            合并后的文件路径
+            合并后的文件路径；return_stats为True时返回(文件路径, 统计字典)
         """
+        tracing = False
         try:
             if not file_paths:
                 raise ValueError("没有提供要合并的文件")
             
+            started = time.time()
+            stats = {"sheets": 0, "rows": 0, "duplicates_removed": 0}
+            # 进程池中的工作进程会被复用，进程的峰值内存可能来自之前的任务，
+            # 因此用tracemalloc只统计本次合并中Python和numpy分配的内存
+            tracing = return_stats and trace_memory and not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start()
+            
             if merge_type == "sheets":
                 # 按工作表合并（将每个文件作为新的工作表添加到一个工作簿中）
-                wb = openpyxl.Workbook()
-                # 删除默认创建的工作表
-                wb.remove(wb.active)
-                
-                for file_path in file_paths:
-                    source_wb = openpyxl.load_workbook(file_path)
-                    file_name = os.path.basename(file_path)
-                    
-                    for sheet_name in source_wb.sheetnames:
-                        source_sheet = source_wb[sheet_name]
-                        # 创建新的工作表名称（文件名+工作表名）
-                        new_sheet_name = f"{file_name}_{sheet_name}"
-                        # 如果名称太长，截断它
-                        if len(new_sheet_name) > 31:  # Excel工作表名称最大长度为31
-                            new_sheet_name = new_sheet_name[:31]
-                        
-                        # 创建新工作表
-                        new_sheet = wb.create_sheet(title=new_sheet_name)
-                        
-                        # 复制单元格内容
-                        for row in source_sheet.iter_rows():
-                            for cell in row:
-                                new_sheet[cell.coordinate].value = cell.value
-                
-                wb.save(output_path)
+                sources = list(zip(file_paths, file_names or [os.path.basename(file_path) for file_path in file_paths]))
+                try:
+                    stats["sheets"] = XlsxMerger().merge(sources, output_path)
+                except (UnsupportedWorkbook, zipfile.BadZipFile):
+                    stats["sheets"] = ExcelProcessor._merge_sheets_with_openpyxl(sources, output_path)
+            elif merge_type == "rows":
+                # 按行合并（垂直堆叠）
+                ExcelProcessor._merge_rows(file_paths, output_path, remove_duplicates, stats)
+            else:  # merge_type == "columns"
+                # 按列合并（水平堆叠）
+                ExcelProcessor._merge_columns(file_paths, output_path, remove_duplicates, stats)
+            
+            if not return_stats:
                 return output_path
-            else:
-                # 按行或列合并（使用pandas）
-                dfs = []
-                
-                for file_path in file_paths:
-                    # 读取所有工作表
-                    excel_file = pd.ExcelFile(file_path)
-                    for sheet_name in excel_file.sheet_names:
-                        df = pd.read_excel(file_path, sheet_name=sheet_name)
-                        dfs.append(df)
-                
-                if merge_type == "rows":
-                    # 按行合并（垂直堆叠）
-                    merged_df = pd.concat(dfs, ignore_index=True)
-                else:  # merge_type == "columns"
-                    # 按列合并（水平堆叠）
-                    merged_df = pd.concat(dfs, axis=1)
+            
+            stats["seconds"] = round(time.time() - started, 3)
+            if tracing:
+                stats["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            return output_path, stats
+        except Exception as e:
+            raise Exception(f"合并Excel文件时出错: {str(e)}")
+        finally:
+            if tracing:
+                tracemalloc.stop()
+    
+    @staticmethod
+    def _merge_sheets_with_openpyxl(sources, output_path):
+        """
+        按工作表合并的备用实现：逐个单元格复制值，用于容器层合并无法处理的工作簿
+        """
+        wb = openpyxl.Workbook()
+        # 删除默认创建的工作表
+        wb.remove(wb.active)
+        
+        for file_path, file_name in sources:
+            source_wb = openpyxl.load_workbook(file_path)
+            
+            for sheet_name in source_wb.sheetnames:
+                source_sheet = source_wb[sheet_name]
+                # 创建新的工作表名称（文件名+工作表名）
+                new_sheet_name = f"{file_name}_{sheet_name}"
+                # 如果名称太长，截断它
+                if len(new_sheet_name) > 31:  # Excel工作表名称最大长度为31
+                    new_sheet_name = new_sheet_name[:31]
                 
-                # 删除重复项（如果需要）
-                if remove_duplicates:
-                    merged_df = merged_df.drop_duplicates()
+                # 创建新工作表
+                new_sheet = wb.create_sheet(title=new_sheet_name)
                 
-                # 保存到Excel文件
-                merged_df.to_excel(output_path, index=False)
-                return output_path
-        except Exception as e:
-            raise Exception(f"合并Excel文件时出错: {str(e)}")
\ No newline at end of file
+                # 复制单元格内容
+                for row in source_sheet.iter_rows():
+                    for cell in row:
+                        new_sheet[cell.coordinate].value = cell.value
+        
+        wb.save(output_path)
+        return len(wb.sheetnames)
+    
+    @staticmethod
+    def _merge_rows(file_paths, output_path, remove_duplicates, stats):
+        """
+        按行合并：每个工作表只解析一次，输出列按首次出现的顺序追加（与pd.concat的列顺序一致）
+        
+        完整的表头要到最后一个工作表解析完才能确定，而只写模式的工作簿必须先写表头，
+        因此对齐到当时已知列的行先序列化到输出目录的临时文件中，最后写出表头后再逐行读回写入。
+        """
+        columns = []
+        seen_columns = set()
+        with tempfile.TemporaryFile(dir=os.path.dirname(output_path) or None, suffix=".rows") as spool:
+            for file_path in file_paths:
+                with pd.ExcelFile(file_path) as excel_file:
+                    for sheet_name in excel_file.sheet_names:
+                        # 数据行比表头宽时，pandas为多出的列生成"Unnamed: n"列名
+                        df = excel_file.parse(sheet_name)
+                        for column in df.columns:
+                            if column not in seen_columns:
+                                seen_columns.add(column)
+                                columns.append(column)
+                        df = df.reindex(columns=columns)
+                        stats["sheets"] += 1
+                        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+                        while True:
+                            batch = list(itertools.islice(rows, SPOOL_BATCH_ROWS))
+                            if not batch:
+                                break
+                            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+                        del df, rows
+            
+            spool_size = spool.tell()
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet("Sheet1")
+            ws.append(ExcelProcessor._header_cells(ws, columns))
+            digests = set() if remove_duplicates else None
+            
+            spool.seek(0)
+            while spool.tell() < spool_size:
+                for row in pickle.load(spool):
+                    # 之后的工作表新增的列在前面的行中为空
+                    ExcelProcessor._append_row(ws, row + (None,) * (len(columns) - len(row)), digests, stats)
+            
+            wb.save(output_path)
+    
+    @staticmethod
+    def _merge_columns(file_paths, output_path, remove_duplicates, stats):
+        """
+        按列合并：同时以只读模式打开所有工作表并逐行并排读取，第n行由各工作表的第n行拼接而成
+        """
+        workbooks = []
+        try:
+            sources = []
+            for file_path in file_paths:
+                source_wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+                workbooks.append(source_wb)
+                for sheet in source_wb.worksheets:
+                    rows = sheet.iter_rows(values_only=True)
+                    header = list(next(rows, ()))
+                    width = max(ExcelProcessor._trimmed_length(header), sheet.max_column or 0)
+                    sources.append((rows, width, ExcelProcessor._mangle_header(header, width)))
+            stats["sheets"] = len(sources)
+            
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet("Sheet1")
+            ws.append(ExcelProcessor._header_cells(ws, [name for _, _, header in sources for name in header]))
+            digests = set() if remove_duplicates else None
+            
+            # 末尾的空行与pandas一样不输出，中间的空行保留
+            pending_blank = 0
+            while True:
+                merged = []
+                exhausted = True
+                for rows, width, _ in sources:
+                    row = next(rows, None)
+                    if row is None:
+                        merged.extend([None] * width)
+                    else:
+                        exhausted = False
+                        merged.extend((list(row) + [None] * width)[:width])
+                if exhausted:
+                    break
+                if all(value is None for value in merged):
+                    pending_blank += 1
+                    continue
+                for _ in range(pending_blank):
+                    ExcelProcessor._append_row(ws, [None] * len(merged), digests, stats)
+                pending_blank = 0
+                ExcelProcessor._append_row(ws, merged, digests, stats)
+            
+            wb.save(output_path)
+        finally:
+            for source_wb in workbooks:
+                source_wb.close()
+    
+    @staticmethod
+    def _append_row(ws, row, digests, stats):
+        """写入一行，digests不为None时跳过已经写入过的重复行"""
+        if digests is not None:
+            digest = ExcelProcessor._row_digest(row)
+            if digest in digests:
+                stats["duplicates_removed"] += 1
+                return
+            digests.add(digest)
+        ws.append(row)
+        stats["rows"] += 1
+    
+    @staticmethod
+    def _row_digest(row):
+        """计算行的摘要，数值统一按浮点数比较（与drop_duplicates中1和1.0相等一致）"""
+        normalized = tuple(
+            float(value) if isinstance(value, numbers.Number) and not isinstance(value, bool) else value
+            for value in row
+        )
+        return hashlib.blake2b(repr(normalized).encode("utf-8"), digest_size=16).digest()
+    
+    @staticmethod
+    def _trimmed_length(values):
+        length = len(values)
+        while length and values[length - 1] is None:
+            length -= 1
+        return length
+    
+    @staticmethod
+    def _mangle_header(header, width):
+        """按pandas的规则生成列名：空列名为"Unnamed: n"，重复列名追加".1"、".2"等后缀"""
+        names = []
+        counts = {}
+        for index in range(width):
+            name = header[index] if index < len(header) else None
+            if name is None:
+                name = f"Unnamed: {index}"
+            base = name
+            while name in counts:
+                counts[base] += 1
+                name = f"{base}.{counts[base]}"
+            counts.setdefault(name, 0)
+            names.append(name)
+        return names
+    
+    @staticmethod
+    def _header_cells(ws, columns):
+        """生成与DataFrame.to_excel相同样式的表头单元格（加粗、细边框、居中）"""
+        side = Side(style="thin")
+        cells = []
+        for column in columns:
+            cell = WriteOnlyCell(ws, value=column)
+            cell.font = Font(bold=True)
+            cell.border = Border(left=side, right=side, top=side, bottom=side)
+            cell.alignment = Alignment(horizontal="center", vertical="top")
+            cells.append(cell)
+        return cells
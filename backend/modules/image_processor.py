@@ -1,7 +1,175 @@
 import os
 import io
+import math
+import hashlib
+import functools
+import threading
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter
 
+from modules.image_strips import StripImage, StripReader
+from modules.image_filters import POINT_FILTERS, SHARPEN_AMOUNTS, point_lut, color_histogram, apply_lut, sharpen
+
+# 缩放质量档位：(最终重采样滤镜, reducing_gap)
+# reducing_gap为None时从原始分辨率直接重采样；否则JPEG先按DCT缩放解码（draft），
+# 再用reduce()整数倍缩小到目标尺寸的reducing_gap倍以内，最后重采样到目标尺寸
+RESAMPLE_QUALITY = {
+    "high": (Image.LANCZOS, None),
+    "balanced": (Image.LANCZOS, 2.0),
+    "fast": (Image.BILINEAR, 1.0),
+}
+
+# 默认生成的缩略图尺寸（最长边的像素数）
+DERIVATIVE_SIZES = (2048, 1024, 512, 256, 128)
+
+# 每个工作进程缓存的水印图块数量；批量添加同一水印时只在第一张图像上渲染
+WATERMARK_CACHE_SIZE = 64
+
+# 添加水印时保持不变的图像模式，其他模式先转换为RGB（带透明度的调色板图像转换为RGBA）
+WATERMARK_MODES = ('RGB', 'RGBA', 'L', 'LA')
+
+# 能按条带解码的图像（未压缩的TIFF、BMP、PPM等）允许打开的最大像素数，用于2万×2万的扫描地图；
+# 其他图像需要整体解码，仍使用Pillow的默认限制（Image.MAX_IMAGE_PIXELS的2倍，约1.8亿像素）
+MAX_STREAMED_PIXELS = 1024 * 1024 * 1024
+# 打开超出默认限制的图像时临时放宽Image.MAX_IMAGE_PIXELS，同一进程中的其他线程不会打开未经检查的图像
+_OPEN_LOCK = threading.Lock()
+
+# 超过该像素数的图像按水平条带处理，中间结果保存在内存映射的临时文件中
+LARGE_IMAGE_PIXELS = 64 * 1024 * 1024
+# 每个条带的像素数
+STRIP_PIXELS = 4 * 1024 * 1024
+
+@functools.lru_cache(maxsize=8)
+def _load_font(name, size):
+    """加载字体，找不到时使用默认字体；同一字体只加载一次"""
+    try:
+        return ImageFont.truetype(name, size)
+    except IOError:
+        return ImageFont.load_default()
+
+def _text_bbox(text, font):
+    # 计算文本大小（Pillow 10移除了textsize，改用textbbox）
+    return ImageDraw.Draw(Image.new('RGBA', (1, 1))).textbbox((0, 0), text, font=font)
+
+@functools.lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _text_tile(text, font_name, font_size, opacity):
+    """
+    渲染文本水印，返回(RGBA图块, 文本尺寸)；图块从绘制原点开始，放在文本位置即可
+    """
+    font = _load_font(font_name, font_size)
+    left, top, right, bottom = _text_bbox(text, font)
+    tile = Image.new('RGBA', (max(right, 1), max(bottom, 1)), (0, 0, 0, 0))
+    ImageDraw.Draw(tile).text((0, 0), text, fill=(255, 255, 255, int(255 * opacity)), font=font)
+    return tile, (right - left, bottom - top)
+
+@functools.lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _rotated_text_tile(text, font_name, font_size, opacity, rotation, image_size, position):
+    """
+    渲染旋转的文本水印，返回(RGBA图块, 图块在图像中的左上角坐标)，没有可见内容时图块为None
+
+    整个水印层旋转后缩放回图像尺寸，与图像尺寸和位置有关；只渲染一次，保留有内容的区域。
+    """
+    font = _load_font(font_name, font_size)
+    left, top, right, bottom = _text_bbox(text, font)
+    layer = Image.new('RGBA', image_size, (0, 0, 0, 0))
+    text_position = ImageProcessor._position(image_size, (right - left, bottom - top), position)
+    ImageDraw.Draw(layer).text(text_position, text, fill=(255, 255, 255, int(255 * opacity)), font=font)
+    layer = layer.rotate(rotation, expand=1).resize(image_size)
+    bbox = layer.getbbox()
+    if bbox is None:
+        return None, (0, 0)
+    return layer.crop(bbox), bbox[:2]
+
+def _rotated_size(size, angle):
+    """Image.rotate(angle, expand=1)得到的图像尺寸，计算方法与Pillow相同"""
+    width, height = size
+    angle = angle % 360.0
+    if angle in (0.0, 180.0):
+        return size
+    if angle in (90.0, 270.0):
+        return height, width
+    radians = -math.radians(angle)
+    cos, sin = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    xs, ys = [], []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        x, y = x - width / 2.0, y - height / 2.0
+        xs.append(cos * x + sin * y + width / 2.0)
+        ys.append(-sin * x + cos * y + height / 2.0)
+    return math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys))
+
+@functools.lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _large_rotated_text_tile(text, font_name, font_size, opacity, rotation, image_size, position):
+    """
+    大图像的旋转文本水印，返回值与_rotated_text_tile相同
+
+    不渲染整个水印层，只旋转文本图块，再按整层旋转后缩放回图像尺寸的比例缩放图块并计算其位置；
+    与_rotated_text_tile的结果只有重采样误差。
+    """
+    tile, text_size = _text_tile(text, font_name, font_size, opacity)
+    width, height = image_size
+    text_x, text_y = ImageProcessor._position(image_size, text_size, position)
+    rotated_width, rotated_height = _rotated_size(image_size, rotation)
+    scale_x, scale_y = width / rotated_width, height / rotated_height
+    
+    # 文本图块中心相对于图像中心的偏移随整层一起逆时针旋转
+    radians = math.radians(rotation)
+    dx = text_x + tile.width / 2 - width / 2
+    dy = text_y + tile.height / 2 - height / 2
+    center_x = (rotated_width / 2 + dx * math.cos(radians) + dy * math.sin(radians)) * scale_x
+    center_y = (rotated_height / 2 - dx * math.sin(radians) + dy * math.cos(radians)) * scale_y
+    
+    tile = tile.rotate(rotation, expand=1)
+    tile = tile.resize((max(round(tile.width * scale_x), 1), max(round(tile.height * scale_y), 1)))
+    if tile.getbbox() is None:
+        return None, (0, 0)
+    return tile, (round(center_x - tile.width / 2), round(center_y - tile.height / 2))
+
+@functools.lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def _image_tile(image_bytes, size, opacity, rotation):
+    """
+    缩放、调整不透明度并旋转水印图像，返回RGBA图块
+
+    Args:
+        image_bytes: 水印图像文件内容（_HashedBytes，按摘要作为缓存键）
+        size: 缩放后的尺寸
+    """
+    wm_img = Image.open(io.BytesIO(image_bytes.data)).convert('RGBA')
+    if wm_img.size != size:
+        wm_img = wm_img.resize(size, Image.LANCZOS)
+
+    # 调整水印不透明度
+    if opacity < 1:
+        wm_img = ImageEnhance.Brightness(wm_img).enhance(opacity)
+
+    # 如果需要旋转
+    if rotation != 0:
+        wm_img = wm_img.rotate(rotation, expand=1)
+
+    # 与粘贴到透明水印层上的结果一致：颜色和透明度都按水印自身的透明度衰减
+    tile = Image.new('RGBA', wm_img.size, (0, 0, 0, 0))
+    tile.paste(wm_img, (0, 0), wm_img)
+    return tile
+
+
+class _HashedBytes:
+    """按摘要比较的字节内容，用作缓存参数时不会逐字节比较或计算哈希"""
+
+    __slots__ = ("digest", "data")
+
+    def __init__(self, data):
+        self.data = data
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __eq__(self, other):
+        return isinstance(other, _HashedBytes) and other.digest == self.digest
+
+
+class ImageTooLarge(Exception):
+    """图像超过允许打开的像素数"""
+
+
 class ImageProcessor:
     @staticmethod
     def convert_format(file_path, target_format, quality=90, output_dir=None):
@@ -19,7 +187,7 @@ class ImageProcessor:
         """
         try:
             # 打开图像
-            img = Image.open(file_path)
+            img = ImageProcessor._open(file_path, output_dir)
             
             # 创建输出文件路径
             file_dir = os.path.dirname(file_path)
@@ -38,29 +206,17 @@ class ImageProcessor:
                 output_path = os.path.join(file_dir, new_name)
             
             # 保存为新格式
-            if target_format.lower() in ['jpg', 'jpeg']:
-                # 如果原图像有透明通道，需要先转换为RGB
-                if img.mode in ['RGBA', 'LA'] or (img.mode == 'P' and 'transparency' in img.info):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-                    background.save(output_path, 'JPEG', quality=quality)
-                else:
-                    img.convert('RGB').save(output_path, 'JPEG', quality=quality)
-            elif target_format.lower() == 'png':
-                img.save(output_path, 'PNG')
-            elif target_format.lower() == 'webp':
-                img.save(output_path, 'WEBP', quality=quality)
-            elif target_format.lower() == 'gif':
-                img.save(output_path, 'GIF')
-            else:
-                img.save(output_path, target_format.upper())
+            ImageProcessor._save(img, output_path, target_format, quality)
             
             return output_path
+        except ImageTooLarge:
+            raise
         except Exception as e:
             raise Exception(f"转换图像格式时出错: {str(e)}")
     
     @staticmethod
-    def resize_image(file_path, width=None, height=None, keep_aspect_ratio=True, output_dir=None):
+    def resize_image(file_path, width=None, height=None, keep_aspect_ratio=True, output_dir=None,
+                     resample_quality="balanced"):
         """
         调整图像大小
         
@@ -70,75 +226,32 @@ class ImageProcessor:
             height: 目标高度，如果为None则根据宽度和原始比例计算
             keep_aspect_ratio: 是否保持原始宽高比
             output_dir: 输出目录，如果为None则在原目录中保存
+            resample_quality: 缩放质量，可以是'high'（从原始分辨率重采样）, 'balanced', 'fast'
             
         Returns:
             调整大小后的文件路径
         """
         try:
             # 打开图像
-            img = Image.open(file_path)
-            original_width, original_height = img.size
-            
-            # 计算新尺寸
-            if width is None and height is None:
-                # 如果没有指定宽度和高度，则保持原始尺寸
-                new_width, new_height = original_width, original_height
-            elif width is None:
-                # 如果只指定了高度，则根据原始比例计算宽度
-                new_height = height
-                if keep_aspect_ratio:
-                    new_width = int(original_width * (new_height / original_height))
-                else:
-                    new_width = original_width
-            elif height is None:
-                # 如果只指定了宽度，则根据原始比例计算高度
-                new_width = width
-                if keep_aspect_ratio:
-                    new_height = int(original_height * (new_width / original_width))
-                else:
-                    new_height = original_height
-            else:
-                # 如果同时指定了宽度和高度
-                if keep_aspect_ratio:
-                    # 保持原始比例，取较小的缩放比例
-                    width_ratio = width / original_width
-                    height_ratio = height / original_height
-                    
-                    if width_ratio < height_ratio:
-                        new_width = width
-                        new_height = int(original_height * width_ratio)
-                    else:
-                        new_height = height
-                        new_width = int(original_width * height_ratio)
-                else:
-                    # 不保持原始比例，直接使用指定的宽度和高度
-                    new_width, new_height = width, height
+            img = ImageProcessor._open(file_path, output_dir)
             
             # 调整图像大小
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
+            resized_img = ImageProcessor._resize(img, width, height, keep_aspect_ratio, resample_quality)
             
             # 创建输出文件路径
-            file_dir = os.path.dirname(file_path)
-            file_name = os.path.basename(file_path)
-            name_parts = os.path.splitext(file_name)
-            
-            # 创建新文件名
-            new_name = f"{name_parts[0]}_resized{name_parts[1]}"
-            
-            if output_dir:
-                output_path = os.path.join(output_dir, new_name)
-            else:
-                output_path = os.path.join(file_dir, new_name)
+            output_path = ImageProcessor._output_path(file_path, "_resized", output_dir)
             
             # 保存调整大小后的图像
-            resized_img.save(output_path)
+            ImageProcessor._save(resized_img, output_path)
             
             return output_path
+        except ImageTooLarge:
+            raise
         except Exception as e:
             raise Exception(f"调整图像大小时出错: {str(e)}")
     
     @staticmethod
-    def add_watermark(file_path, watermark_text=None, watermark_image=None, position='center', 
+    def add_watermark(file_path, watermark_text=None, watermark_image=None, position='center',
                       opacity=0.5, rotation=0, output_dir=None):
         """
         为图像添加水印
@@ -157,108 +270,20 @@ class ImageProcessor:
         """
         try:
             # 打开原始图像
-            img = Image.open(file_path).convert('RGBA')
+            img = ImageProcessor._open(file_path, output_dir)
             
-            # 创建水印层
-            watermark = Image.new('RGBA', img.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(watermark)
-            
-            if watermark_text:
-                # 使用文本水印
-                try:
-                    # 尝试加载系统字体
-                    font = ImageFont.truetype("arial.ttf", 36)
-                except IOError:
-                    # 如果找不到系统字体，则使用默认字体
-                    font = ImageFont.load_default()
-                
-                # 计算文本大小
-                text_width, text_height = draw.textsize(watermark_text, font=font)
-                
-                # 计算文本位置
-                if position == 'center':
-                    text_position = ((img.width - text_width) // 2, (img.height - text_height) // 2)
-                elif position == 'top-left':
-                    text_position = (10, 10)
-                elif position == 'top-right':
-                    text_position = (img.width - text_width - 10, 10)
-                elif position == 'bottom-left':
-                    text_position = (10, img.height - text_height - 10)
-                elif position == 'bottom-right':
-                    text_position = (img.width - text_width - 10, img.height - text_height - 10)
-                else:
-                    text_position = ((img.width - text_width) // 2, (img.height - text_height) // 2)
-                
-                # 绘制文本水印
-                draw.text(text_position, watermark_text, fill=(255, 255, 255, int(255 * opacity)), font=font)
-                
-                # 如果需要旋转
-                if rotation != 0:
-                    watermark = watermark.rotate(rotation, expand=1)
-                    # 重新调整水印大小以匹配原始图像
-                    watermark = watermark.resize(img.size)
-            
-            elif watermark_image:
-                # 使用图像水印
-                wm_img = Image.open(watermark_image).convert('RGBA')
-                
-                # 调整水印图像大小（最大为原图的1/4）
-                wm_width, wm_height = wm_img.size
-                max_wm_width = img.width // 4
-                max_wm_height = img.height // 4
-                
-                if wm_width > max_wm_width or wm_height > max_wm_height:
-                    scale = min(max_wm_width / wm_width, max_wm_height / wm_height)
-                    wm_width = int(wm_width * scale)
-                    wm_height = int(wm_height * scale)
-                    wm_img = wm_img.resize((wm_width, wm_height), Image.LANCZOS)
-                
-                # 调整水印不透明度
-                if opacity < 1:
-                    wm_img = ImageEnhance.Brightness(wm_img).enhance(opacity)
-                
-                # 如果需要旋转
-                if rotation != 0:
-                    wm_img = wm_img.rotate(rotation, expand=1)
-                
-                # 计算水印位置
-                if position == 'center':
-                    wm_position = ((img.width - wm_width) // 2, (img.height - wm_height) // 2)
-                elif position == 'top-left':
-                    wm_position = (10, 10)
-                elif position == 'top-right':
-                    wm_position = (img.width - wm_width - 10, 10)
-                elif position == 'bottom-left':
-                    wm_position = (10, img.height - wm_height - 10)
-                elif position == 'bottom-right':
-                    wm_position = (img.width - wm_width - 10, img.height - wm_height - 10)
-                else:
-                    wm_position = ((img.width - wm_width) // 2, (img.height - wm_height) // 2)
-                
-                # 将水印图像粘贴到水印层
-                watermark.paste(wm_img, wm_position, wm_img)
-            
-            # 将水印层与原始图像合并
-            result = Image.alpha_composite(img, watermark)
+            # 添加水印
+            result = ImageProcessor._watermark(img, watermark_text, watermark_image, position, opacity, rotation)
             
             # 创建输出文件路径
-            file_dir = os.path.dirname(file_path)
-            file_name = os.path.basename(file_path)
-            name_parts = os.path.splitext(file_name)
-            
-            # 创建新文件名
-            new_name = f"{name_parts[0]}_watermarked{name_parts[1]}"
-            
-            if output_dir:
-                output_path = os.path.join(output_dir, new_name)
-            else:
-                output_path = os.path.join(file_dir, new_name)
+            output_path = ImageProcessor._output_path(file_path, "_watermarked", output_dir)
             
             # 保存添加水印后的图像
-            result = result.convert('RGB')  # 转换回RGB模式以支持所有格式
-            result.save(output_path)
+            ImageProcessor._save(result, output_path)
             
             return output_path
+        except ImageTooLarge:
+            raise
         except Exception as e:
             raise Exception(f"添加水印时出错: {str(e)}")
     
@@ -276,40 +301,98 @@ class ImageProcessor:
             处理后的文件路径列表
         """
         try:
-            processed_files = []
+            return [
+                ImageProcessor.process_image(file_path, operations, output_dir)
+                for file_path in file_paths
+            ]
+        except Exception as e:
+            raise Exception(f"批量处理图像时出错: {str(e)}")
+    
+    @staticmethod
+    def process_image(file_path, operations, output_dir=None):
+        """
+        对单个图像执行操作列表，供批量处理和进程池按文件调用
+        
+        图像只解码一次，所有操作都在内存中完成，最后只编码一次，
+        不产生中间文件，也不会因多次有损编码而损失质量。
+        
+        Args:
+            file_path: 图像文件路径
+            operations: 操作列表，每个操作是一个字典，包含操作类型和参数，
+                        支持'convert_format', 'resize', 'add_watermark', 'apply_filter'
+            output_dir: 输出目录，如果为None则在原目录中保存
+            
+        Returns:
+            处理后的文件路径
+        """
+        try:
+            img = ImageProcessor._open(file_path, output_dir)
             
-            for file_path in file_paths:
-                current_file = file_path
+            # 输出文件名按操作顺序追加后缀，与逐个调用单项操作时的命名一致
+            name, ext = os.path.splitext(os.path.basename(file_path))
+            target_format = None
+            quality = None
+            # 连续的亮度、对比度和伽马调整合并为一张查找表，在下一个其他操作之前一起应用
+            point_filters = []
+            
+            for operation in operations:
+                op_type = operation.get("type")
+                
+                if op_type == "apply_filter" and operation.get("filter_type") in POINT_FILTERS:
+                    filter_type = operation.get("filter_type")
+                    point_filters.append((filter_type, operation.get("intensity", 1.0)))
+                    name += f"_{filter_type}"
+                    continue
+                if point_filters:
+                    img = ImageProcessor._point(img, point_filters)
+                    point_filters = []
+                
+                if op_type == "convert_format":
+                    # 格式转换只影响最终的编码
+                    target_format = operation.get("target_format").lower().strip('.')
+                    quality = operation.get("quality", 90)
+                    ext = f".{target_format}"
                 
-                for operation in operations:
-                    op_type = operation.get("type")
-                    
-                    if op_type == "convert_format":
-                        target_format = operation.get("target_format")
-                        quality = operation.get("quality", 90)
-                        current_file = ImageProcessor.convert_format(current_file, target_format, quality, output_dir)
-                    
-                    elif op_type == "resize":
-                        width = operation.get("width")
-                        height = operation.get("height")
-                        keep_aspect_ratio = operation.get("keep_aspect_ratio", True)
-                        current_file = ImageProcessor.resize_image(current_file, width, height, keep_aspect_ratio, output_dir)
-                    
-                    elif op_type == "add_watermark":
-                        watermark_text = operation.get("watermark_text")
-                        watermark_image = operation.get("watermark_image")
-                        position = operation.get("position", "center")
-                        opacity = operation.get("opacity", 0.5)
-                        rotation = operation.get("rotation", 0)
-                        current_file = ImageProcessor.add_watermark(
-                            current_file, watermark_text, watermark_image, position, opacity, rotation, output_dir
-                        )
+                elif op_type == "resize":
+                    img = ImageProcessor._resize(
+                        img,
+                        operation.get("width"),
+                        operation.get("height"),
+                        operation.get("keep_aspect_ratio", True),
+                        operation.get("resample_quality", "balanced")
+                    )
+                    name += "_resized"
                 
-                processed_files.append(current_file)
+                elif op_type == "add_watermark":
+                    img = ImageProcessor._watermark(
+                        img,
+                        operation.get("watermark_text"),
+                        operation.get("watermark_image"),
+                        operation.get("position", "center"),
+                        operation.get("opacity", 0.5),
+                        operation.get("rotation", 0)
+                    )
+                    name += "_watermarked"
+                
+                elif op_type == "apply_filter":
+                    filter_type = operation.get("filter_type")
+                    img = ImageProcessor._filter(img, filter_type, operation.get("intensity", 1.0))
+                    name += f"_{filter_type}"
+                
+                else:
+                    raise ValueError(f"不支持的操作类型: {op_type}")
             
-            return processed_files
+            if point_filters:
+                img = ImageProcessor._point(img, point_filters)
+            
+            output_path = os.path.join(output_dir or os.path.dirname(file_path), f"{name}{ext}")
+            ImageProcessor._save(img, output_path, target_format, quality)
+            
+            return output_path
+        except ImageTooLarge:
+            raise
         except Exception as e:
-            raise Exception(f"批量处理图像时出错: {str(e)}")
+            raise Exception(f"处理图像时出错: {str(e)}")
     
     @staticmethod
     def apply_filter(file_path, filter_type, intensity=1.0, output_dir=None):
@@ -318,8 +401,8 @@ class ImageProcessor:
         
         Args:
             file_path: 图像文件路径
-            filter_type: 滤镜类型，可以是'blur', 'sharpen', 'contour', 'detail', 'edge_enhance', 'emboss', 'smooth', 'brightness', 'contrast'
-            intensity: 滤镜强度（0.0-2.0）
+            filter_type: 滤镜类型，可以是'blur', 'sharpen', 'contour', 'detail', 'edge_enhance', 'emboss', 'smooth', 'brightness', 'contrast', 'gamma'
+            intensity: 滤镜强度（0.0-2.0），锐化和边缘增强的强度可以连续调节；伽马调整时为伽马值，必须大于0
             output_dir: 输出目录，如果为None则在原目录中保存
             
         Returns:
@@ -327,52 +410,452 @@ class ImageProcessor:
         """
         try:
             # 打开图像
-            img = Image.open(file_path)
+            img = ImageProcessor._open(file_path, output_dir)
             
             # 应用滤镜
-            if filter_type == 'blur':
-                filtered_img = img.filter(ImageFilter.GaussianBlur(radius=intensity * 2))
-            elif filter_type == 'sharpen':
-                filtered_img = img
-                for _ in range(int(intensity * 3)):
-                    filtered_img = filtered_img.filter(ImageFilter.SHARPEN)
-            elif filter_type == 'contour':
-                filtered_img = img.filter(ImageFilter.CONTOUR)
-            elif filter_type == 'detail':
-                filtered_img = img.filter(ImageFilter.DETAIL)
-            elif filter_type == 'edge_enhance':
-                filtered_img = img
-                for _ in range(int(intensity * 3)):
-                    filtered_img = filtered_img.filter(ImageFilter.EDGE_ENHANCE)
-            elif filter_type == 'emboss':
-                filtered_img = img.filter(ImageFilter.EMBOSS)
-            elif filter_type == 'smooth':
-                filtered_img = img.filter(ImageFilter.SMOOTH_MORE)
-            elif filter_type == 'brightness':
-                enhancer = ImageEnhance.Brightness(img)
-                filtered_img = enhancer.enhance(intensity)
-            elif filter_type == 'contrast':
-                enhancer = ImageEnhance.Contrast(img)
-                filtered_img = enhancer.enhance(intensity)
-            else:
-                raise ValueError(f"不支持的滤镜类型: {filter_type}")
+            filtered_img = ImageProcessor._filter(img, filter_type, intensity)
             
             # 创建输出文件路径
-            file_dir = os.path.dirname(file_path)
-            file_name = os.path.basename(file_path)
-            name_parts = os.path.splitext(file_name)
-            
-            # 创建新文件名
-            new_name = f"{name_parts[0]}_{filter_type}{name_parts[1]}"
-            
-            if output_dir:
-                output_path = os.path.join(output_dir, new_name)
-            else:
-                output_path = os.path.join(file_dir, new_name)
+            output_path = ImageProcessor._output_path(file_path, f"_{filter_type}", output_dir)
             
             # 保存应用滤镜后的图像
-            filtered_img.save(output_path)
+            ImageProcessor._save(filtered_img, output_path)
             
             return output_path
+        except ImageTooLarge:
+            raise
+        except Exception as e:
+            raise Exception(f"应用图像滤镜时出错: {str(e)}")
+    
+    @staticmethod
+    def generate_derivatives(file_path, sizes=DERIVATIVE_SIZES, formats=None, quality=None, output_dir=None,
+                             resample_quality="balanced"):
+        """
+        从一次解码生成多个尺寸、多种格式的缩略图
+        
+        尺寸从大到小依次生成：最大的尺寸从原图像缩小（JPEG按缩放解码，大图像按条带处理），
+        其余每个尺寸都从上一个尺寸的结果缩小，重采样读取的像素数逐级减少。
+        
+        Args:
+            file_path: 图像文件路径
+            sizes: 最长边的像素数列表，不小于原图像最长边的尺寸合并为一个原图像大小的结果
+            formats: 输出格式列表（如['jpg', 'webp']），为None时使用原文件的格式
+            quality: 输出质量（1-100，仅对jpg和webp有效），为None时使用Pillow的默认值
+            output_dir: 输出目录，如果为None则在原目录中保存
+            resample_quality: 缩放质量，可以是'high', 'balanced', 'fast'
+            
+        Returns:
+            生成的文件路径列表，按尺寸从大到小、同一尺寸内按formats的顺序排列，
+            文件名为"原文件名_尺寸.格式"，尺寸为结果实际的最长边
+        """
+        try:
+            sizes = sorted(set(sizes), reverse=True)
+            if not sizes or sizes[-1] <= 0:
+                raise ValueError("缩略图尺寸必须大于0")
+            
+            name, ext = os.path.splitext(os.path.basename(file_path))
+            formats = list(dict.fromkeys(
+                file_format.lower().strip('.') for file_format in (formats or [ext])
+            ))
+            
+            img = ImageProcessor._open(file_path, output_dir)
+            if img.mode in ('1', 'P'):
+                # Pillow对二值和调色板图像只能按最近邻缩放
+                img = img.convert(ImageProcessor._working_mode(img))
+            original_size = img.size
+            
+            # 超过原图像的尺寸不放大，都得到原图像大小的结果，只生成一次
+            bounds = sorted({min(size, max(original_size)) for size in sizes}, reverse=True)
+            
+            output_paths = []
+            for size in bounds:
+                # 各尺寸都按原图像的宽高比计算，不因逐级缩小累积取整误差
+                new_size = ImageProcessor._target_size(original_size, size, size)
+                if new_size != img.size:
+                    img = ImageProcessor._resize(img, new_size[0], new_size[1], False, resample_quality)
+                
+                for file_format in formats:
+                    # 编码格式由扩展名决定
+                    output_path = os.path.join(output_dir or os.path.dirname(file_path), f"{name}_{max(new_size)}.{file_format}")
+                    ImageProcessor._save(img, output_path, quality=quality)
+                    output_paths.append(output_path)
+            
+            return output_paths
+        except ImageTooLarge:
+            raise
         except Exception as e:
-            raise Exception(f"应用图像滤镜时出错: {str(e)}")
\ No newline at end of file
+            raise Exception(f"生成缩略图时出错: {str(e)}")
+    
+    @staticmethod
+    def _output_path(file_path, suffix, output_dir=None):
+        """在文件名和扩展名之间插入后缀，返回输出文件路径"""
+        file_dir = os.path.dirname(file_path)
+        name_parts = os.path.splitext(os.path.basename(file_path))
+        new_name = f"{name_parts[0]}{suffix}{name_parts[1]}"
+        return os.path.join(output_dir or file_dir, new_name)
+    
+    @staticmethod
+    def _open(file_path, output_dir=None):
+        """
+        打开图像，超过LARGE_IMAGE_PIXELS的图像返回按条带读取的StripReader
+        
+        大图像的各项操作都按条带执行，结果保存在输出目录中内存映射的临时文件里，内存占用与图像大小无关。
+        超过Pillow默认限制的图像只有能按条带解码时才打开，最多MAX_STREAMED_PIXELS像素。
+        
+        Raises:
+            ImageTooLarge: 图像超过允许打开的像素数
+        """
+        with _OPEN_LOCK:
+            try:
+                img = Image.open(file_path)
+                streamed_only = False
+            except Image.DecompressionBombError:
+                default_limit = Image.MAX_IMAGE_PIXELS
+                Image.MAX_IMAGE_PIXELS = MAX_STREAMED_PIXELS
+                try:
+                    img = Image.open(file_path)
+                except Image.DecompressionBombError as e:
+                    raise ImageTooLarge(str(e))
+                finally:
+                    Image.MAX_IMAGE_PIXELS = default_limit
+                streamed_only = True
+        
+        pixels = img.width * img.height
+        if pixels <= LARGE_IMAGE_PIXELS and not streamed_only:
+            return img
+        reader = StripReader(img, ImageProcessor._working_mode(img), output_dir or os.path.dirname(file_path),
+                             STRIP_PIXELS)
+        if streamed_only and (pixels > MAX_STREAMED_PIXELS or not reader.streamed):
+            img.close()
+            raise ImageTooLarge(
+                f"图像有{pixels}像素，超过{MAX_STREAMED_PIXELS}像素或不能按条带解码（仅支持未压缩的TIFF、BMP和PPM）"
+            )
+        return reader
+    
+    @staticmethod
+    def _working_mode(img):
+        """处理时使用的图像模式：WATERMARK_MODES保持不变，带透明度的调色板图像为RGBA，其他为RGB"""
+        if img.mode in WATERMARK_MODES:
+            return img.mode
+        has_alpha = img.mode == 'PA' or (img.mode == 'P' and 'transparency' in img.info)
+        return 'RGBA' if has_alpha else 'RGB'
+    
+    @staticmethod
+    def _save(img, output_path, target_format=None, quality=None):
+        """
+        编码并保存图像
+        
+        Args:
+            img: Image对象或按条带处理的StripImage
+            output_path: 输出文件路径
+            target_format: 目标格式，为None时由扩展名决定
+            quality: 输出质量（仅对jpg和webp有效），为None时使用Pillow的默认值
+        """
+        if isinstance(img, StripImage):
+            # Pillow的编码器需要完整的图像，L、RGB和RGBA图像直接映射临时文件，不复制像素
+            img = img.to_image()
+        
+        file_format = (target_format or os.path.splitext(output_path)[1]).lower().strip('.')
+        params = {} if quality is None else {"quality": quality}
+        
+        if file_format in ['jpg', 'jpeg']:
+            # 如果原图像有透明通道，需要先转换为RGB
+            if img.mode in ['RGBA', 'LA'] or (img.mode == 'P' and 'transparency' in img.info):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
+                background.save(output_path, 'JPEG', **params)
+            else:
+                (img if img.mode == 'RGB' else img.convert('RGB')).save(output_path, 'JPEG', **params)
+        elif file_format == 'png':
+            img.save(output_path, 'PNG')
+        elif file_format == 'webp':
+            img.save(output_path, 'WEBP', **params)
+        elif file_format == 'gif':
+            img.save(output_path, 'GIF')
+        elif target_format:
+            img.save(output_path, target_format.upper())
+        else:
+            img.save(output_path)
+    
+    @staticmethod
+    def _target_size(original_size, width=None, height=None, keep_aspect_ratio=True):
+        """计算调整大小后的尺寸"""
+        original_width, original_height = original_size
+        
+        if width is None and height is None:
+            # 如果没有指定宽度和高度，则保持原始尺寸
+            return original_width, original_height
+        elif width is None:
+            # 如果只指定了高度，则根据原始比例计算宽度
+            if keep_aspect_ratio:
+                return int(original_width * (height / original_height)), height
+            return original_width, height
+        elif height is None:
+            # 如果只指定了宽度，则根据原始比例计算高度
+            if keep_aspect_ratio:
+                return width, int(original_height * (width / original_width))
+            return width, original_height
+        elif keep_aspect_ratio:
+            # 保持原始比例，取较小的缩放比例
+            width_ratio = width / original_width
+            height_ratio = height / original_height
+            
+            if width_ratio < height_ratio:
+                return width, int(original_height * width_ratio)
+            return int(original_width * height_ratio), height
+        else:
+            # 不保持原始比例，直接使用指定的宽度和高度
+            return width, height
+    
+    @staticmethod
+    def _resize(img, width=None, height=None, keep_aspect_ratio=True, resample_quality="balanced"):
+        """在内存中调整图像大小"""
+        if resample_quality not in RESAMPLE_QUALITY:
+            raise ValueError(f"不支持的缩放质量: {resample_quality}")
+        resample, reducing_gap = RESAMPLE_QUALITY[resample_quality]
+        new_size = ImageProcessor._target_size(img.size, width, height, keep_aspect_ratio)
+        
+        if isinstance(img, StripImage):
+            return ImageProcessor._resize_strips(img, new_size, resample, reducing_gap)
+        
+        if reducing_gap is not None and new_size[0] < img.width and new_size[1] < img.height:
+            # 尚未解码的JPEG直接按1/2、1/4、1/8缩放解码，解码后的尺寸不小于目标尺寸的reducing_gap倍；
+            # 其他格式或已解码的图像不受影响
+            img.draft(None, (int(new_size[0] * reducing_gap), int(new_size[1] * reducing_gap)))
+            return img.resize(new_size, resample, reducing_gap=reducing_gap)
+        
+        return img.resize(new_size, resample)
+    
+    @staticmethod
+    def _resize_strips(img, new_size, resample, reducing_gap=None):
+        """
+        按条带调整大图像的大小，与Image.resize的结果只有舍入误差
+        
+        每个输出条带只读取对应的输入行和重采样滤镜所需的相邻行；指定reducing_gap时与Image.resize一样
+        先用reduce()按整数倍缩小，JPEG还会先按缩放解码。
+        """
+        box_size = img.size
+        if reducing_gap is not None and new_size[0] < img.width and new_size[1] < img.height:
+            if isinstance(img, StripReader):
+                img.draft(None, (int(new_size[0] * reducing_gap), int(new_size[1] * reducing_gap)))
+            img, box_size = ImageProcessor._reduce_strips(img, new_size, reducing_gap)
+        
+        box_width, box_height = box_size
+        scale = box_height / new_size[1]
+        # 重采样滤镜的支撑半径（LANCZOS为3），缩小时按比例扩大
+        margin = 3 * max(scale, 1) + 1
+        result = img.mapped(size=new_size)
+        # 条带高度按需要读取的输入像素数计算，缩小倍数越大条带越矮
+        for top, bottom in result.strips(width=max(math.ceil(img.width * scale), new_size[0])):
+            box_top, box_bottom = top * scale, bottom * scale
+            read_top = max(int(box_top - margin), 0)
+            read_bottom = min(math.ceil(box_bottom + margin), img.height)
+            rows = img.read(read_top, read_bottom)
+            result.write(top, rows.resize(
+                (new_size[0], bottom - top), resample,
+                box=(0, box_top - read_top, box_width, box_bottom - read_top)
+            ))
+        return result
+    
+    @staticmethod
+    def _reduce_strips(img, new_size, reducing_gap):
+        """
+        按Image.resize的规则用reduce()整数倍缩小大图像，条带的高度取缩小倍数的整数倍
+        
+        Returns:
+            (缩小后的图像, 原图像在缩小后的坐标中的尺寸)
+        """
+        factor_x = int(img.width / new_size[0] / reducing_gap) or 1
+        factor_y = int(img.height / new_size[1] / reducing_gap) or 1
+        if factor_x == 1 and factor_y == 1:
+            return img, img.size
+        
+        reduced = img.mapped(size=(math.ceil(img.width / factor_x), math.ceil(img.height / factor_y)))
+        step = max(img.strip_pixels // img.width // factor_y, 1) * factor_y
+        for top in range(0, img.height, step):
+            rows = img.read(top, min(top + step, img.height))
+            reduced.write(top // factor_y, rows.reduce((factor_x, factor_y)))
+        return reduced, (img.width / factor_x, img.height / factor_y)
+    
+    @staticmethod
+    def _position(image_size, mark_size, position='center'):
+        """计算水印左上角的坐标"""
+        img_width, img_height = image_size
+        mark_width, mark_height = mark_size
+        
+        if position == 'top-left':
+            return (10, 10)
+        elif position == 'top-right':
+            return (img_width - mark_width - 10, 10)
+        elif position == 'bottom-left':
+            return (10, img_height - mark_height - 10)
+        elif position == 'bottom-right':
+            return (img_width - mark_width - 10, img_height - mark_height - 10)
+        else:
+            return ((img_width - mark_width) // 2, (img_height - mark_height) // 2)
+    
+    @staticmethod
+    def _watermark(img, watermark_text=None, watermark_image=None, position='center', opacity=0.5, rotation=0):
+        """
+        在内存中为图像添加水印，返回添加水印后的图像
+        
+        水印图块按文本或图像内容、不透明度、旋转角度和缩放后的尺寸缓存，批量处理同一水印时只渲染一次。
+        水印直接合成到图像中被覆盖的区域，传入的图像会被修改；RGB、RGBA、L和LA图像保持原模式，
+        PNG的透明度得以保留，其他模式按WATERMARK_MODES的说明转换。大图像先按条带复制到内存映射的临时文件中。
+        """
+        if isinstance(img, StripReader):
+            img = img.materialize()
+        
+        if watermark_text:
+            # 使用文本水印
+            if rotation != 0 and isinstance(img, StripImage):
+                tile, tile_position = _large_rotated_text_tile(
+                    watermark_text, "arial.ttf", 36, opacity, rotation, img.size, position
+                )
+            elif rotation != 0:
+                tile, tile_position = _rotated_text_tile(
+                    watermark_text, "arial.ttf", 36, opacity, rotation, img.size, position
+                )
+            else:
+                tile, text_size = _text_tile(watermark_text, "arial.ttf", 36, opacity)
+                tile_position = ImageProcessor._position(img.size, text_size, position)
+        
+        elif watermark_image:
+            # 使用图像水印
+            with open(watermark_image, 'rb') as f:
+                image_bytes = _HashedBytes(f.read())
+            with Image.open(io.BytesIO(image_bytes.data)) as wm_img:
+                wm_width, wm_height = wm_img.size
+            
+            # 调整水印图像大小（最大为原图的1/4）
+            max_wm_width = img.width // 4
+            max_wm_height = img.height // 4
+            
+            if wm_width > max_wm_width or wm_height > max_wm_height:
+                scale = min(max_wm_width / wm_width, max_wm_height / wm_height)
+                wm_width = int(wm_width * scale)
+                wm_height = int(wm_height * scale)
+            
+            tile = _image_tile(image_bytes, (wm_width, wm_height), opacity, rotation)
+            
+            # 计算水印位置（按旋转前的尺寸）
+            tile_position = ImageProcessor._position(img.size, (wm_width, wm_height), position)
+        
+        else:
+            tile = None
+        
+        if img.mode not in WATERMARK_MODES:
+            # 调色板和其他模式无法直接合成，带透明度时保留透明度
+            img = img.convert(ImageProcessor._working_mode(img))
+        if tile is not None:
+            ImageProcessor._composite(img, tile, tile_position)
+        return img
+    
+    @staticmethod
+    def _composite(img, tile, position):
+        """
+        把RGBA图块合成到图像中，只裁剪、合成并贴回图块与图像重叠的区域，图像保持原模式
+        
+        Args:
+            img: 要修改的Image或MappedImage，模式为WATERMARK_MODES之一
+            tile: RGBA图块
+            position: 图块左上角在图像中的坐标，可以为负数或超出图像
+        """
+        x, y = position
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + tile.width, img.width), min(y + tile.height, img.height)
+        if left >= right or top >= bottom:
+            return
+        box = (left, top, right, bottom)
+        region = img.crop(box)
+        if region.mode != 'RGBA':
+            region = region.convert('RGBA')
+        region.alpha_composite(tile.crop((left - x, top - y, right - x, bottom - y)))
+        img.paste(region if img.mode == 'RGBA' else region.convert(img.mode), box)
+    
+    @staticmethod
+    def _filter(img, filter_type, intensity=1.0):
+        """在内存中应用滤镜"""
+        if isinstance(img, StripImage):
+            return ImageProcessor._filter_strips(img, filter_type, intensity)
+        
+        if filter_type in POINT_FILTERS:
+            return ImageProcessor._point(img, [(filter_type, intensity)])
+        elif filter_type in SHARPEN_AMOUNTS:
+            # 相当于重复intensity * 3次ImageFilter的3×3卷积，合成为一次卷积，非整数次时在相邻两个整数次之间插值
+            if img.mode not in WATERMARK_MODES:
+                img = img.convert(ImageProcessor._working_mode(img))
+            return sharpen(img, SHARPEN_AMOUNTS[filter_type], intensity * 3)
+        elif filter_type == 'blur':
+            return img.filter(ImageFilter.GaussianBlur(radius=intensity * 2))
+        elif filter_type == 'contour':
+            return img.filter(ImageFilter.CONTOUR)
+        elif filter_type == 'detail':
+            return img.filter(ImageFilter.DETAIL)
+        elif filter_type == 'emboss':
+            return img.filter(ImageFilter.EMBOSS)
+        elif filter_type == 'smooth':
+            return img.filter(ImageFilter.SMOOTH_MORE)
+        else:
+            raise ValueError(f"不支持的滤镜类型: {filter_type}")
+    
+    @staticmethod
+    def _point(img, operations):
+        """
+        依次应用亮度、对比度和伽马调整，合并为一张查找表后只遍历一次像素，透明通道保持不变
+        
+        Args:
+            img: Image对象或按条带处理的StripImage
+            operations: [(滤镜类型, 强度)]，滤镜类型为POINT_FILTERS之一
+        """
+        if img.mode not in WATERMARK_MODES:
+            img = img.convert(ImageProcessor._working_mode(img))
+        
+        histogram = None
+        if any(filter_type == 'contrast' for filter_type, _ in operations):
+            # 对比度按整幅图像的平均亮度调整，按条带处理时先扫描一遍各条带的直方图
+            if isinstance(img, StripImage):
+                histogram = sum(color_histogram(img.read(top, bottom)) for top, bottom in img.strips())
+            else:
+                histogram = color_histogram(img)
+        lut = point_lut(operations, histogram)
+        
+        if not isinstance(img, StripImage):
+            return apply_lut(img, lut)
+        result = img.mapped()
+        for top, bottom in img.strips():
+            result.write(top, apply_lut(img.read(top, bottom), lut))
+        return result
+    
+    @staticmethod
+    def _filter_margin(filter_type, intensity=1.0):
+        """按条带应用滤镜时条带每侧需要多读取的行数，即卷积核半径"""
+        if filter_type == 'blur':
+            # GaussianBlur由3次盒式模糊近似，每次的半径不超过模糊半径加1
+            return 3 * (math.ceil(intensity * 2) + 1)
+        elif filter_type in SHARPEN_AMOUNTS:
+            return max(math.ceil(intensity * 3), 0)
+        elif filter_type in ('contour', 'detail', 'emboss'):
+            return 1
+        elif filter_type == 'smooth':
+            return 2
+        else:
+            raise ValueError(f"不支持的滤镜类型: {filter_type}")
+    
+    @staticmethod
+    def _filter_strips(img, filter_type, intensity=1.0):
+        """
+        按条带应用滤镜
+        
+        每个条带上下多读取卷积核所需的行，滤波后再裁掉，结果与对整幅图像应用相同。
+        """
+        if filter_type in POINT_FILTERS:
+            return ImageProcessor._point(img, [(filter_type, intensity)])
+        
+        margin = ImageProcessor._filter_margin(filter_type, intensity)
+        result = img.mapped()
+        for top, bottom in img.strips():
+            read_top, read_bottom = max(top - margin, 0), min(bottom + margin, img.height)
+            rows = ImageProcessor._filter(img.read(read_top, read_bottom), filter_type, intensity)
+            result.write(top, rows.crop((0, top - read_top, rows.width, bottom - read_top)))
+        return result
@@ -0,0 +1,209 @@
+import tempfile
+import numpy as np
+from PIL import Image
+
+
+def strip_ranges(width, height, strip_pixels):
+    """按每个条带不超过strip_pixels个像素把图像划分为水平条带，产出(上边界, 下边界)"""
+    strip_height = max(strip_pixels // max(width, 1), 1)
+    for top in range(0, height, strip_height):
+        yield top, min(top + strip_height, height)
+
+
+class StripImage:
+    """按水平条带访问的大图像，子类实现read(top, bottom)"""
+
+    def __init__(self, mode, size, directory, strip_pixels):
+        """
+        Args:
+            mode: 条带的图像模式
+            size: 图像尺寸
+            directory: 中间结果的临时文件目录
+            strip_pixels: 每个条带的最大像素数
+        """
+        self.mode = mode
+        self.size = size
+        self.directory = directory
+        self.strip_pixels = strip_pixels
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def strips(self, width=None, height=None):
+        """划分条带，默认按本图像的尺寸"""
+        return strip_ranges(width or self.width, height or self.height, self.strip_pixels)
+
+    def read(self, top, bottom):
+        """返回第top行到第bottom行（不含）的Image"""
+        raise NotImplementedError
+
+    def mapped(self, mode=None, size=None):
+        """创建与本图像使用相同目录和条带大小的MappedImage，模式和尺寸默认与本图像相同"""
+        return MappedImage(mode or self.mode, size or self.size, self.directory, self.strip_pixels)
+
+
+class StripReader(StripImage):
+    """
+    按条带解码图像文件
+
+    未压缩的图像（未压缩的TIFF、BMP、PPM等）按文件中各数据块的偏移只读取条带所在的行，
+    内存占用与图像大小无关；PNG、JPEG和压缩的TIFF只能整体解码，第一次读取时解码整幅图像，
+    之后从中裁剪条带。
+    """
+
+    def __init__(self, img, mode, directory, strip_pixels):
+        """
+        Args:
+            img: 已打开、尚未解码的Image
+            mode: 条带转换成的模式，调色板等无法直接处理的模式在读取时转换
+        """
+        super().__init__(mode, img.size, directory, strip_pixels)
+        self.image = img
+        self._tiles = self._raw_tiles(img)
+
+    @staticmethod
+    def _raw_tiles(img):
+        """
+        返回可以按行读取的数据块列表[(区域, 偏移, 原始模式, 行字节数, 行方向)]，不能按行读取时返回None
+
+        只支持各数据块都是未压缩的原始数据、且互不重叠（不是按通道分开存储）的图像。
+        """
+        tiles = []
+        area = 0
+        for decoder_name, box, offset, args in img.tile:
+            if decoder_name != "raw":
+                return None
+            if isinstance(args, str):
+                args = (args,)
+            rawmode, stride, ystep = tuple(args) + (0, 1)[len(args) - 1:]
+            x0, y0, x1, y1 = box
+            if stride <= 0:
+                try:
+                    # 按原始模式打包一行得到每行的字节数
+                    stride = len(Image.new(img.mode, (x1 - x0, 1)).tobytes("raw", rawmode))
+                except (ValueError, OSError):
+                    return None
+            tiles.append(((x0, y0, x1, y1), offset, rawmode, stride, ystep))
+            area += (x1 - x0) * (y1 - y0)
+        if not tiles or area != img.width * img.height:
+            return None
+        return tiles
+
+    @property
+    def streamed(self):
+        """是否按条带读取文件中的数据，为False时第一次读取要解码整幅图像"""
+        return self._tiles is not None
+
+    def draft(self, mode, size):
+        """在第一次读取之前按缩放解码（仅对JPEG有效），返回新的图像尺寸"""
+        self.image.draft(mode, size)
+        self.size = self.image.size
+        return self.size
+
+    def read(self, top, bottom):
+        if self._tiles is None:
+            rows = self.image.crop((0, top, self.width, bottom))
+        else:
+            rows = self._read_tiles(top, bottom)
+        if rows.mode != self.mode:
+            rows = rows.convert(self.mode)
+        return rows
+
+    def _read_tiles(self, top, bottom):
+        img = self.image
+        rows = Image.new(img.mode, (self.width, bottom - top))
+        if img.mode in ("P", "PA") and img.palette is not None:
+            rows.putpalette(img.palette)
+        if "transparency" in img.info:
+            rows.info["transparency"] = img.info["transparency"]
+
+        for (x0, y0, x1, y1), offset, rawmode, stride, ystep in self._tiles:
+            start, end = max(y0, top), min(y1, bottom)
+            if start >= end:
+                continue
+            # 行方向为负（如BMP）时文件中的行从下往上排列
+            skip = start - y0 if ystep > 0 else y1 - end
+            length = (end - start) * stride
+            img.fp.seek(offset + skip * stride)
+            data = img.fp.read(length)
+            if len(data) < length:
+                if length - len(data) >= stride:
+                    raise OSError("图像文件不完整")
+                # 最后一行可能没有行尾的填充字节
+                data += bytes(length - len(data))
+            part = Image.frombytes(img.mode, (x1 - x0, end - start), data, "raw", rawmode, stride, ystep)
+            rows.paste(part, (x0, start - top))
+        return rows
+
+    def materialize(self):
+        """把图像按条带复制到MappedImage中，返回可以修改的图像"""
+        mapped = self.mapped()
+        for top, bottom in self.strips():
+            mapped.write(top, self.read(top, bottom))
+        return mapped
+
+    def to_image(self):
+        return self.materialize().to_image()
+
+
+class MappedImage(StripImage):
+    """
+    保存在内存映射临时文件中的未压缩图像
+
+    像素以numpy.memmap保存在directory中的匿名临时文件里，由操作系统按需换入换出，不占用进程的堆内存；
+    对象释放时临时文件随之删除。支持L、LA、RGB和RGBA模式。
+    """
+
+    # 每像素的字节数；RGB与Pillow内部的存储方式相同，每像素4字节，最后一个字节不使用
+    BANDS = {"L": 1, "LA": 2, "RGB": 4, "RGBA": 4}
+
+    def __init__(self, mode, size, directory, strip_pixels):
+        super().__init__(mode, size, directory, strip_pixels)
+        if mode not in self.BANDS:
+            raise ValueError(f"不支持的图像模式: {mode}")
+        width, height = size
+        shape = (height, width) if mode == "L" else (height, width, self.BANDS[mode])
+        self._file = tempfile.TemporaryFile(dir=directory, suffix=".strip")
+        self.array = np.memmap(self._file, dtype=np.uint8, mode="w+", shape=shape)
+
+    def read(self, top, bottom):
+        return self.crop((0, top, self.width, bottom))
+
+    def write(self, top, rows):
+        """把条带写入第top行开始的位置"""
+        self.paste(rows, (0, top, self.width, top + rows.height))
+
+    def _region(self, box):
+        left, top, right, bottom = box
+        region = self.array[top:bottom, left:right]
+        return region[..., :3] if self.mode == "RGB" else region
+
+    def crop(self, box):
+        """与Image.crop相同，返回区域的副本"""
+        return Image.fromarray(np.array(self._region(box)))
+
+    def paste(self, im, box):
+        """与Image.paste相同，box为完整的区域(左, 上, 右, 下)"""
+        if im.mode != self.mode:
+            im = im.convert(self.mode)
+        self._region(box)[...] = np.asarray(im)
+
+    def to_image(self):
+        """
+        返回用于编码的Image，L、RGB和RGBA图像直接映射临时文件，不复制像素
+        """
+        if self.mode == "RGB":
+            # Image.frombuffer只为RGBX等模式共享内存，而PNG、TIFF等编码器不接受RGBX图像；
+            # RGB图像用底层的map_buffer直接映射（依赖requirements.txt中固定的Pillow版本，
+            # 由tests/test_image_strips.py检查），不可用时复制一次像素
+            try:
+                core = Image.core.map_buffer(self.array, self.size, "raw", 0, ("RGB", 0, 1))
+                return Image.new("RGB", (0, 0))._new(core)
+            except AttributeError:
+                return self.crop((0, 0, self.width, self.height))
+        return Image.fromarray(self.array)
@@ -0,0 +1,148 @@
+import os
+import time
+import shutil
+import threading
+
+
+def _entry_size(path):
+    """文件大小，目录为其中所有文件大小之和"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return total
+
+
+class TempJanitor:
+    """
+    临时空间清理
+
+    定期扫描上传和输出目录中的顶层文件和目录：超过max_age秒未修改的删除；总大小超过max_bytes
+    或磁盘剩余空间低于min_free_bytes时，从最旧的开始删除。修改时间在grace秒以内的条目可能仍在
+    处理或发送中，只按年龄清理时也不会被删除；in_use返回True的路径（仍被引用的上传文件）始终保留。
+    """
+
+    def __init__(self, root, dirs, max_age, max_bytes, min_free_bytes, grace=300, exclude=(), in_use=None):
+        """
+        Args:
+            root: 临时目录，用于检查磁盘剩余空间
+            dirs: 需要清理的目录列表
+            max_age: 条目的最长保留时间（秒）
+            max_bytes: 各目录条目的总大小上限（字节）
+            min_free_bytes: 磁盘剩余空间下限（字节），低于该值时拒绝新请求
+            grace: 最近修改的条目的保护时间（秒）
+            exclude: 不清理的条目名称（由其他组件管理的子目录）
+            in_use: 接收路径并返回其是否仍在使用的函数
+        """
+        self.root = root
+        self.dirs = list(dirs)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.grace = grace
+        self.exclude = set(exclude)
+        self.in_use = in_use
+        self._sweep_lock = threading.Lock()
+        self._stats = {
+            "sweeps": 0,
+            "removed": 0,
+            "bytes_reclaimed": 0,
+            "tracked_bytes": 0,
+            "free_bytes": None,
+            "low_space_rejections": 0,
+            "last_sweep_at": None,
+        }
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.root).free
+
+    def check_space(self):
+        """
+        检查磁盘剩余空间是否足够接收新请求
+
+        Returns:
+            剩余空间不低于min_free_bytes时为True
+        """
+        free = self.free_bytes()
+        self._stats["free_bytes"] = free
+        if free >= self.min_free_bytes:
+            return True
+        self._stats["low_space_rejections"] += 1
+        return False
+
+    def sweep(self, low_space=False):
+        """
+        清理一次，已有清理在进行时直接返回
+
+        Args:
+            low_space: 为True时即使未超过max_bytes也从最旧的条目开始删除，直到剩余空间恢复
+
+        Returns:
+            回收的字节数
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._sweep(low_space)
+        finally:
+            self._sweep_lock.release()
+
+    def _sweep(self, low_space):
+        now = time.time()
+        entries = []
+        for directory in self.dirs:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name in self.exclude or (self.in_use and self.in_use(path)):
+                    continue
+                try:
+                    entries.append((os.path.getmtime(path), _entry_size(path), path))
+                except OSError:
+                    # 条目在扫描期间已被请求自己删除
+                    continue
+        entries.sort()
+
+        reclaimed = 0
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        free = self.free_bytes() if low_space else None
+        for mtime, size, path in entries:
+            age = now - mtime
+            if age <= self.grace:
+                break
+            over_quota = total > self.max_bytes
+            need_space = low_space and free + reclaimed < self.min_free_bytes
+            if age <= self.max_age and not over_quota and not need_space:
+                # 按修改时间排序，后面的条目更新，不会再过期
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+            total -= size
+            reclaimed += size
+            removed += 1
+
+        stats = self._stats
+        stats["sweeps"] += 1
+        stats["removed"] += removed
+        stats["bytes_reclaimed"] += reclaimed
+        stats["tracked_bytes"] = total
+        stats["last_sweep_at"] = now
+        return reclaimed
+
+    def metrics(self):
+        """返回清理次数、回收的字节数和剩余空间"""
+        return dict(
+            self._stats,
+            max_age=self.max_age,
+            max_bytes=self.max_bytes,
+            min_free_bytes=self.min_free_bytes,
+        )
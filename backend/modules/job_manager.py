@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+from collections import deque
+
+from modules.zip_stream import ZipStream, output_arcname, public_error
+
+
+class Job:
+    """后台批量任务的状态"""
+
+    def __init__(self, kind, file_names, jobs_dir):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued, running, completed, failed, cancelled
+        self.error = None
+        self.job_dir = os.path.join(jobs_dir, self.id)
+        self.archive_path = os.path.join(self.job_dir, "result.zip")
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files = [{"name": name, "status": "pending", "error": None} for name in file_names]
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self, ttl):
+        done = sum(1 for item in self.files if item["status"] == "done")
+        failed = sum(1 for item in self.files if item["status"] == "failed")
+        processed = done + failed
+        total = len(self.files)
+
+        # 吞吐量按已处理文件数和运行时间计算
+        throughput = None
+        eta = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if elapsed > 0 and processed:
+                throughput = processed / elapsed
+                if not self.finished:
+                    eta = (total - processed) / throughput
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "total": total,
+            "processed": processed,
+            "completed": done,
+            "failed": failed,
+            "progress": processed / total if total else 1.0,
+            "throughput": round(throughput, 3) if throughput is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.finished_at + ttl if self.finished_at else None,
+            "files": [dict(item) for item in self.files],
+        }
+
+
+class JobManager:
+    """
+    异步批量任务管理
+
+    提交后立即返回任务ID，处理在后台进行：每个文件完成后写入任务目录下的result.zip，
+    并更新逐文件进度；任务结束后结果保留ttl秒，过期后连同任务目录一起删除。
+    """
+
+    def __init__(self, dispatcher, jobs_dir, ttl=3600):
+        """
+        Args:
+            dispatcher: 执行任务的Dispatcher
+            jobs_dir: 任务结果目录
+            ttl: 任务结束后结果的保留时间（秒）
+        """
+        self.dispatcher = dispatcher
+        self.jobs_dir = jobs_dir
+        self.ttl = ttl
+        self._jobs = {}
+
+    def create(self, kind, file_names):
+        """
+        创建任务及其结果目录
+
+        Args:
+            kind: 任务类型（对应的批量路由）
+            file_names: 用户上传时的文件名列表
+
+        Returns:
+            Job
+        """
+        job = Job(kind, file_names, self.jobs_dir)
+        os.makedirs(job.job_dir, exist_ok=True)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        """返回任务，不存在或已过期时返回None"""
+        return self._jobs.get(job_id)
+
+    def start(self, job, results, file_paths, cleanup_paths):
+        """
+        在后台运行任务
+
+        Args:
+            job: create返回的Job
+            results: 产出FileResult的异步迭代器，顺序与file_paths一致
+            file_paths: 保存后的上传文件路径列表
+            cleanup_paths: 任务结束后需要删除的上传文件和输出目录
+        """
+        job.task = asyncio.ensure_future(self._run(job, results, file_paths, cleanup_paths))
+        return job
+
+    async def _run(self, job, results, file_paths, cleanup_paths):
+        # 内容相同的上传文件共用同一路径，按出现顺序对应各自的文件项
+        indexes_by_path = {}
+        for index, path in enumerate(file_paths):
+            indexes_by_path.setdefault(path, deque()).append(index)
+        zip_stream = ZipStream()
+        try:
+            async with self.dispatcher.slot(f"job:{job.kind}"):
+                job.status = "running"
+                job.started_at = time.time()
+                with open(job.archive_path, "wb") as archive:
+                    try:
+                        async for result in results:
+                            item = job.files[indexes_by_path[result.source].popleft()]
+                            if result.error:
+                                item["status"] = "failed"
+                                item["error"] = public_error(item["name"], result.source, result.error)
+                                continue
+
+                            arcname = output_arcname(item["name"], result.source, result.output)
+                            await self.dispatcher.run_io(self._write_chunks, archive, zip_stream.add_file(result.output, arcname))
+                            item["status"] = "done"
+                    finally:
+                        # 任务被取消时同时取消尚未开始的文件
+                        await results.aclose()
+
+                    failures = [f"{item['name']}: {item['error']}" for item in job.files if item["status"] == "failed"]
+                    if failures:
+                        self._write_chunks(archive, zip_stream.add_bytes("\n".join(failures) + "\n", "errors.txt"))
+                    archive.write(zip_stream.close())
+
+                job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self.dispatcher.submit_io(_remove_paths, cleanup_paths)
+
+    @staticmethod
+    def _write_chunks(archive, chunks):
+        for chunk in chunks:
+            archive.write(chunk)
+
+    def delete(self, job_id):
+        """
+        取消并删除任务
+
+        Returns:
+            任务是否存在
+        """
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        self.dispatcher.submit_io(_remove_paths, [job.job_dir])
+        return True
+
+    def describe(self, job):
+        """返回任务状态字典"""
+        return job.to_dict(self.ttl)
+
+    def purge_expired(self):
+        """删除结果已过期的任务，返回删除的任务数"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at + self.ttl <= now]
+        for job_id in expired:
+            self.delete(job_id)
+        return len(expired)
+
+    def metrics(self):
+        """按状态统计任务数量"""
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"total": len(self._jobs), "by_status": counts, "ttl": self.ttl}
+
+
+def _remove_paths(paths):
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class _Entry:
+    """缓存中的一个结果文件"""
+
+    __slots__ = ("path", "size", "created_at", "extra")
+
+    def __init__(self, path, size, created_at, extra):
+        self.path = path
+        self.size = size
+        self.created_at = created_at
+        self.extra = extra
+
+
+class CacheWriter:
+    """
+    边生成边写入缓存的结果文件，用于流式响应：全部写完后commit加入缓存，中途失败或取消时discard
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.temp_path = os.path.join(cache.cache_dir, f"{key}.{uuid.uuid4().hex}.part")
+        os.makedirs(cache.cache_dir, exist_ok=True)
+        self._file = open(self.temp_path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+
+    def tee(self, chunks):
+        """写入缓存的同时原样产出数据块，在读取数据块的I/O线程中完成写入"""
+        for chunk in chunks:
+            self._file.write(chunk)
+            yield chunk
+
+    def commit(self, extra=None):
+        self._file.close()
+        return self.cache._add(self.key, self.temp_path, extra)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class ResultCache:
+    """
+    按内容寻址的处理结果缓存
+
+    键为路由、规范化后的处理参数和每个输入文件内容的SHA-256（上传时已经计算）；
+    结果文件保存在cache_dir中，总大小超过max_bytes时按最近最少使用淘汰，超过ttl秒的结果视为过期。
+    索引只保存在内存中，服务启动时清理临时目录，缓存随之清空。
+    """
+
+    def __init__(self, cache_dir, max_bytes, ttl=3600):
+        """
+        Args:
+            cache_dir: 结果文件目录
+            max_bytes: 缓存总大小上限（字节），为0时不缓存
+            ttl: 结果的有效时间（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, route, digests, params):
+        """
+        计算缓存键
+
+        Args:
+            route: 路由名称
+            digests: 输入文件内容的SHA-256列表，顺序有意义
+            params: 影响结果的参数，可以被JSON序列化
+
+        Returns:
+            十六进制SHA-256字符串
+        """
+        digest = hashlib.sha256()
+        digest.update(route.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+        for file_digest in digests:
+            digest.update(b"\0")
+            digest.update(file_digest.encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        查找缓存的结果
+
+        Returns:
+            (结果文件路径, 附加数据)，未命中或已过期时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created_at > self.ttl:
+                self._remove(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry.path, entry.extra
+
+    def put(self, key, path, extra=None):
+        """
+        把结果文件加入缓存，原文件保持不变；同一文件系统中使用硬链接，不复制内容
+
+        Args:
+            key: key()返回的缓存键
+            path: 结果文件路径
+            extra: 与结果一起返回的附加数据（如响应头中的统计信息）
+
+        Returns:
+            缓存中的文件路径，未缓存时返回None
+        """
+        if not self.enabled or not os.path.isfile(path):
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.part")
+        try:
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copyfile(path, temp_path)
+        return self._add(key, temp_path, extra)
+
+    def writer(self, key):
+        """返回逐块写入结果文件的CacheWriter，缓存未启用时返回None"""
+        if not self.enabled:
+            return None
+        return CacheWriter(self, key)
+
+    def _add(self, key, temp_path, extra):
+        size = os.path.getsize(temp_path)
+        if size > self.max_bytes:
+            os.remove(temp_path)
+            return None
+
+        path = os.path.join(self.cache_dir, key)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            os.replace(temp_path, path)
+            self._entries[key] = _Entry(path, size, time.time(), extra)
+            self._bytes += size
+            self._stats["stores"] += 1
+            self._evict()
+        return path
+
+    def _evict(self):
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]:
+            self._remove(key)
+            self._stats["expired"] += 1
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        # 正在发送的文件已经打开，删除后仍可读完
+        if os.path.exists(entry.path):
+            os.remove(entry.path)
+
+    def metrics(self):
+        """返回命中率、条目数和占用空间"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_rate=round(self._stats["hits"] / lookups, 3) if lookups else None,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+            )
@@ -0,0 +1,230 @@
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+# 超过该长度的查找文本不构建前缀树，避免正则表达式嵌套过深
+MAX_TRIE_KEY_LENGTH = 200
+
+
+def _literal_pattern(keys):
+    """
+    把多个普通文本合并为一个正则表达式，同一位置优先匹配最长的文本
+
+    规则较短时按前缀树生成（如"ab(?:c|d)?"），正则引擎在每个位置只需沿公共前缀比较一次，
+    规则很多时比逐个尝试的交替表达式快得多
+    """
+    if max(len(key) for key in keys) > MAX_TRIE_KEY_LENGTH:
+        # 长的规则排在前面，保证同一位置优先匹配最长的文本
+        return "|".join(re.escape(key) for key in sorted(keys, key=len, reverse=True))
+
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = None  # 结束标记
+
+    def build(node):
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) > 1:
+            body = "(?:" + "|".join(branches) + ")"
+        elif terminal:
+            body = f"(?:{branches[0]})"
+        else:
+            return branches[0]
+        # 贪婪的可选分组先尝试更长的文本
+        return body + "?" if terminal else body
+
+    return build(trie)
+
+
+class _LiteralGroup:
+    """
+    可以在同一趟中同时替换的普通文本规则
+
+    新规则的查找文本与组内已有的查找文本互不重叠（不包含、不被包含、首尾不相接）时，两者在原文本中的
+    匹配不会冲突；与组内已有的替换文本也互不重叠时，前面的替换不会产生新的匹配，同时替换与逐条依次替换
+    的结果相同。删除文本的规则会让两侧的文本相邻，之后只能合并单字符的查找文本。
+    """
+
+    def __init__(self):
+        self.rules = []
+        self._texts = set()
+        self._lengths = set()
+        self._prefixes = set()
+        self._suffixes = set()
+        # 组内全部文本以\0连接，用于判断查找文本是否被某个文本包含
+        self._joined = ""
+        self._deletes = False
+        self._closed = False
+
+    def accepts(self, find_text):
+        if not self.rules:
+            return True
+        if self._closed or len(find_text) > MAX_TRIE_KEY_LENGTH:
+            return False
+        if self._deletes and len(find_text) > 1:
+            return False
+        if find_text in self._joined:
+            return False
+        for length in self._lengths:
+            if any(find_text[start:start + length] in self._texts for start in range(len(find_text) - length + 1)):
+                return False
+        return not any(
+            find_text[-size:] in self._prefixes or find_text[:size] in self._suffixes
+            for size in range(1, len(find_text))
+        )
+
+    def add(self, find_text, replace_text):
+        self.rules.append((find_text, replace_text))
+        self._deletes = self._deletes or not replace_text
+        for text in (find_text, replace_text):
+            if not text or text in self._texts:
+                continue
+            if len(text) > MAX_TRIE_KEY_LENGTH:
+                # 很长的文本不建立索引，之后的规则放入下一趟
+                self._closed = True
+                continue
+            self._texts.add(text)
+            self._lengths.add(len(text))
+            self._prefixes.update(text[:size] for size in range(1, len(text)))
+            self._suffixes.update(text[-size:] for size in range(1, len(text)))
+            self._joined += "\0" + text
+
+
+class TextReplacer:
+    """
+    编译后的批量替换引擎
+
+    规则按顺序依次应用，后面的规则作用于前面规则替换后的文本，与逐条调用str.replace或re.sub的结果相同。
+    相邻的普通文本规则只要互不影响（见_LiteralGroup）就合并为一趟：用一个前缀树正则表达式配合查找字典，
+    一次扫描完成这些规则的替换；正则规则每条单独一趟。
+    """
+
+    def __init__(self, replacements, use_regex=False):
+        """
+        Args:
+            replacements: 替换规则列表，每个规则是一个(find_text, replace_text)元组
+            use_regex: 是否使用正则表达式
+        """
+        self.use_regex = use_regex
+        # 每一趟是一个(编译后的模式, 替换函数或替换模板)元组
+        self._passes = []
+
+        if use_regex:
+            for find_text, replace_text in replacements:
+                if find_text:
+                    self._passes.append((re.compile(find_text), replace_text))
+        else:
+            groups = []
+            for find_text, replace_text in replacements:
+                if not find_text:
+                    continue
+                if not groups or not groups[-1].accepts(find_text):
+                    groups.append(_LiteralGroup())
+                groups[-1].add(find_text, replace_text)
+            for group in groups:
+                lookup = dict(group.rules)
+                pattern = re.compile(_literal_pattern(list(lookup)))
+                self._passes.append((pattern, lambda match, lookup=lookup: lookup[match.group(0)]))
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _compile_cached(replacements, use_regex):
+        return TextReplacer(replacements, use_regex)
+
+    @staticmethod
+    def compile(replacements, use_regex=False):
+        """
+        编译替换规则，相同的规则集在同一进程内只编译一次
+
+        Args:
+            replacements: 替换规则列表，每个规则是一个(find_text, replace_text)元组
+            use_regex: 是否使用正则表达式
+
+        Returns:
+            TextReplacer实例
+        """
+        return TextReplacer._compile_cached(
+            tuple((find_text, replace_text) for find_text, replace_text in replacements),
+            bool(use_regex),
+        )
+
+    def __bool__(self):
+        return bool(self._passes)
+
+    def search(self, text):
+        """判断文本中是否存在任意规则的匹配"""
+        return any(pattern.search(text) for pattern, _ in self._passes)
+
+    def apply(self, text):
+        """
+        对文本应用全部替换规则
+
+        Args:
+            text: 原始文本
+
+        Returns:
+            替换后的文本，没有匹配时返回原对象
+        """
+        for pattern, replacement in self._passes:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def replace_segments(self, segments):
+        """
+        对被分成多段的文本（如Word段落中的各个run）应用全部替换规则，尽量保持分段不变
+
+        匹配按拼接后的文本查找，可以跨越分段；替换结果放入匹配起点所在的分段，
+        匹配覆盖的其余分段只删除被匹配的字符，与匹配无关的分段保持原样。
+
+        Args:
+            segments: 文本分段列表
+
+        Returns:
+            替换后的分段列表（长度与输入相同），没有匹配时返回None
+        """
+        changed = False
+        for pattern, replacement in self._passes:
+            text = "".join(segments)
+            matches = list(pattern.finditer(text))
+            if not matches:
+                continue
+            changed = True
+            if len(segments) == 1:
+                segments = [pattern.sub(replacement, text)]
+                continue
+
+            starts = []
+            offset = 0
+            for segment in segments:
+                starts.append(offset)
+                offset += len(segment)
+            pieces = [[] for _ in segments]
+
+            def copy(begin, end):
+                # 把原文本[begin, end)按所在分段放回
+                index = bisect_right(starts, begin) - 1
+                while begin < end:
+                    segment_end = starts[index] + len(segments[index])
+                    if segment_end > begin:
+                        pieces[index].append(text[begin:min(end, segment_end)])
+                        begin = segment_end
+                    index += 1
+
+            position = 0
+            for match in matches:
+                copy(position, match.start())
+                if callable(replacement):
+                    new_text = replacement(match)
+                else:
+                    new_text = match.expand(replacement)
+                pieces[max(bisect_right(starts, match.start()) - 1, 0)].append(new_text)
+                position = match.end()
+            copy(position, len(text))
+            segments = ["".join(piece) for piece in pieces]
+
+        return segments if changed else None
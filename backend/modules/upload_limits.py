@@ -0,0 +1,189 @@
+import json
+import asyncio
+
+
+class UploadRejected(Exception):
+    """上传超出限制，中止接收请求体"""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class _FileCounter:
+    """
+    在multipart请求体流过时统计文件数：每个部分以分隔符开头，头部中带有filename的部分是文件
+    """
+
+    # 部件头部的最大长度，超出时不再等待头部结束
+    MAX_HEADER_BYTES = 16 * 1024
+
+    def __init__(self, boundary):
+        self.delimiter = b"--" + boundary
+        self.files = 0
+        self._pending = b""
+
+    def feed(self, body):
+        data = self._pending + body
+        delimiter = self.delimiter
+        position = 0
+        while True:
+            index = data.find(delimiter, position)
+            if index == -1:
+                # 保留末尾，跨块的分隔符也能被找到
+                self._pending = data[max(position, len(data) - len(delimiter) + 1):]
+                return self.files
+            header_start = index + len(delimiter)
+            header_end = data.find(b"\r\n\r\n", header_start)
+            if header_end == -1 and len(data) - header_start < self.MAX_HEADER_BYTES:
+                # 头部尚未接收完整（或为结束分隔符），等待下一块
+                self._pending = data[index:]
+                return self.files
+            if header_end == -1:
+                header_end = header_start + self.MAX_HEADER_BYTES
+            if b"filename=" in data[header_start:header_end]:
+                self.files += 1
+            position = header_end
+
+
+class UploadLimits:
+    """上传限制的配置和统计，由UploadLimitMiddleware使用"""
+
+    def __init__(self, max_bytes, max_files, max_concurrent=8, disk_guard=None):
+        """
+        Args:
+            max_bytes: 每个请求体的最大字节数
+            max_files: 每个请求最多上传的文件数
+            max_concurrent: 同时接收请求体的最大上传数
+            disk_guard: 返回临时空间是否足够的函数，不足时拒绝新的上传
+        """
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_concurrent = max_concurrent
+        self.disk_guard = disk_guard
+        self.semaphore = None
+        self.stats = {"receiving": 0, "waiting": 0, "completed": 0, "rejected": 0, "bytes": 0}
+
+    def metrics(self):
+        """返回正在接收和排队的上传数以及拒绝次数"""
+        return dict(self.stats, max_bytes=self.max_bytes, max_files=self.max_files,
+                    max_concurrent=self.max_concurrent)
+
+
+class UploadLimitMiddleware:
+    """
+    限制上传请求的ASGI中间件
+
+    在请求体流入表单解析之前检查：Content-Length超出上限的请求直接拒绝；请求体按块计数，
+    超出字节数或文件数上限时立即中止，不会先写满内存或临时目录。同时接收请求体的上传数有上限，
+    超出的请求在读取请求体之前排队，由TCP流控让客户端放慢发送。超出限制时返回413，
+    临时空间不足时返回503。
+    """
+
+    def __init__(self, app, limits):
+        """
+        Args:
+            app: 下层ASGI应用
+            limits: UploadLimits
+        """
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        limits = self.limits
+        stats = limits.stats
+        too_large = f"请求体超过上限{limits.max_bytes // (1024 * 1024)}MB"
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limits.max_bytes:
+            stats["rejected"] += 1
+            await self._reject(send, too_large)
+            return
+        if limits.disk_guard is not None and not limits.disk_guard():
+            stats["rejected"] += 1
+            await self._reject(send, "服务器临时空间不足，请稍后重试", 503)
+            return
+
+        # 在表单解析之前统计multipart请求体中的文件数
+        file_counter = None
+        content_type = headers.get(b"content-type", b"")
+        if content_type.startswith(b"multipart/form-data"):
+            for param in content_type.split(b";")[1:]:
+                name, _, value = param.strip().partition(b"=")
+                if name.lower() == b"boundary" and value.strip(b'"'):
+                    file_counter = _FileCounter(value.strip(b'"'))
+
+        if limits.semaphore is None:
+            # 信号量在事件循环中首次使用时创建
+            limits.semaphore = asyncio.Semaphore(limits.max_concurrent)
+        stats["waiting"] += 1
+        try:
+            await limits.semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["receiving"] += 1
+
+        state = {"bytes": 0, "receiving": True, "started": False, "rejection": None}
+
+        def finish_receiving():
+            if state["receiving"]:
+                state["receiving"] = False
+                stats["receiving"] -= 1
+                limits.semaphore.release()
+
+        def reject(detail):
+            state["rejection"] = detail
+            raise UploadRejected(detail)
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] != "http.request":
+                finish_receiving()
+                return message
+
+            body = message.get("body", b"")
+            state["bytes"] += len(body)
+            stats["bytes"] += len(body)
+            if state["bytes"] > limits.max_bytes:
+                reject(too_large)
+            if file_counter and body and file_counter.feed(body) > limits.max_files:
+                reject(f"上传文件数超过上限{limits.max_files}")
+            if not message.get("more_body", False):
+                # 请求体接收完毕，处理期间不再占用上传名额
+                finish_receiving()
+            return message
+
+        async def tracked_send(message):
+            # 表单解析失败时FastAPI会返回400，超出限制导致的失败改为返回413
+            if state["rejection"] is not None:
+                if message["type"] == "http.response.start" and not state["started"]:
+                    state["started"] = True
+                    await self._reject(send, state["rejection"])
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadRejected:
+            if state["started"]:
+                raise
+            await self._reject(send, state["rejection"])
+        finally:
+            finish_receiving()
+            stats["rejected" if state["rejection"] is not None else "completed"] += 1
+
+    @staticmethod
+    async def _reject(send, detail, status=413):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,136 @@
+import os
+import uuid
+import hashlib
+import threading
+
+from modules.zip_stream import CHUNK_SIZE
+
+
+class UploadStore:
+    """
+    按内容寻址的上传文件存储
+
+    上传的文件在写入磁盘的同时计算SHA-256，以"摘要+扩展名"命名；内容和扩展名都相同的文件
+    只保存一份，同一批次或并发请求中的重复文件共用同一路径，并按引用计数在最后一个使用者
+    释放后删除。处理器只读取上传文件，输出写入各自请求的输出目录，共用的文件不会被修改。
+    """
+
+    def __init__(self, upload_dir, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            upload_dir: 上传文件目录
+            chunk_size: 复制和计算摘要时每次读取的字节数
+        """
+        self.upload_dir = upload_dir
+        self.chunk_size = chunk_size
+        # 文件路径 -> [摘要, 引用数, 文件大小]
+        self._blobs = {}
+        self._lock = threading.Lock()
+        self._stats = {"saved": 0, "deduplicated": 0, "bytes_saved": 0}
+
+    def save(self, file_obj, filename):
+        """
+        保存上传的文件
+
+        Args:
+            file_obj: 可读取的文件对象（UploadFile.file）
+            filename: 用户上传时的文件名，只使用其扩展名
+
+        Returns:
+            保存后的文件路径，调用方用完后需要调用release
+        """
+        os.makedirs(self.upload_dir, exist_ok=True)
+        temp_path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in self._read_chunks(file_obj):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            hex_digest = digest.hexdigest()
+            path = os.path.join(self.upload_dir, hex_digest + os.path.splitext(filename or "")[1])
+            with self._lock:
+                blob = self._blobs.get(path)
+                if blob is not None:
+                    blob[1] += 1
+                    self._stats["deduplicated"] += 1
+                    self._stats["bytes_saved"] += size
+                else:
+                    os.replace(temp_path, path)
+                    self._blobs[path] = [hex_digest, 1, size]
+                    self._stats["saved"] += 1
+            return path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _read_chunks(self, file_obj):
+        """按chunk_size读取文件，复用同一块缓冲区，不为每块分配新的bytes对象"""
+        readinto = getattr(file_obj, "readinto", None)
+        if readinto is None:
+            while True:
+                chunk = file_obj.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        while True:
+            length = readinto(buffer)
+            if not length:
+                return
+            yield view[:length]
+
+    def owns(self, path):
+        """判断路径是否为本存储中的上传文件"""
+        with self._lock:
+            return path in self._blobs
+
+    def digest(self, path):
+        """返回文件内容的SHA-256，不在本存储中的文件重新计算"""
+        with self._lock:
+            blob = self._blobs.get(path)
+        if blob is not None:
+            return blob[0]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def release(self, paths):
+        """
+        释放上传文件的引用，引用数归零时删除文件
+
+        Args:
+            paths: save返回的路径列表，每次save对应一次释放；None和不在本存储中的路径会被忽略
+        """
+        for path in paths:
+            with self._lock:
+                blob = self._blobs.get(path)
+                if blob is None:
+                    continue
+                blob[1] -= 1
+                if blob[1] > 0:
+                    continue
+                del self._blobs[path]
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def metrics(self):
+        """返回保存的文件数、引用数和去重节省的字节数"""
+        with self._lock:
+            return dict(
+                self._stats,
+                blobs=len(self._blobs),
+                references=sum(blob[1] for blob in self._blobs.values()),
+                bytes=sum(blob[2] for blob in self._blobs.values()),
+            )
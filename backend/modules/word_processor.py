@@ -1,13 +1,28 @@
 import os
 import re
+import csv
+import json
+import shutil
+import tempfile
+import contextlib
 from docx import Document
+from docx.text.run import Run
 import zipfile
-import tempfile
-import shutil
+
+from modules.text_replacer import TextReplacer
+from modules.docx_stream import DocxStream, UnsupportedDocument
+from modules.docx_index import DocumentIndex, register_note_parts
+from modules.docx_merger import DocxMerger
 
 class WordProcessor:
+    # 提取内容时正文之外各文本部分的标题
+    STORY_TITLES = {"header": "页眉", "footer": "页脚", "footnotes": "脚注", "endnotes": "尾注"}
+    
+    # 提取内容的输出格式及文件扩展名
+    EXTRACT_FORMATS = {"text": ".txt", "markdown": ".md", "json": ".json", "csv": ".csv", "ndjson": ".ndjson"}
+    
     @staticmethod
-    def find_replace(file_path, find_text, replace_text, use_regex=False, output_dir=None):
+    def find_replace(file_path, find_text, replace_text, use_regex=False, output_dir=None, engine="xml"):
         """
         在Word文档中查找并替换文本
         
@@ -17,49 +32,20 @@ class WordProcessor:
             replace_text: 替换的文本
             use_regex: 是否使用正则表达式
             output_dir: 输出目录，如果为None则覆盖原文件
+            engine: 处理引擎，"xml"直接改写DOCX中的XML，"docx"使用python-docx加载完整文档
             
         Returns:
             处理后的文件路径
         """
         try:
-            # 创建输出文件路径
-            if output_dir:
-                output_path = os.path.join(output_dir, os.path.basename(file_path))
-            else:
-                output_path = file_path
-                
-            # 如果输出路径与输入路径不同，先复制文件
-            if output_path != file_path:
-                shutil.copy2(file_path, output_path)
-            
-            # 打开Word文档
-            doc = Document(output_path)
-            
-            # 替换文本
-            for paragraph in doc.paragraphs:
-                if use_regex:
-                    paragraph.text = re.sub(find_text, replace_text, paragraph.text)
-                else:
-                    paragraph.text = paragraph.text.replace(find_text, replace_text)
-            
-            # 替换表格中的文本
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            if use_regex:
-                                paragraph.text = re.sub(find_text, replace_text, paragraph.text)
-                            else:
-                                paragraph.text = paragraph.text.replace(find_text, replace_text)
-            
-            # 保存文档
-            doc.save(output_path)
-            return output_path
+            return WordProcessor.apply_replacements(
+                file_path, [(find_text, replace_text)], use_regex, output_dir, engine
+            )
         except Exception as e:
             raise Exception(f"处理Word文档时出错: {str(e)}")
     
     @staticmethod
-    def batch_find_replace(file_paths, replacements, use_regex=False, output_dir=None):
+    def batch_find_replace(file_paths, replacements, use_regex=False, output_dir=None, engine="xml"):
         """
         批量处理多个Word文档的查找替换
         
@@ -68,46 +54,110 @@ class WordProcessor:
             replacements: 替换规则列表，每个规则是一个(find_text, replace_text)元组
             use_regex: 是否使用正则表达式
             output_dir: 输出目录
+            engine: 处理引擎，"xml"或"docx"
             
         Returns:
             处理后的文件路径列表
         """
-        processed_files = []
-        
-        for file_path in file_paths:
-            # 为每个文件创建一个副本
-            if output_dir:
-                output_path = os.path.join(output_dir, os.path.basename(file_path))
-                shutil.copy2(file_path, output_path)
-            else:
-                output_path = file_path
-            
-            # 应用所有替换规则
-            doc = Document(output_path)
-            
-            for find_text, replace_text in replacements:
-                # 替换段落中的文本
-                for paragraph in doc.paragraphs:
-                    if use_regex:
-                        paragraph.text = re.sub(find_text, replace_text, paragraph.text)
-                    else:
-                        paragraph.text = paragraph.text.replace(find_text, replace_text)
-                
-                # 替换表格中的文本
-                for table in doc.tables:
-                    for row in table.rows:
-                        for cell in row.cells:
-                            for paragraph in cell.paragraphs:
-                                if use_regex:
-                                    paragraph.text = re.sub(find_text, replace_text, paragraph.text)
-                                else:
-                                    paragraph.text = paragraph.text.replace(find_text, replace_text)
-            
-            # 保存文档
-            doc.save(output_path)
-            processed_files.append(output_path)
-        
-        return processed_files
+        return [
+            WordProcessor.apply_replacements(file_path, replacements, use_regex, output_dir, engine)
+            for file_path in file_paths
+        ]
+    
+    @staticmethod
+    def apply_replacements(file_path, replacements, use_regex=False, output_dir=None, engine="xml"):
+        """
+        对单个Word文档应用全部替换规则，供批量处理和进程池按文件调用
+        
+        Args:
+            file_path: Word文档路径
+            replacements: 替换规则列表，每个规则是一个(find_text, replace_text)元组
+            use_regex: 是否使用正则表达式
+            output_dir: 输出目录，如果为None则覆盖原文件
+            engine: 处理引擎，"xml"直接改写正文、页眉、页脚和脚注的XML，其余部件原样复制；
+                    文档结构不支持时自动改用"docx"
+            
+        Returns:
+            处理后的文件路径
+        """
+        # 规则在同一进程内只编译一次，每个文档只遍历一次
+        replacer = TextReplacer.compile(replacements, use_regex)
+        
+        # 创建输出文件路径，直接从源文件加载并保存到输出路径，处理失败时不会留下不完整的副本
+        if output_dir:
+            output_path = os.path.join(output_dir, os.path.basename(file_path))
+        else:
+            output_path = file_path
+        
+        if engine == "xml":
+            try:
+                with DocxStream(file_path) as stream:
+                    stream.replace(output_path, replacer)
+                return output_path
+            except (UnsupportedDocument, zipfile.BadZipFile):
+                pass
+        elif engine != "docx":
+            raise ValueError(f"不支持的处理引擎: {engine}")
+        
+        # 应用所有替换规则，脚注和尾注部件在打开文档之前注册才能被修改
+        register_note_parts()
+        doc = Document(file_path)
+        WordProcessor._replace_in_document(doc, replacer)
+        
+        # 保存文档
+        doc.save(output_path)
+        return output_path
+    
+    @staticmethod
+    def _replace_in_document(doc, replacer):
+        """
+        单次遍历文档，对每个段落应用全部替换规则
+        
+        覆盖正文、嵌套表格、文本框、页眉、页脚、脚注和尾注，每个段落只处理一次；
+        只改写与匹配重叠的run，其余run（及其格式）保持不变，没有匹配的段落不做任何修改
+        
+        Args:
+            doc: Document对象
+            replacer: 编译后的TextReplacer
+            
+        Returns:
+            发生变化的段落数
+        """
+        changed = 0
+        if not replacer:
+            return changed
+        
+        for paragraph in DocumentIndex(doc).paragraphs():
+            if WordProcessor._replace_in_paragraph(paragraph, replacer):
+                changed += 1
+        
+        return changed
+    
+    @staticmethod
+    def _replace_in_paragraph(paragraph, replacer):
+        """
+        在段落的run中替换文本，匹配可以跨越多个run
+        
+        Args:
+            paragraph: Paragraph对象
+            replacer: 编译后的TextReplacer
+            
+        Returns:
+            段落是否发生变化
+        """
+        # 与paragraph.text一致，包含超链接中的run
+        runs = [Run(r, paragraph) for r in paragraph._p.xpath("./w:r | ./w:hyperlink/w:r")]
+        texts = [run.text for run in runs]
+        new_texts = replacer.replace_segments(texts)
+        if new_texts is None:
+            return False
+        
+        changed = False
+        for run, text, new_text in zip(runs, texts, new_texts):
+            if new_text != text:
+                run.text = new_text
+                changed = True
+        return changed
     
     @staticmethod
     def merge_documents(file_paths, output_path):
@@ -122,46 +172,37 @@ class WordProcessor:
             合并后的文件路径
         """
         try:
-            # 创建一个新文档或使用第一个文档作为基础
-            if file_paths:
-                merged_doc = Document(file_paths[0])
-                
-                # 从第二个文档开始合并
-                for i in range(1, len(file_paths)):
-                    # 添加分页符
-                    merged_doc.add_page_break()
-                    
-                    # 打开当前文档
-                    doc = Document(file_paths[i])
-                    
-                    # 复制段落
-                    for paragraph in doc.paragraphs:
-                        merged_para = merged_doc.add_paragraph()
-                        merged_para.text = paragraph.text
-                        merged_para.style = paragraph.style
-                    
-                    # 复制表格
-                    for table in doc.tables:
-                        # 创建新表格
-                        rows = len(table.rows)
-                        cols = len(table.rows[0].cells) if rows > 0 else 0
-                        merged_table = merged_doc.add_table(rows=rows, cols=cols)
-                        
-                        # 复制单元格内容
-                        for i, row in enumerate(table.rows):
-                            for j, cell in enumerate(row.cells):
-                                merged_table.rows[i].cells[j].text = cell.text
-                
-                # 保存合并后的文档
-                merged_doc.save(output_path)
-                return output_path
-            else:
+            if not file_paths:
                 raise Exception("没有提供要合并的文档")
+            
+            # 把各文档的正文元素整体移入第一个文档，保留格式、图片、编号和节属性
+            return DocxMerger().merge(file_paths, output_path)
         except Exception as e:
             raise Exception(f"合并Word文档时出错: {str(e)}")
     
     @staticmethod
-    def extract_content(file_path, output_path, extract_type="text"):
+    def iter_content(file_path, extract_type="all"):
+        """
+        直接解析DOCX中的XML，按文档顺序流式产出段落和表格行，不加载完整文档
+        
+        Args:
+            file_path: Word文档路径
+            extract_type: 提取类型，可以是"text"（段落）、"tables"（表格行）或"all"
+            
+        Yields:
+            段落：{"story", "type": "paragraph", "style", "text"}
+            表格行：{"story", "type": "row", "table", "row", "cells"}，合并单元格的内容只出现一次
+        """
+        if extract_type not in ("text", "tables", "all"):
+            raise ValueError(f"不支持的提取类型: {extract_type}")
+        
+        with DocxStream(file_path) as stream:
+            for item in stream.iter_content():
+                if extract_type == "all" or (item["type"] == "paragraph") == (extract_type == "text"):
+                    yield item
+    
+    @staticmethod
+    def extract_content(file_path, output_path, extract_type="text", output_format="text"):
         """
         从Word文档中提取内容
         
@@ -169,31 +210,155 @@ class WordProcessor:
             file_path: Word文档路径
             output_path: 输出文件路径
             extract_type: 提取类型，可以是"text"、"tables"或"all"
+            output_format: 输出格式，"text"（先文本后表格的纯文本）、"markdown"（按文档顺序）、
+                           "json"、"csv"（只包含表格行）或"ndjson"（每行一个段落或表格行）
             
         Returns:
             提取的内容文件路径
         """
         try:
-            doc = Document(file_path)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                # 提取文本
-                if extract_type in ["text", "all"]:
-                    f.write("# 文档文本内容\n\n")
-                    for paragraph in doc.paragraphs:
-                        if paragraph.text.strip():
-                            f.write(paragraph.text + "\n")
-                    f.write("\n\n")
-                
-                # 提取表格
-                if extract_type in ["tables", "all"]:
-                    f.write("# 文档表格内容\n\n")
-                    for i, table in enumerate(doc.tables):
-                        f.write(f"## 表格 {i+1}\n\n")
-                        for row in table.rows:
-                            f.write("| " + " | ".join(cell.text for cell in row.cells) + " |\n")
-                        f.write("\n\n")
+            if output_format not in WordProcessor.EXTRACT_FORMATS:
+                raise ValueError(f"不支持的输出格式: {output_format}")
+            if output_format == "csv" and extract_type == "text":
+                raise ValueError("CSV格式只能提取表格")
+            
+            writer = getattr(WordProcessor, f"_write_{output_format}")
+            with open(output_path, 'w', encoding='utf-8', newline='') as f:
+                writer(file_path, f, extract_type)
             
             return output_path
         except Exception as e:
-            raise Exception(f"提取Word文档内容时出错: {str(e)}")
\ No newline at end of file
+            raise Exception(f"提取Word文档内容时出错: {str(e)}")
+    
+    @staticmethod
+    def extract_to_dir(file_path, output_dir, extract_type="all", output_format="ndjson"):
+        """
+        提取内容到输出目录中与源文件同名的文件，供批量提取按文件调用
+        
+        Returns:
+            提取的内容文件路径
+        """
+        file_name = os.path.splitext(os.path.basename(file_path))[0]
+        output_path = os.path.join(output_dir, file_name + WordProcessor.EXTRACT_FORMATS.get(output_format, ""))
+        return WordProcessor.extract_content(file_path, output_path, extract_type, output_format)
+    
+    @staticmethod
+    @contextlib.contextmanager
+    def _tables_output(f, extract_type):
+        """
+        表格部分的写入目标，纯文本和JSON输出中表格部分位于文本部分之后
+        
+        提取"all"时文档只解析一次，表格部分先写入输出目录的临时文件，退出时追加到f
+        """
+        if extract_type != "all":
+            yield f
+            return
+        with tempfile.TemporaryFile("w+", encoding="utf-8", newline="", dir=os.path.dirname(f.name) or None, suffix=".tables") as spool:
+            yield spool
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+    
+    @staticmethod
+    def _write_text(file_path, f, extract_type):
+        # 文本：表格外的段落，包括文本框；页眉、页脚、脚注和尾注单独列出
+        # 表格：包括嵌套表格，合并单元格的内容只输出一次
+        with WordProcessor._tables_output(f, extract_type) as tables_f:
+            if extract_type in ["text", "all"]:
+                f.write("# 文档文本内容\n\n")
+            if extract_type in ["tables", "all"]:
+                tables_f.write("# 文档表格内容\n\n")
+            
+            story = "body"
+            table = None
+            for item in WordProcessor.iter_content(file_path, extract_type):
+                if item["type"] == "paragraph":
+                    if item["story"] != story:
+                        story = item["story"]
+                        f.write(f"\n## {WordProcessor.STORY_TITLES[story]}\n\n")
+                    f.write(item["text"] + "\n")
+                    continue
+                
+                if item["table"] != table:
+                    if table is not None:
+                        tables_f.write("\n\n")
+                    table = item["table"]
+                    tables_f.write(f"## 表格 {table}\n\n")
+                tables_f.write("| " + " | ".join(item["cells"]) + " |\n")
+            
+            if extract_type in ["text", "all"]:
+                f.write("\n\n")
+            if table is not None:
+                tables_f.write("\n\n")
+    
+    @staticmethod
+    def _write_markdown(file_path, f, extract_type):
+        story = "body"
+        table = None
+        for item in WordProcessor.iter_content(file_path, extract_type):
+            if item["story"] != story:
+                story = item["story"]
+                table = None
+                f.write(f"\n## {WordProcessor.STORY_TITLES[story]}\n\n")
+            
+            if item["type"] == "paragraph":
+                if table is not None:
+                    f.write("\n")
+                    table = None
+                # 标题样式转换为Markdown标题
+                heading = re.match(r"(?i)(?:heading|标题)\s*(\d)$", item["style"] or "")
+                if heading:
+                    f.write("#" * int(heading.group(1)) + " ")
+                elif item["style"] == "Title":
+                    f.write("# ")
+                f.write(item["text"].replace("\n", "  \n") + "\n\n")
+                continue
+            
+            cells = [cell.replace("|", "\\|").replace("\n", "<br>") for cell in item["cells"]]
+            if item["table"] != table and table is not None:
+                f.write("\n")
+            f.write("| " + " | ".join(cells) + " |\n")
+            # 每个表格以第一行作为表头
+            if item["table"] != table:
+                table = item["table"]
+                f.write("|" + " --- |" * len(cells) + "\n")
+        if table is not None:
+            f.write("\n")
+    
+    @staticmethod
+    def _write_json(file_path, f, extract_type):
+        # 逐项写出，不在内存中构建完整的JSON对象
+        paragraphs = extract_type in ["text", "all"]
+        rows = extract_type in ["tables", "all"]
+        f.write("{")
+        with WordProcessor._tables_output(f, extract_type) as rows_f:
+            if paragraphs:
+                f.write(json.dumps("paragraphs") + ":[")
+            if rows:
+                rows_f.write(("," if paragraphs else "") + json.dumps("rows") + ":[")
+            
+            counts = {"paragraph": 0, "row": 0}
+            for item in WordProcessor.iter_content(file_path, extract_type):
+                if item["type"] == "paragraph":
+                    out, fields = f, ("story", "style", "text")
+                else:
+                    out, fields = rows_f, ("story", "table", "row", "cells")
+                out.write(("," if counts[item["type"]] else "") + json.dumps({field: item[field] for field in fields}, ensure_ascii=False))
+                counts[item["type"]] += 1
+            
+            if paragraphs:
+                f.write("]")
+            if rows:
+                rows_f.write("]")
+        f.write("}\n")
+    
+    @staticmethod
+    def _write_csv(file_path, f, extract_type):
+        # 每行为表格编号、行号和各单元格文本
+        writer = csv.writer(f)
+        for item in WordProcessor.iter_content(file_path, "tables"):
+            writer.writerow([item["table"], item["row"]] + item["cells"])
+    
+    @staticmethod
+    def _write_ndjson(file_path, f, extract_type):
+        for item in WordProcessor.iter_content(file_path, extract_type):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
@@ -0,0 +1,112 @@
+import os
+import asyncio
+import functools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 单个文件的处理结果：source为输入文件，output为输出路径，error为失败原因（成功时为None）
+FileResult = namedtuple("FileResult", ["source", "output", "error"])
+
+
+class WorkerPool:
+    """
+    基于ProcessPoolExecutor的批量处理执行层
+
+    每个文件作为一个独立任务提交到进程池，结果按输入顺序返回，
+    单个文件失败不会中断整个批次。工作进程异常退出（如被OOM终止）后进程池不能再使用，
+    当时未完成的任务全部失败，之后提交的任务使用重新创建的进程池。
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        Args:
+            max_workers: 最大工作进程数，为None时使用CPU核心数
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+
+    @property
+    def executor(self):
+        # 延迟创建进程池，避免在导入模块时就启动子进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        """
+        提交单个任务
+
+        Returns:
+            可在事件循环中等待的asyncio.Future
+        """
+        executor = self.executor
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except BrokenProcessPool:
+            # 进程池在上一个任务结束之后才发现损坏，重新创建后再提交
+            self._discard(executor)
+            executor = self.executor
+            future = executor.submit(func, *args, **kwargs)
+        future = asyncio.wrap_future(future)
+        future.add_done_callback(functools.partial(self._check_broken, executor))
+        return future
+
+    def _check_broken(self, executor, future):
+        """任务因工作进程异常退出而失败时丢弃进程池"""
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard(executor)
+
+    def _discard(self, executor):
+        """丢弃已经损坏的进程池，下次提交任务时重新创建"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def imap(self, func, items, *args, **kwargs):
+        """
+        并行处理多个文件，按输入顺序逐个产出结果
+
+        所有任务会立即提交，调用方可以在后面的文件仍在处理时先消费前面的结果；
+        提前停止迭代时，尚未开始的任务会被取消。重复的输入（内容相同的上传文件共用同一路径）
+        只处理一次，每次出现都产出同一个结果。
+
+        Args:
+            func: 处理单个文件的函数，调用方式为func(item, *args, **kwargs)，必须可被pickle
+            items: 输入文件路径列表
+            args, kwargs: 传递给func的其他参数
+
+        Yields:
+            FileResult，顺序与items一致
+        """
+        futures = {}
+        for item in items:
+            if item not in futures:
+                futures[item] = self.submit(func, item, *args, **kwargs)
+        try:
+            for item in items:
+                future = futures[item]
+                try:
+                    output = await future
+                except Exception as e:
+                    yield FileResult(item, None, str(e) or e.__class__.__name__)
+                else:
+                    yield FileResult(item, output, None)
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    async def map(self, func, items, *args, **kwargs):
+        """
+        并行处理多个文件
+
+        Returns:
+            FileResult列表，顺序与items一致
+        """
+        return [result async for result in self.imap(func, items, *args, **kwargs)]
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,492 @@
+import re
+import copy
+import zipfile
+from xml.sax.saxutils import quoteattr
+
+from lxml import etree
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_datetime
+
+from modules.xlsx_stream import (
+    CHUNK_SIZE, SHEET_MAIN_NS, DOC_REL_NS, XlsxStream, iter_xml_chunks,
+)
+
+CONTENT_TYPES_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument"
+
+# Excel工作表名称的限制
+MAX_SHEET_NAME = 31
+_INVALID_SHEET_CHARS_RE = re.compile(r"[\\/?*:\[\]]")
+
+# 索引引用都锚定在标签内（文本中不会出现"<"），不需要逐个解析单元格
+_STYLE_REF_RE = re.compile(rb"""(<(?:c|row)\b[^>]*?\ss=["'])(\d+)""")
+_COL_STYLE_REF_RE = re.compile(rb"""(<col\b[^>]*?\sstyle=["'])(\d+)""")
+_DXF_REF_RE = re.compile(rb"""(\sdxfId=["'])(\d+)""")
+_SHARED_REF_RE = re.compile(rb"""(<c\b[^>]*?\st=["']s["'][^>]*>\s*<v>)(\d+)""")
+# 单元格元数据（动态数组、单元格内图片等）引用的部件不会复制
+_METADATA_ATTR_RE = re.compile(rb"""\s(?:cm|vm)=["']\d+["']""")
+_CELL_TAG_RE = re.compile(rb"<c\b[^>]*>")
+_TAB_SELECTED_RE = re.compile(rb"""\stabSelected=["'](?:1|true)["']""")
+_SHARED_ITEM_RE = re.compile(rb"<si>.*?</si>|<si/>", re.S)
+_REL_PREFIX_RE = re.compile(rb"""xmlns:(\w+)=["']""" + re.escape(DOC_REL_NS.encode()) + rb"""["']""")
+# 依赖图片、批注、表格、控件等关系部件的元素，合并时去掉
+_STRIP_RE = re.compile(
+    rb"<(drawing|legacyDrawing|legacyDrawingHF|picture|tableParts|oleObjects|controls)\b[^>]*?(?:/>|>.*?</\1>)"
+    rb"|<mc:AlternateContent\b.*?</mc:AlternateContent>",
+    re.S
+)
+_EXT_LIST_RE = re.compile(rb"<extLst>.*?</extLst>", re.S)
+# 带样式的单元格（不含自闭合的空单元格）：开始标签、样式索引、内容
+_STYLED_CELL_RE = re.compile(rb"""(<c\b[^>]*?\ss=["'](\d+)["'][^>]*?)(?<!/)>(.*?)</c>""", re.S)
+_CELL_TYPE_RE = re.compile(rb"""\st=["']([^"']*)["']""")
+_CELL_VALUE_RE = re.compile(rb"<v>([^<]*)</v>")
+
+# 1904日期系统的序列号加上该天数即为1900日期系统的序列号
+DATE1904_OFFSET = 1462
+
+# styles.xml中需要合并的列表，按架构要求的顺序输出
+_STYLE_SECTIONS = ("numFmts", "fonts", "fills", "borders", "cellStyleXfs", "cellXfs", "cellStyles", "dxfs")
+_FIRST_CUSTOM_NUM_FMT = 164
+
+_DEFAULT_STYLES = (
+    f'<styleSheet xmlns="{SHEET_MAIN_NS}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+).encode("utf-8")
+
+
+def _q(tag):
+    return f"{{{SHEET_MAIN_NS}}}{tag}"
+
+
+def _remap(mapping, index):
+    # 源文件中越界的索引按默认样式处理
+    return mapping[index] if index < len(mapping) else 0
+
+
+def _byte_map(mapping):
+    """把索引映射转换为字节串列表；非空的恒等映射返回None，复制时直接跳过"""
+    if mapping and mapping == list(range(len(mapping))):
+        return None
+    return [b"%d" % index for index in mapping]
+
+
+def _sub_index(pattern, mapping, chunk):
+    """替换chunk中pattern匹配到的索引，pattern的第2组为索引"""
+    if mapping is None:
+        return chunk
+    size = len(mapping)
+
+    def replace(match):
+        index = int(match.group(2))
+        return match.group(1) + (mapping[index] if index < size else b"0")
+
+    return pattern.sub(replace, chunk)
+
+
+class _StyleTable:
+    """合并多个工作簿的styles.xml，相同的字体、填充、边框、格式和单元格样式只保留一份"""
+
+    def __init__(self):
+        self._items = {section: [] for section in ("fonts", "fills", "borders", "cellStyleXfs", "cellXfs", "dxfs")}
+        self._index = {section: {} for section in self._items}
+        self._num_fmts = {}  # 格式代码 -> numFmtId
+        self._cell_styles = []
+        self._cell_style_names = set()
+        self._extra = {}  # tableStyles、colors取第一个工作簿的
+        self.date_xfs = set()
+
+    def _add(self, section, element):
+        key = etree.tostring(element)
+        index = self._index[section].get(key)
+        if index is None:
+            index = len(self._items[section])
+            self._index[section][key] = index
+            self._items[section].append(element)
+        return index
+
+    def merge(self, styles_xml):
+        """
+        合并一个工作簿的样式，date_xfs设为该工作簿中日期格式的cellXfs索引集合
+
+        Returns:
+            (cellXfs索引映射, dxfs索引映射)
+        """
+        root = etree.fromstring(styles_xml)
+
+        def children(section, tag):
+            parent = root.find(_q(section))
+            return [] if parent is None else parent.findall(_q(tag))
+
+        num_fmt_map = {}
+        for num_fmt in children("numFmts", "numFmt"):
+            code = num_fmt.get("formatCode")
+            if code not in self._num_fmts:
+                self._num_fmts[code] = _FIRST_CUSTOM_NUM_FMT + len(self._num_fmts)
+            num_fmt_map[num_fmt.get("numFmtId")] = str(self._num_fmts[code])
+
+        font_map = [self._add("fonts", copy.deepcopy(el)) for el in children("fonts", "font")]
+        fill_map = [self._add("fills", copy.deepcopy(el)) for el in children("fills", "fill")]
+        border_map = [self._add("borders", copy.deepcopy(el)) for el in children("borders", "border")]
+
+        def remap_xf(xf, xf_map=None):
+            xf = copy.deepcopy(xf)
+            num_fmt_id = xf.get("numFmtId", "0")
+            xf.set("numFmtId", num_fmt_map.get(num_fmt_id, num_fmt_id))
+            xf.set("fontId", str(_remap(font_map, int(xf.get("fontId", "0")))))
+            xf.set("fillId", str(_remap(fill_map, int(xf.get("fillId", "0")))))
+            xf.set("borderId", str(_remap(border_map, int(xf.get("borderId", "0")))))
+            if xf_map is not None:
+                xf.set("xfId", str(_remap(xf_map, int(xf.get("xfId", "0")))))
+            return xf
+
+        style_xf_map = [self._add("cellStyleXfs", remap_xf(xf)) for xf in children("cellStyleXfs", "xf")]
+        cell_xfs = children("cellXfs", "xf")
+        cell_xf_map = [self._add("cellXfs", remap_xf(xf, style_xf_map)) for xf in cell_xfs]
+
+        # 含有日期部分的数字格式，换算日期系统时只改写这些单元格；只有时间的格式（如h:mm）不是日期
+        formats = {num_fmt.get("numFmtId"): num_fmt.get("formatCode") for num_fmt in children("numFmts", "numFmt")}
+        self.date_xfs = set()
+        for index, xf in enumerate(cell_xfs):
+            num_fmt_id = xf.get("numFmtId", "0")
+            code = formats.get(num_fmt_id) or BUILTIN_FORMATS.get(int(num_fmt_id) if num_fmt_id.isdigit() else -1)
+            if code and is_datetime(code) in ("date", "datetime"):
+                self.date_xfs.add(index)
+        dxf_map = [self._add("dxfs", copy.deepcopy(el)) for el in children("dxfs", "dxf")]
+
+        # 命名样式按名称合并，同名时保留先出现的
+        for cell_style in children("cellStyles", "cellStyle"):
+            name = cell_style.get("name")
+            if name in self._cell_style_names:
+                continue
+            cell_style = copy.deepcopy(cell_style)
+            cell_style.set("xfId", str(_remap(style_xf_map, int(cell_style.get("xfId", "0")))))
+            self._cell_style_names.add(name)
+            self._cell_styles.append(cell_style)
+
+        for section in ("tableStyles", "colors"):
+            element = root.find(_q(section))
+            if element is not None and section not in self._extra:
+                self._extra[section] = copy.deepcopy(element)
+
+        return cell_xf_map, dxf_map
+
+    def to_xml(self):
+        # 没有任何工作簿提供样式时使用默认样式
+        if not self._items["cellXfs"]:
+            self.merge(_DEFAULT_STYLES)
+
+        root = etree.Element(_q("styleSheet"), nsmap={None: SHEET_MAIN_NS})
+        for section in _STYLE_SECTIONS:
+            if section == "numFmts":
+                if not self._num_fmts:
+                    continue
+                items = []
+                for code, num_fmt_id in self._num_fmts.items():
+                    items.append(etree.Element(_q("numFmt"), numFmtId=str(num_fmt_id), formatCode=code))
+            elif section == "cellStyles":
+                items = self._cell_styles
+            else:
+                items = self._items[section]
+            if not items:
+                continue
+            parent = etree.SubElement(root, _q(section), count=str(len(items)))
+            parent.extend(items)
+
+        for section in ("tableStyles", "colors"):
+            if section in self._extra:
+                root.append(self._extra[section])
+
+        return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+class XlsxMerger:
+    """
+    在容器层面合并多个XLSX的工作表
+
+    工作表XML直接从源文件流式复制到输出文件，只改写其中的样式索引和共享字符串索引，
+    不创建任何单元格对象；共享字符串表和样式表合并去重。单元格格式、列宽、行高、
+    合并单元格、条件格式、数据验证和外部超链接都会保留；图片、图表、批注、表格等
+    依赖其他部件的对象会被去掉。主题使用第一个工作簿的。
+
+    所有工作簿都使用1904日期系统时输出也使用1904日期系统；混用两种日期系统时输出使用1900日期系统，
+    1904日期系统的工作簿中日期格式单元格的序列号加上1462天，日期保持不变（1904年以前的日期在1904日期系统中
+    无法表示，反过来换算会丢失日期）。
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            chunk_size: 每次读取工作表XML的字节数
+        """
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def sheet_title(prefix, sheet_name, used_titles):
+        """
+        生成"前缀_工作表名"形式的新工作表名称，去掉Excel不允许的字符，
+        超过31个字符时截断，重名时像Excel一样追加" (2)"等序号
+
+        Args:
+            prefix: 名称前缀（通常为文件名）
+            sheet_name: 原工作表名称
+            used_titles: 已使用的名称集合（小写），生成的名称会加入其中
+
+        Returns:
+            新工作表名称
+        """
+        title = _INVALID_SHEET_CHARS_RE.sub("_", f"{prefix}_{sheet_name}").strip("'") or "Sheet"
+        title = title[:MAX_SHEET_NAME]
+        candidate = title
+        index = 2
+        while candidate.lower() in used_titles:
+            suffix = f" ({index})"
+            candidate = title[:MAX_SHEET_NAME - len(suffix)] + suffix
+            index += 1
+        used_titles.add(candidate.lower())
+        return candidate
+
+    def merge(self, sources, output_path):
+        """
+        合并工作簿
+
+        Args:
+            sources: (文件路径, 工作表名称前缀)列表
+            output_path: 输出文件路径
+
+        Returns:
+            合并后的工作表数量
+        """
+        # 先读取所有工作簿的结构，确定输出工作表的名称和数量
+        plan = []
+        used_titles = set()
+        for file_path, prefix in sources:
+            with XlsxStream(file_path, self.chunk_size) as source:
+                plan.append((file_path, source.date1904, [
+                    (self.sheet_title(prefix, sheet_name, used_titles), part)
+                    for sheet_name, part in source.sheets.items()
+                ]))
+
+        sheet_count = sum(len(sheets) for _, _, sheets in plan)
+        if sheet_count == 0:
+            raise ValueError("没有可合并的工作表")
+
+        styles = _StyleTable()
+        shared_strings = []
+        shared_index = {}
+        sheet_entries = []  # (名称, 输出部件, 超链接关系)
+        theme = None
+        date1904 = all(source_date1904 for _, source_date1904, _ in plan)
+
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zout:
+            for file_path, source_date1904, sheets in plan:
+                with XlsxStream(file_path, self.chunk_size) as source:
+                    # 主题以第一个工作簿为准
+                    if theme is None and source.theme_part:
+                        theme = source.read_part(source.theme_part)
+
+                    xf_map, dxf_map, date_xfs = [], [], set()
+                    if source.styles_part:
+                        xf_map, dxf_map = styles.merge(source.read_part(source.styles_part))
+                        date_xfs = styles.date_xfs
+                    elif not sheet_entries:
+                        styles.merge(_DEFAULT_STYLES)
+                    # 与输出的日期系统不同时换算日期单元格
+                    date_offset = DATE1904_OFFSET if source_date1904 and not date1904 else 0
+
+                    string_map = []
+                    if source.shared_strings_part:
+                        with source.open_part(source.shared_strings_part) as stream:
+                            for chunk in iter_xml_chunks(stream, b"</si>", self.chunk_size):
+                                for item in _SHARED_ITEM_RE.findall(chunk):
+                                    if item not in shared_index:
+                                        shared_index[item] = len(shared_strings)
+                                        shared_strings.append(item)
+                                    string_map.append(shared_index[item])
+
+                    for title, part in sheets:
+                        output_part = f"xl/worksheets/sheet{len(sheet_entries) + 1}.xml"
+                        hyperlinks = {
+                            rel_id: target for rel_id, (rel_type, target) in source.relationships(part, True).items()
+                            if rel_type.endswith("/hyperlink")
+                        }
+                        with source.open_part(part) as src, zout.open(output_part, "w", force_zip64=True) as dest:
+                            self._copy_sheet(src, dest, xf_map, dxf_map, string_map, hyperlinks,
+                                             selected=not sheet_entries,
+                                             date_xfs=date_xfs if date_offset else None, date_offset=date_offset)
+                        sheet_entries.append((title, output_part, hyperlinks))
+
+            zout.writestr("[Content_Types].xml", self._content_types(sheet_count, theme is not None))
+            zout.writestr("_rels/.rels", self._package_rels())
+            zout.writestr("xl/workbook.xml", self._workbook(sheet_entries, date1904))
+            zout.writestr("xl/_rels/workbook.xml.rels", self._workbook_rels(sheet_entries, theme is not None))
+            for index, (_, output_part, hyperlinks) in enumerate(sheet_entries, 1):
+                if hyperlinks:
+                    zout.writestr(f"xl/worksheets/_rels/sheet{index}.xml.rels", self._hyperlink_rels(hyperlinks))
+            zout.writestr("xl/styles.xml", styles.to_xml())
+            zout.writestr("xl/sharedStrings.xml", self._shared_strings(shared_strings))
+            if theme is not None:
+                zout.writestr("xl/theme/theme1.xml", theme)
+
+        return sheet_count
+
+    def _copy_sheet(self, src, dest, xf_map, dxf_map, string_map, hyperlinks, selected, date_xfs=None,
+                    date_offset=0):
+        """
+        流式复制工作表XML，改写样式和共享字符串索引，去掉依赖其他部件的元素；
+        date_xfs不为空时，这些样式的数值单元格加上date_offset天
+        """
+        xf_map, dxf_map, string_map = _byte_map(xf_map), _byte_map(dxf_map), _byte_map(string_map)
+        shift_dates = self._date_shifter(date_xfs, date_offset) if date_xfs else None
+
+        rel_id_re = None
+        for chunk in iter_xml_chunks(src, b"</row>", self.chunk_size):
+            if rel_id_re is None:
+                prefix = _REL_PREFIX_RE.search(chunk)
+                rel_id_re = re.compile(
+                    rb"""\s""" + (prefix.group(1) if prefix else b"r") + rb""":id=["']([^"']*)["']"""
+                )
+                if not selected:
+                    chunk = _TAB_SELECTED_RE.sub(b"", chunk)
+                chunk = _sub_index(_COL_STYLE_REF_RE, xf_map, chunk)
+
+            if shift_dates is not None:
+                # 样式索引改写之前按源工作簿的索引判断日期格式
+                chunk = _STYLED_CELL_RE.sub(shift_dates, chunk)
+            chunk = _sub_index(_STYLE_REF_RE, xf_map, chunk)
+            chunk = _sub_index(_SHARED_REF_RE, string_map, chunk)
+            if b" cm=" in chunk or b" vm=" in chunk:
+                chunk = _CELL_TAG_RE.sub(lambda m: _METADATA_ATTR_RE.sub(b"", m.group(0)), chunk)
+
+            end = chunk.find(b"</sheetData>")
+            if end < 0:
+                end = chunk.find(b"<sheetData/>")
+            if end >= 0:
+                # sheetData之后的元素才可能引用其他部件
+                head, tail = chunk[:end], chunk[end:]
+                tail = _sub_index(_DXF_REF_RE, dxf_map, tail)
+                tail = _STRIP_RE.sub(b"", tail)
+                # 扩展列表中引用了关系的部分（如切片器）无法保留
+                tail = _EXT_LIST_RE.sub(lambda m: b"" if rel_id_re.search(m.group(0)) else m.group(0), tail)
+                # 只保留外部超链接的关系引用
+                tail = rel_id_re.sub(lambda m: m.group(0) if m.group(1).decode() in hyperlinks else b"", tail)
+                chunk = head + tail
+            dest.write(chunk)
+
+    @staticmethod
+    def _date_shifter(date_xfs, date_offset):
+        """返回_STYLED_CELL_RE.sub的回调：日期格式的数值单元格（包括公式的缓存值）加上date_offset天"""
+        def shift(match):
+            start, style, body = match.groups()
+            if int(style) not in date_xfs:
+                return match.group(0)
+            cell_type = _CELL_TYPE_RE.search(start)
+            if cell_type is not None and cell_type.group(1) != b"n":
+                return match.group(0)
+            value = _CELL_VALUE_RE.search(body)
+            if value is None:
+                return match.group(0)
+            text = value.group(1).strip()
+            try:
+                serial = int(text) + date_offset if text.lstrip(b"-").isdigit() else float(text) + date_offset
+            except ValueError:
+                return match.group(0)
+            body = body[:value.start(1)] + repr(serial).encode("ascii") + body[value.end(1):]
+            return start + b">" + body + b"</c>"
+
+        return shift
+
+    @staticmethod
+    def _content_types(sheet_count, has_theme):
+        overrides = [
+            ("/xl/workbook.xml", f"{_CONTENT_TYPE}.spreadsheetml.sheet.main+xml"),
+            ("/xl/styles.xml", f"{_CONTENT_TYPE}.spreadsheetml.styles+xml"),
+            ("/xl/sharedStrings.xml", f"{_CONTENT_TYPE}.spreadsheetml.sharedStrings+xml"),
+        ]
+        if has_theme:
+            overrides.append(("/xl/theme/theme1.xml", f"{_CONTENT_TYPE}.theme+xml"))
+        overrides += [
+            (f"/xl/worksheets/sheet{index}.xml", f"{_CONTENT_TYPE}.spreadsheetml.worksheet+xml")
+            for index in range(1, sheet_count + 1)
+        ]
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Types xmlns="{CONTENT_TYPES_NS}">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + "".join(f'<Override PartName="{name}" ContentType="{content_type}"/>' for name, content_type in overrides)
+            + "</Types>"
+        )
+
+    @staticmethod
+    def _package_rels():
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_TYPE}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        )
+
+    @staticmethod
+    def _workbook(sheet_entries, date1904):
+        sheets = "".join(
+            f'<sheet name={quoteattr(title)} sheetId="{index}" r:id="rId{index}"/>'
+            for index, (title, _, _) in enumerate(sheet_entries, 1)
+        )
+        workbook_pr = '<workbookPr date1904="1"/>' if date1904 else "<workbookPr/>"
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{SHEET_MAIN_NS}" xmlns:r="{DOC_REL_NS}">'
+            f'{workbook_pr}<bookViews><workbookView activeTab="0"/></bookViews>'
+            f'<sheets>{sheets}</sheets>'
+            '</workbook>'
+        )
+
+    @staticmethod
+    def _workbook_rels(sheet_entries, has_theme):
+        rels = [
+            (f"rId{index}", "worksheet", f"worksheets/sheet{index}.xml")
+            for index in range(1, len(sheet_entries) + 1)
+        ]
+        count = len(sheet_entries)
+        rels.append((f"rId{count + 1}", "styles", "styles.xml"))
+        rels.append((f"rId{count + 2}", "sharedStrings", "sharedStrings.xml"))
+        if has_theme:
+            rels.append((f"rId{count + 3}", "theme", "theme/theme1.xml"))
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+            + "".join(
+                f'<Relationship Id="{rel_id}" Type="{_REL_TYPE}/{rel_type}" Target="{target}"/>'
+                for rel_id, rel_type, target in rels
+            )
+            + "</Relationships>"
+        )
+
+    @staticmethod
+    def _hyperlink_rels(hyperlinks):
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+            + "".join(
+                f'<Relationship Id={quoteattr(rel_id)} Type="{_REL_TYPE}/hyperlink" Target={quoteattr(target)} TargetMode="External"/>'
+                for rel_id, target in hyperlinks.items()
+            )
+            + "</Relationships>"
+        )
+
+    @staticmethod
+    def _shared_strings(items):
+        return (
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            + f'<sst xmlns="{SHEET_MAIN_NS}" uniqueCount="{len(items)}">'.encode("utf-8")
+            + b"".join(items)
+            + b"</sst>"
+        )
@@ -0,0 +1,410 @@
+import os
+import re
+import html
+import shutil
+import zipfile
+import posixpath
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.cell import range_boundaries, coordinate_from_string, column_index_from_string
+
+CHUNK_SIZE = 1024 * 1024
+
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# 工作表XML中的文本单元格：属性、单元格内容；数值等其他单元格不会匹配，无需回调
+_CELL_RE = re.compile(rb"""<c\b([^>]*?\st=["'](s|inlineStr|str)["'][^>]*)(?<!/)>(.*?)</c>""", re.S)
+# 整个工作簿替换时共享字符串表直接原地改写，工作表中只需处理内联字符串和普通字符串单元格
+_INLINE_CELL_RE = re.compile(rb"""<c\b([^>]*?\st=["'](inlineStr|str)["'][^>]*)(?<!/)>(.*?)</c>""", re.S)
+_INLINE_MARK_RE = re.compile(rb"""\st=["'](?:inlineStr|str)["']""")
+_SHARED_ITEM_RE = re.compile(rb"<si>(.*?)</si>", re.S)
+_REF_RE = re.compile(rb"""\sr=["']([A-Z]+[0-9]+)["']""")
+_VALUE_RE = re.compile(rb"<v>(.*?)</v>", re.S)
+_INLINE_RE = re.compile(rb"<is>.*?</is>|<is/>", re.S)
+_TEXT_RE = re.compile(rb"<t\b[^>]*?(?:/>|>(.*?)</t>)", re.S)
+_PHONETIC_RE = re.compile(rb"<rPh\b.*?</rPh>", re.S)
+_PREFIXED_ROOT_RE = re.compile(rb"<\w+:(?:worksheet|sst)\b")
+
+
+class UnsupportedWorkbook(Exception):
+    """工作簿结构不适合流式处理，调用方应改用openpyxl"""
+
+
+def _text_of(fragment):
+    """拼接<si>或<is>中全部<t>的文本，忽略拼音注音"""
+    if b"<rPh" in fragment:
+        fragment = _PHONETIC_RE.sub(b"", fragment)
+    text = b"".join(m.group(1) or b"" for m in _TEXT_RE.finditer(fragment)).decode("utf-8")
+    return html.unescape(text) if "&" in text else text
+
+
+def _escape_text(text):
+    if ILLEGAL_CHARACTERS_RE.search(text):
+        raise ValueError(f"替换结果包含Excel不允许的字符: {text!r}")
+    return escape(text).encode("utf-8")
+
+
+def _resolve_target(base_dir, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def _rels_of(zin, part, external=False):
+    """
+    读取部件的关系，返回{rId: (Type, 目标)}
+
+    内部关系的目标解析为包内部件路径；external为True时同时返回外部关系，目标保持原样
+    """
+    rels_path = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    if rels_path not in zin.namelist():
+        return {}
+    root = etree.fromstring(zin.read(rels_path))
+    base_dir = posixpath.dirname(part)
+    rels = {}
+    for rel in root.iter(f"{{{REL_NS}}}Relationship"):
+        if rel.get("TargetMode") == "External":
+            if external:
+                rels[rel.get("Id")] = (rel.get("Type"), rel.get("Target"))
+        else:
+            rels[rel.get("Id")] = (rel.get("Type"), _resolve_target(base_dir, rel.get("Target")))
+    return rels
+
+
+def iter_xml_chunks(stream, end_tag, chunk_size=CHUNK_SIZE):
+    """
+    按块读取XML，每块都在end_tag处截断，保证其中的元素不会被拆开
+
+    Args:
+        stream: 可读的二进制流
+        end_tag: 截断位置的结束标签，如b"</row>"
+        chunk_size: 每次读取的字节数
+
+    Yields:
+        XML数据块
+    """
+    buffer = b""
+    first = True
+    while True:
+        data = stream.read(chunk_size)
+        if first:
+            first = False
+            if _PREFIXED_ROOT_RE.search(data[:4096]):
+                raise UnsupportedWorkbook("XML使用了带前缀的命名空间")
+        if not data:
+            if buffer:
+                yield buffer
+            return
+        buffer += data
+        end = buffer.rfind(end_tag)
+        if end == -1:
+            continue
+        end += len(end_tag)
+        yield buffer[:end]
+        buffer = buffer[end:]
+
+
+class XlsxStream:
+    """
+    直接读写XLSX容器的流式查找替换
+
+    工作表XML按整行分块读取，只改写文本单元格，其余内容和未涉及的部件原样复制，
+    内存占用取决于块大小和共享字符串表，与行数无关；单元格样式、图片、图表等都会保留。
+    公式单元格不做替换。
+    """
+
+    def __init__(self, file_path, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            file_path: XLSX文件路径
+            chunk_size: 每次读取工作表XML的字节数
+        """
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._zin = zipfile.ZipFile(file_path)
+        try:
+            self._read_workbook()
+        except Exception:
+            self._zin.close()
+            raise
+
+    def close(self):
+        self._zin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_workbook(self):
+        package_rels = _rels_of(self._zin, "")
+        workbook_part = next(
+            (target for rel_type, target in package_rels.values() if rel_type.endswith("/officeDocument")),
+            None
+        )
+        if workbook_part is None or workbook_part not in self._zin.namelist():
+            raise UnsupportedWorkbook("找不到工作簿部件")
+        self.workbook_part = workbook_part
+
+        rels = _rels_of(self._zin, workbook_part)
+        root = etree.fromstring(self._zin.read(workbook_part))
+
+        workbook_pr = root.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+        self.date1904 = workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true")
+
+        # 工作表名称 -> 工作表部件，顺序与工作簿一致，不包含图表工作表
+        self.sheets = {}
+        for sheet in root.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+            rel_type, target = rels.get(sheet.get(f"{{{DOC_REL_NS}}}id"), ("", None))
+            if rel_type.endswith("/worksheet"):
+                self.sheets[sheet.get("name")] = target
+
+        def find_part(suffix):
+            return next((target for rel_type, target in rels.values() if rel_type.endswith(suffix)), None)
+
+        self.shared_strings_part = find_part("/sharedStrings")
+        self.styles_part = find_part("/styles")
+        self.theme_part = find_part("/theme")
+        self._shared_strings = None
+
+    def open_part(self, part):
+        """以二进制流打开包内部件"""
+        return self._zin.open(part)
+
+    def read_part(self, part):
+        """读取包内部件的全部内容"""
+        return self._zin.read(part)
+
+    def relationships(self, part, external=False):
+        """返回部件的关系{rId: (Type, 目标)}"""
+        return _rels_of(self._zin, part, external)
+
+    @property
+    def shared_strings(self):
+        """共享字符串表的纯文本列表，首次访问时读取"""
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self.shared_strings_part:
+                with self._zin.open(self.shared_strings_part) as stream:
+                    for _, si in etree.iterparse(stream, tag=f"{{{SHEET_MAIN_NS}}}si"):
+                        self._shared_strings.append("".join(
+                            t.text or "" for t in si.iter(f"{{{SHEET_MAIN_NS}}}t")
+                            if t.getparent().tag != f"{{{SHEET_MAIN_NS}}}rPh"
+                        ))
+                        si.clear()
+        return self._shared_strings
+
+    def replace(self, output_path, replacer, sheet_name=None, cell_range=None):
+        """
+        执行查找替换并写入新文件
+
+        Args:
+            output_path: 输出文件路径，可以与原文件相同
+            replacer: TextReplacer
+            sheet_name: 只处理该工作表，为None时处理所有工作表
+            cell_range: 单元格范围（如"A1:C10"），为None时处理整个工作表
+
+        Returns:
+            被修改的文本数量（共享字符串条目和单元格）
+        """
+        if sheet_name is None and cell_range is None:
+            return self._replace_workbook(output_path, replacer)
+
+        if sheet_name is not None:
+            if sheet_name not in self.sheets:
+                raise ValueError(f"工作表 '{sheet_name}' 不存在")
+            targets = {self.sheets[sheet_name]}
+        else:
+            targets = set(self.sheets.values())
+
+        bounds = range_boundaries(cell_range) if cell_range else None
+        rewriter = _CellRewriter(self, replacer, bounds)
+
+        def write_entries(zout):
+            deferred = None
+            for info in self._zin.infolist():
+                if info.filename in targets:
+                    self._rewrite_sheet(info, zout, _CELL_RE, rewriter)
+                    targets.discard(info.filename)
+                elif info.filename == self.shared_strings_part and targets:
+                    # 新增的共享字符串在处理完所有工作表后才能确定
+                    deferred = info
+                elif info.filename == self.shared_strings_part:
+                    self._write_shared_strings(info, zout, rewriter.appended)
+                else:
+                    self._copy_entry(info, zout)
+
+            if deferred is not None:
+                self._write_shared_strings(deferred, zout, rewriter.appended)
+
+        self._write_package(output_path, write_entries)
+        return rewriter.changed
+
+    def _replace_workbook(self, output_path, replacer):
+        """
+        替换整个工作簿：原地改写共享字符串表中的条目，工作表中只改写内联字符串，
+        耗时取决于不重复的字符串数量而不是单元格数量
+        """
+        rewriter = _CellRewriter(self, replacer, None)
+        sheet_parts = set(self.sheets.values())
+        changed = 0
+
+        def write_entries(zout):
+            nonlocal changed
+            for info in self._zin.infolist():
+                if info.filename in sheet_parts:
+                    self._rewrite_sheet(info, zout, _INLINE_CELL_RE, rewriter, _INLINE_MARK_RE)
+                elif info.filename == self.shared_strings_part:
+                    changed += self._rewrite_shared_strings(info, zout, replacer)
+                else:
+                    self._copy_entry(info, zout)
+
+        self._write_package(output_path, write_entries)
+        return changed + rewriter.changed
+
+    def _write_package(self, output_path, write_entries):
+        """通过write_entries(zout)写出新的容器，完成后替换输出文件"""
+        temp_path = output_path + ".tmp"
+        try:
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+                write_entries(zout)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _open_for_write(self, zout, info):
+        zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+        zinfo.compress_type = info.compress_type
+        zinfo.external_attr = info.external_attr
+        return zout.open(zinfo, "w", force_zip64=info.file_size * 2 > zipfile.ZIP64_LIMIT)
+
+    def _copy_entry(self, info, zout):
+        with self._zin.open(info) as src, self._open_for_write(zout, info) as dest:
+            shutil.copyfileobj(src, dest, self.chunk_size)
+
+    def _rewrite_sheet(self, info, zout, cell_re, rewriter, mark_re=None):
+        with self._zin.open(info) as src, self._open_for_write(zout, info) as dest:
+            for chunk in iter_xml_chunks(src, b"</row>", self.chunk_size):
+                # 不含待处理单元格的块原样写入
+                if mark_re is None or mark_re.search(chunk):
+                    chunk = cell_re.sub(rewriter, chunk)
+                dest.write(chunk)
+
+    def _rewrite_shared_strings(self, info, zout, replacer):
+        """原地改写共享字符串表，返回被修改的条目数"""
+        changed = 0
+
+        def replace_item(match):
+            nonlocal changed
+            text = _text_of(match.group(1))
+            new_text = replacer.apply(text)
+            if new_text == text:
+                return match.group(0)
+            changed += 1
+            return b'<si><t xml:space="preserve">%s</t></si>' % _escape_text(new_text)
+
+        with self._zin.open(info) as src, self._open_for_write(zout, info) as dest:
+            for chunk in iter_xml_chunks(src, b"</si>", self.chunk_size):
+                dest.write(_SHARED_ITEM_RE.sub(replace_item, chunk))
+        return changed
+
+    def _write_shared_strings(self, info, zout, appended):
+        if not appended:
+            self._copy_entry(info, zout)
+            return
+
+        data = self._zin.read(info)
+        if _PREFIXED_ROOT_RE.search(data[:4096]):
+            raise UnsupportedWorkbook("共享字符串表使用了带前缀的命名空间")
+
+        # 新字符串追加到表尾，原有条目的索引不变
+        unique_count = len(self.shared_strings) + len(appended)
+        head, _, tail = data.rpartition(b"</sst>")
+        head = re.sub(rb'(<sst\b[^>]*?\suniqueCount=")\d+(")', rb"\g<1>%d\g<2>" % unique_count, head, count=1)
+        extra = b"".join(b'<si><t xml:space="preserve">%s</t></si>' % _escape_text(text) for text in appended)
+
+        with self._open_for_write(zout, info) as dest:
+            dest.write(head)
+            dest.write(extra)
+            dest.write(b"</sst>")
+            dest.write(tail)
+
+
+class _CellRewriter:
+    """_CELL_RE.sub的回调，改写单个文本单元格"""
+
+    def __init__(self, stream, replacer, bounds):
+        self.stream = stream
+        self.replacer = replacer
+        self.bounds = bounds
+        self.appended = {}  # 新增的共享字符串 -> 索引
+        self.changed = 0
+        self._shared_results = {}  # 原共享字符串索引 -> 新索引（无变化时为None）
+
+    def _in_range(self, attrs):
+        ref = _REF_RE.search(attrs)
+        if ref is None:
+            raise UnsupportedWorkbook("单元格缺少r属性")
+        min_col, min_row, max_col, max_row = self.bounds
+        column, row = coordinate_from_string(ref.group(1).decode("ascii"))
+        column = column_index_from_string(column)
+        return ((min_col is None or min_col <= column <= max_col)
+                and (min_row is None or min_row <= row <= max_row))
+
+    def _replace_shared(self, index):
+        """返回替换后的共享字符串索引，文本没有变化时返回None"""
+        if index not in self._shared_results:
+            shared_strings = self.stream.shared_strings
+            text = shared_strings[index]
+            new_text = self.replacer.apply(text)
+            new_index = None
+            if new_text != text:
+                # 同一共享字符串可能被范围外的单元格引用，因此追加新条目而不是修改原条目
+                if new_text not in self.appended:
+                    self.appended[new_text] = len(shared_strings) + len(self.appended)
+                new_index = self.appended[new_text]
+            self._shared_results[index] = new_index
+        return self._shared_results[index]
+
+    def __call__(self, match):
+        attrs, cell_type, body = match.groups()
+        # 公式单元格保留公式和缓存值
+        if b"<f" in body:
+            return match.group(0)
+        if self.bounds is not None and not self._in_range(attrs):
+            return match.group(0)
+
+        if cell_type == b"inlineStr":
+            inline = _INLINE_RE.search(body)
+            if inline is None:
+                return match.group(0)
+            text = _text_of(inline.group(0))
+            new_text = self.replacer.apply(text)
+            if new_text == text:
+                return match.group(0)
+            new_body = body[:inline.start()] + b'<is><t xml:space="preserve">%s</t></is>' % _escape_text(new_text) + body[inline.end():]
+        else:
+            value = _VALUE_RE.search(body)
+            if value is None:
+                return match.group(0)
+            if cell_type == b"s":
+                new_index = self._replace_shared(int(value.group(1)))
+                if new_index is None:
+                    return match.group(0)
+                new_value = b"%d" % new_index
+            else:
+                text = html.unescape(value.group(1).decode("utf-8"))
+                new_text = self.replacer.apply(text)
+                if new_text == text:
+                    return match.group(0)
+                new_value = _escape_text(new_text)
+            new_body = body[:value.start(1)] + new_value + body[value.end(1):]
+
+        self.changed += 1
+        return b"<c" + attrs + b">" + new_body + b"</c>"
@@ -0,0 +1,157 @@
+import os
+import re
+import zipfile
+
+# 已经压缩过的格式直接存储，不再重复压缩
+STORED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".webp", ".gif",
+    ".docx", ".xlsx", ".xlsm", ".pptx", ".zip",
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+# 错误信息中的绝对路径（至少包含一级目录），group(1)为文件名
+_PATH_RE = re.compile(r"(?:[A-Za-z]:)?[\\/](?:[^\s'\"\\/]+[\\/])+([^\s'\"\\/]+)")
+
+
+def output_arcname(original_filename, source_path, output_path):
+    """
+    将输出文件名中的上传文件ID还原为用户上传时的文件名
+
+    Args:
+        original_filename: 用户上传时的文件名
+        source_path: 保存后的上传文件路径
+        output_path: 处理后的输出文件路径
+
+    Returns:
+        ZIP中使用的文件名
+    """
+    upload_stem = os.path.splitext(os.path.basename(source_path))[0]
+    original_stem = os.path.splitext(os.path.basename(original_filename or ""))[0]
+    output_name = os.path.basename(output_path)
+    return output_name.replace(upload_stem, original_stem) if original_stem else output_name
+
+
+def public_error(original_filename, source_path, error):
+    """
+    返回可以交给用户的错误信息：上传文件路径还原为用户上传时的文件名，其他服务器路径只保留文件名
+
+    Args:
+        original_filename: 用户上传时的文件名
+        source_path: 保存后的上传文件路径
+        error: 处理失败时的异常信息
+    """
+    error = error.replace(source_path, original_filename or os.path.basename(source_path))
+    return _PATH_RE.sub(lambda match: output_arcname(original_filename, source_path, match.group(1)), error)
+
+
+class _ChunkBuffer:
+    """只支持写入的缓冲区，zipfile写入的数据由ZipStream取出后发送"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    流式ZIP写入器
+
+    每添加一个文件就立即产出对应的ZIP数据块，不需要先在磁盘上生成完整的ZIP文件。
+    输出流不可回退，文件大小和CRC写在每个条目后的数据描述符中。
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            chunk_size: 每次读取源文件的字节数
+        """
+        self.chunk_size = chunk_size
+        self._buffer = _ChunkBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, "w", zipfile.ZIP_DEFLATED)
+        self._names = set()
+
+    def _unique_name(self, arcname):
+        # 同名条目追加序号，避免解压时互相覆盖
+        name, ext = os.path.splitext(arcname)
+        candidate = arcname
+        index = 1
+        while candidate in self._names:
+            candidate = f"{name} ({index}){ext}"
+            index += 1
+        self._names.add(candidate)
+        return candidate
+
+    @staticmethod
+    def _compress_type(arcname):
+        ext = os.path.splitext(arcname)[1].lower()
+        return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+    def add_file(self, path, arcname=None):
+        """
+        添加磁盘上的文件
+
+        Args:
+            path: 文件路径
+            arcname: ZIP中的文件名，默认为文件名本身
+
+        Yields:
+            ZIP数据块
+        """
+        arcname = self._unique_name(arcname or os.path.basename(path))
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = self._compress_type(arcname)
+
+        with open(path, "rb") as src, self._zip.open(zinfo, "w") as dest:
+            while True:
+                chunk = src.read(self.chunk_size)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                data = self._buffer.pop()
+                if data:
+                    yield data
+
+        data = self._buffer.pop()
+        if data:
+            yield data
+
+    def add_bytes(self, data, arcname):
+        """
+        添加内存中的数据
+
+        Args:
+            data: 文件内容（bytes或str）
+            arcname: ZIP中的文件名
+
+        Yields:
+            ZIP数据块
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        arcname = self._unique_name(arcname)
+        self._zip.writestr(arcname, data, compress_type=self._compress_type(arcname))
+        chunk = self._buffer.pop()
+        if chunk:
+            yield chunk
+
+    def close(self):
+        """
+        结束ZIP并写入中央目录
+
+        Returns:
+            最后的ZIP数据块
+        """
+        self._zip.close()
+        return self._buffer.pop()
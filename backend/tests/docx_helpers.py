@@ -0,0 +1,54 @@
+import shutil
+import zipfile
+from xml.sax.saxutils import escape
+
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_FOOTNOTES_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+_FOOTNOTES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes"
+
+
+def add_footnotes(path, notes):
+    """
+    为python-docx生成的文档添加脚注部件，正文末尾为每条脚注添加一个带引用的段落
+
+    Args:
+        path: DOCX文件路径
+        notes: (引用段落文字, 脚注文字)列表
+    """
+    footnotes = [
+        '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>',
+        '<w:footnote w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/></w:r></w:p></w:footnote>',
+    ]
+    references = []
+    for note_id, (text, note) in enumerate(notes, 1):
+        footnotes.append(f'<w:footnote w:id="{note_id}"><w:p><w:r><w:t>{escape(note)}</w:t></w:r></w:p></w:footnote>')
+        references.append(
+            f'<w:p><w:r><w:t>{escape(text)}</w:t></w:r>'
+            f'<w:r><w:rPr><w:vertAlign w:val="superscript"/></w:rPr><w:footnoteReference w:id="{note_id}"/></w:r></w:p>'
+        )
+    footnotes_xml = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:footnotes xmlns:w="{_W_NS}">'
+        + "".join(footnotes) + "</w:footnotes>"
+    )
+
+    patched = str(path) + ".notes"
+    with zipfile.ZipFile(path) as zin, zipfile.ZipFile(patched, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename in ("word/document.xml", "word/_rels/document.xml.rels", "[Content_Types].xml"):
+                data = data.decode("utf-8")
+            if info.filename == "word/document.xml":
+                position = data.rindex("<w:sectPr")
+                data = data[:position] + "".join(references) + data[position:]
+            elif info.filename == "word/_rels/document.xml.rels":
+                data = data.replace(
+                    "</Relationships>",
+                    f'<Relationship Id="rIdNotes" Type="{_FOOTNOTES_REL}" Target="footnotes.xml"/></Relationships>'
+                )
+            elif info.filename == "[Content_Types].xml":
+                data = data.replace(
+                    "</Types>", f'<Override PartName="/word/footnotes.xml" ContentType="{_FOOTNOTES_TYPE}"/></Types>'
+                )
+            zout.writestr(info, data.encode("utf-8") if isinstance(data, str) else data)
+        zout.writestr("word/footnotes.xml", footnotes_xml.encode("utf-8"))
+    shutil.move(patched, path)
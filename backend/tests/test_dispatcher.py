@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import pytest
+
+from modules.dispatcher import Dispatcher
+from modules.worker_pool import WorkerPool
+
+
+def square(value):
+    if value < 0:
+        raise ValueError("负数")
+    return value * value
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = Dispatcher(WorkerPool(1), io_workers=2, route_limits={"/limited": 2}, default_limit=3)
+    yield dispatcher
+    dispatcher.shutdown()
+
+
+def test_route_limits_concurrency(dispatcher):
+    active = {"/limited": 0, "/other": 0}
+    peak = dict(active)
+
+    async def request(route):
+        async with dispatcher.slot(route):
+            active[route] += 1
+            peak[route] = max(peak[route], active[route])
+            await asyncio.sleep(0.05)
+            active[route] -= 1
+
+    async def run():
+        waiting = []
+
+        async def observe():
+            # 所有请求都已进入路由后，超出名额的请求在排队
+            await asyncio.sleep(0.01)
+            waiting.append(dispatcher.metrics()["routes"]["/limited"]["waiting"])
+
+        await asyncio.gather(observe(), *(request(route) for route in ["/limited"] * 5 + ["/other"] * 5))
+        return waiting
+
+    waiting = asyncio.run(run())
+
+    assert peak == {"/limited": 2, "/other": 3}
+    assert waiting == [3]
+    routes = dispatcher.metrics()["routes"]
+    assert routes["/limited"] == {"limit": 2, "waiting": 0, "active": 0, "completed": 5, "failed": 0}
+    assert routes["/other"]["limit"] == 3 and routes["/other"]["completed"] == 5
+
+
+def test_slot_counts_failures_and_releases(dispatcher):
+    async def run():
+        with pytest.raises(ValueError):
+            async with dispatcher.slot("/limited"):
+                raise ValueError("处理失败")
+        # 失败的请求释放名额，之后的请求不会被阻塞
+        for _ in range(2):
+            async with dispatcher.slot("/limited"):
+                pass
+
+    asyncio.run(asyncio.wait_for(run(), 1))
+
+    stats = dispatcher.metrics()["routes"]["/limited"]
+    assert (stats["failed"], stats["completed"], stats["active"]) == (1, 2, 0)
+
+
+def test_run_io_uses_thread_pool(dispatcher):
+    async def run():
+        return await dispatcher.run_io(lambda: threading.current_thread().name)
+
+    assert asyncio.run(run()).startswith("batch-toolbox-io")
+    assert dispatcher.metrics()["executors"]["io"]["completed"] == 1
+
+
+def test_run_cpu_and_queue_depth(dispatcher):
+    async def run():
+        results = await asyncio.gather(*(dispatcher.run_cpu(square, value) for value in range(4)))
+        with pytest.raises(ValueError):
+            await dispatcher.run_cpu(square, -1)
+        files = await dispatcher.map_cpu(square, [2, -2])
+        return results, files
+
+    results, files = asyncio.run(run())
+
+    assert results == [0, 1, 4, 9]
+    assert [(result.output, result.error) for result in files] == [(4, None), (None, "负数")]
+    cpu = dispatcher.metrics()["executors"]["cpu"]
+    assert cpu == {"workers": 1, "pending": 0, "completed": 5, "failed": 2, "queue_depth": 0}
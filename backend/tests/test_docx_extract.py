@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from docx import Document
+
+from modules.docx_stream import DocxStream
+from modules.word_processor import WordProcessor
+
+
+@pytest.fixture
+def source(tmp_path):
+    """段落和表格交替出现，带页眉"""
+    doc = Document()
+    doc.add_paragraph("第一段")
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "a"
+    table.cell(1, 1).text = "b"
+    doc.add_paragraph("第二段")
+    doc.add_table(rows=1, cols=1).cell(0, 0).text = "x"
+    doc.sections[0].header.paragraphs[0].text = "页眉文字"
+    path = str(tmp_path / "source.docx")
+    doc.save(path)
+    return path
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """统计文档被解析的次数"""
+    calls = []
+    iter_content = DocxStream.iter_content
+
+    def counting(self, *args, **kwargs):
+        calls.append(args)
+        return iter_content(self, *args, **kwargs)
+
+    monkeypatch.setattr(DocxStream, "iter_content", counting)
+    return calls
+
+
+def extract(source, tmp_path, extract_type, output_format):
+    output = str(tmp_path / f"{extract_type}.{output_format}")
+    WordProcessor.extract_content(source, output, extract_type, output_format)
+    with open(output, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_text_all_parses_once(source, tmp_path, parses):
+    content = extract(source, tmp_path, "all", "text")
+
+    assert len(parses) == 1
+    # 文本部分在前，表格部分在后
+    assert content == (
+        "# 文档文本内容\n\n第一段\n第二段\n\n## 页眉\n\n页眉文字\n\n\n"
+        "# 文档表格内容\n\n## 表格 1\n\n| a |  |\n|  | b |\n\n\n## 表格 2\n\n| x |\n\n\n"
+    )
+
+
+@pytest.mark.parametrize("extract_type", ["text", "tables"])
+def test_text_sections_match_all(source, tmp_path, parses, extract_type):
+    content = extract(source, tmp_path, extract_type, "text")
+
+    assert len(parses) == 1
+    assert content in extract(source, tmp_path, "all", "text")
+
+
+def test_json_all_parses_once(source, tmp_path, parses):
+    content = json.loads(extract(source, tmp_path, "all", "json"))
+
+    assert len(parses) == 1
+    assert [item["text"] for item in content["paragraphs"]] == ["第一段", "第二段", "页眉文字"]
+    assert [(item["table"], item["row"], item["cells"]) for item in content["rows"]] == [
+        (1, 0, ["a", ""]), (1, 1, ["", "b"]), (2, 0, ["x"])
+    ]
+    assert json.loads(extract(source, tmp_path, "tables", "json")) == {"rows": content["rows"]}
+    assert json.loads(extract(source, tmp_path, "text", "json")) == {"paragraphs": content["paragraphs"]}
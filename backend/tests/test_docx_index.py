@@ -0,0 +1,47 @@
+from docx import Document
+
+from modules.docx_index import DocumentIndex, register_note_parts
+from modules.text_replacer import TextReplacer
+from modules.word_processor import WordProcessor
+from docx_helpers import add_footnotes
+
+
+def make_document(path):
+    """合并单元格、嵌套表格、两个节共用的页眉、页脚和脚注"""
+    doc = Document()
+    doc.add_paragraph("body foo")
+    table = doc.add_table(rows=2, cols=2)
+    merged = table.cell(0, 0).merge(table.cell(0, 1))
+    merged.text = "merged foo"
+    table.cell(1, 0).add_table(rows=1, cols=1).cell(0, 0).text = "nested foo"
+    doc.sections[0].header.paragraphs[0].text = "header foo"
+    doc.sections[0].footer.paragraphs[0].text = "page text"
+    # 第二个节沿用第一个节的页眉页脚
+    doc.add_section()
+    doc.add_paragraph("second section")
+    doc.save(path)
+    add_footnotes(path, [("see note", "note foo")])
+    register_note_parts()
+    return str(path)
+
+
+def test_each_paragraph_listed_once(tmp_path):
+    doc = Document(make_document(tmp_path / "source.docx"))
+    texts = [paragraph.text for paragraph in DocumentIndex(doc).paragraphs()]
+
+    for text in ("body foo", "merged foo", "nested foo", "header foo", "page text", "note foo", "see note"):
+        assert texts.count(text) == 1, text
+
+
+def test_fallback_replace_covers_all_stories(tmp_path):
+    source = make_document(tmp_path / "source.docx")
+    doc = Document(source)
+    changed = WordProcessor._replace_in_document(doc, TextReplacer.compile([("foo", "bar")]))
+    output = str(tmp_path / "output.docx")
+    doc.save(output)
+
+    # 正文、合并单元格、嵌套表格、页眉和脚注各一个段落
+    assert changed == 5
+    texts = [paragraph.text for paragraph in DocumentIndex(Document(output)).paragraphs()]
+    assert "note bar" in texts and "header bar" in texts
+    assert not any("foo" in text for text in texts)
@@ -0,0 +1,110 @@
+import io
+import zipfile
+
+import pytest
+from docx import Document
+from docx.enum.section import WD_ORIENT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from PIL import Image
+
+from modules.docx_index import register_note_parts
+from modules.word_processor import WordProcessor
+from docx_helpers import add_footnotes
+
+
+def png(color):
+    data = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(data, "PNG")
+    return data.getvalue()
+
+
+def make_document(path, label, color, landscape=False, notes=True):
+    """带页眉页脚、编号列表、图片和脚注的文档，文字以label开头"""
+    doc = Document()
+    section = doc.sections[0]
+    if landscape:
+        section.orientation = WD_ORIENT.LANDSCAPE
+        section.page_width, section.page_height = section.page_height, section.page_width
+    section.header.paragraphs[0].text = f"{label} header"
+    section.footer.paragraphs[0].text = f"{label} footer"
+    doc.add_paragraph(f"{label} body")
+    doc.add_paragraph(f"{label} item 1", style="List Number")
+    doc.add_paragraph(f"{label} item 2", style="List Number")
+    doc.add_picture(io.BytesIO(png(color)))
+    doc.save(path)
+    if notes:
+        add_footnotes(path, [(f"{label} ref", f"{label} note")])
+    return str(path)
+
+
+@pytest.fixture
+def merged(tmp_path):
+    sources = [
+        make_document(tmp_path / "a.docx", "A", "red"),
+        make_document(tmp_path / "b.docx", "B", "blue", landscape=True),
+        make_document(tmp_path / "c.docx", "C", "red", notes=False),
+    ]
+    output = str(tmp_path / "merged.docx")
+    WordProcessor.merge_documents(sources, output)
+    register_note_parts()
+    return Document(output), output
+
+
+def test_body_and_sections(merged):
+    doc, _ = merged
+    texts = [paragraph.text for paragraph in doc.paragraphs if paragraph.text]
+
+    assert texts == [
+        "A body", "A item 1", "A item 2", "A ref",
+        "B body", "B item 1", "B item 2", "B ref",
+        "C body", "C item 1", "C item 2",
+    ]
+    # 每个文档保留自己的节属性和页眉页脚
+    assert len(doc.sections) == 3
+    assert [section.orientation for section in doc.sections] == [
+        WD_ORIENT.PORTRAIT, WD_ORIENT.LANDSCAPE, WD_ORIENT.PORTRAIT
+    ]
+    assert [section.header.paragraphs[0].text for section in doc.sections] == ["A header", "B header", "C header"]
+    assert [section.footer.paragraphs[0].text for section in doc.sections] == ["A footer", "B footer", "C footer"]
+
+
+def test_images_are_imported_and_deduplicated(merged):
+    doc, output = merged
+    blips = doc.element.body.findall(".//" + qn("a:blip"))
+    blobs = [doc.part.related_parts[blip.get(qn("r:embed"))].blob for blip in blips]
+
+    assert blobs == [png("red"), png("blue"), png("red")]
+    with zipfile.ZipFile(output) as zf:
+        # 内容相同的图片只保存一份
+        assert len([name for name in zf.namelist() if name.startswith("word/media/")]) == 2
+
+
+def test_numbering_is_imported(merged):
+    doc, _ = merged
+    numbering = doc.part.numbering_part.element
+    num_ids = {num.get(qn("w:numId")) for num in numbering.findall(qn("w:num"))}
+    items = [paragraph for paragraph in doc.paragraphs if " item " in paragraph.text]
+
+    assert len(items) == 6
+    for paragraph in items:
+        assert paragraph.style.name == "List Number"
+    # 编号引用都指向合并后文档中存在的编号定义
+    for num_pr in doc.element.body.iter(qn("w:numPr")):
+        assert num_pr.find(qn("w:numId")).get(qn("w:val")) in num_ids
+
+
+def test_footnotes_are_renumbered(merged):
+    doc, _ = merged
+    notes = {
+        note.get(qn("w:id")): "".join(t.text for t in note.iter(qn("w:t")))
+        for note in doc.part.part_related_by(RT.FOOTNOTES).element.findall(qn("w:footnote"))
+    }
+    references = [
+        (paragraph.text, ref.get(qn("w:id")))
+        for paragraph in doc.paragraphs
+        for ref in paragraph._p.iter(qn("w:footnoteReference"))
+    ]
+
+    assert [(text, notes[note_id]) for text, note_id in references] == [("A ref", "A note"), ("B ref", "B note")]
+    assert len({note_id for _, note_id in references}) == 2
@@ -0,0 +1,138 @@
+import zipfile
+
+import pytest
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
+
+from modules.docx_stream import DocxStream, WORD_MAIN_NS
+from modules.text_replacer import TextReplacer
+from modules.word_processor import WordProcessor
+
+RULES = [("{{name}}", "Alice"), ("foo", "bar"), ("bar", "baz & co"), ("link", " <url> ")]
+TEXT_PARTS = ("word/document.xml", "word/header1.xml", "word/footer1.xml")
+
+
+def add_hyperlink(paragraph, text):
+    """在段落末尾添加一个包含单个run的超链接"""
+    hyperlink = OxmlElement("w:hyperlink")
+    hyperlink.set(qn("w:anchor"), "target")
+    run = OxmlElement("w:r")
+    text_element = OxmlElement("w:t")
+    text_element.text = text
+    run.append(text_element)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def make_document(path):
+    """占位符跨越不同格式的run，包含超链接、嵌套表格、页眉和页脚"""
+    doc = Document()
+    paragraph = doc.add_paragraph("Dear {{na")
+    paragraph.add_run("me}}").bold = True
+    paragraph.add_run(", foo is here")
+    paragraph = doc.add_paragraph("see the ")
+    add_hyperlink(paragraph, "link to foo")
+    paragraph.add_run(" please")
+    doc.add_paragraph("nothing to replace")
+
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "foo cell"
+    table.cell(0, 1).paragraphs[0].add_run("{{")
+    table.cell(0, 1).paragraphs[0].add_run("name").italic = True
+    table.cell(0, 1).paragraphs[0].add_run("}}")
+    table.cell(1, 0).add_table(rows=1, cols=1).cell(0, 0).text = "nested foo"
+
+    section = doc.sections[0]
+    section.header.paragraphs[0].text = "header foo"
+    section.footer.paragraphs[0].text = "page {{name}}"
+    doc.save(path)
+
+
+def part_runs(path):
+    """各文本部件中每个段落的run：(文字, 是否加粗, 是否倾斜)"""
+    w = f"{{{WORD_MAIN_NS}}}"
+    result = {}
+    with zipfile.ZipFile(path) as zf:
+        for name in TEXT_PARTS:
+            root = etree.fromstring(zf.read(name))
+            result[name] = [
+                [
+                    (
+                        "".join(t.text or "" for t in run.iter(f"{w}t")),
+                        run.find(f"{w}rPr/{w}b") is not None,
+                        run.find(f"{w}rPr/{w}i") is not None,
+                    )
+                    for run in paragraph.iter(f"{w}r")
+                ]
+                for paragraph in root.iter(f"{w}p")
+            ]
+    return result
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "source.docx"
+    make_document(path)
+    return path
+
+
+@pytest.mark.parametrize("use_regex", [False, True])
+def test_xml_engine_matches_python_docx(document, tmp_path, use_regex):
+    rules = [(r"\{\{name\}\}", "Alice"), ("fo+", "bar")] if use_regex else RULES
+    outputs = {}
+    for engine in ("xml", "docx"):
+        output_dir = tmp_path / engine
+        output_dir.mkdir()
+        outputs[engine] = WordProcessor.apply_replacements(
+            str(document), rules, use_regex, str(output_dir), engine
+        )
+
+    assert part_runs(outputs["xml"]) == part_runs(outputs["docx"])
+    assert part_runs(outputs["xml"]) != part_runs(document)
+
+
+def test_replaced_text(document, tmp_path):
+    output = WordProcessor.apply_replacements(str(document), RULES, output_dir=str(tmp_path))
+    doc = Document(output)
+
+    assert doc.paragraphs[0].text == "Dear Alice, baz & co is here"
+    # 加粗的run保留格式，承载替换后占位符的剩余部分
+    assert [(run.text, run.bold) for run in doc.paragraphs[0].runs] == [
+        ("Dear Alice", None), ("", True), (", baz & co is here", None)
+    ]
+    assert doc.paragraphs[1].text == "see the  <url>  to baz & co please"
+    assert doc.tables[0].cell(0, 1).text == "Alice"
+    assert doc.tables[0].cell(1, 0).tables[0].cell(0, 0).text == "nested baz & co"
+    assert doc.sections[0].header.paragraphs[0].text == "header baz & co"
+    assert doc.sections[0].footer.paragraphs[0].text == "page Alice"
+
+
+def test_streamed_part_declares_namespaces_once(document, tmp_path):
+    output = str(tmp_path / "output.docx")
+    with DocxStream(str(document)) as stream:
+        changed = stream.replace(output, TextReplacer.compile(RULES))
+
+    assert changed == 7
+    with zipfile.ZipFile(document) as source, zipfile.ZipFile(output) as result:
+        data = result.read("word/document.xml")
+        assert data.startswith(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>')
+        # 顶层块单独序列化后不再重复根元素的命名空间声明
+        assert data.count(b"xmlns:w=") == 1
+        assert etree.fromstring(data).nsmap == etree.fromstring(source.read("word/document.xml")).nsmap
+        # 没有变化的部件原样复制
+        for name in source.namelist():
+            if name not in TEXT_PARTS:
+                assert result.read(name) == source.read(name)
+
+
+def test_unchanged_document_is_copied(document, tmp_path):
+    output = str(tmp_path / "output.docx")
+    with DocxStream(str(document)) as stream:
+        changed = stream.replace(output, TextReplacer.compile([("missing", "x")]))
+
+    assert changed == 0
+    with zipfile.ZipFile(document) as source, zipfile.ZipFile(output) as result:
+        for name in source.namelist():
+            assert result.read(name) == source.read(name)
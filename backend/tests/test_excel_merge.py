@@ -0,0 +1,98 @@
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from modules.excel_processor import ExcelProcessor
+
+
+def write_workbook(path, sheets):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for title, rows in sheets.items():
+        sheet = wb.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    wb.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    first = write_workbook(tmp_path / "first.xlsx", {
+        "A": [["id", "name"], [1, "x"], [2, "y"], [1, "x"]],
+        "B": [["name", "score"], ["z", 3.5]],
+    })
+    second = write_workbook(tmp_path / "second.xlsx", {
+        # 数据比表头宽，第三列没有列名
+        "C": [["id", "city"], [3, "sh", "extra"], [1, None]],
+    })
+    return [first, second]
+
+
+def baseline_merge(file_paths, merge_type, remove_duplicates):
+    """原来的实现：读取全部工作表后用pd.concat合并"""
+    dfs = []
+    for file_path in file_paths:
+        with pd.ExcelFile(file_path) as excel_file:
+            for sheet_name in excel_file.sheet_names:
+                dfs.append(pd.read_excel(file_path, sheet_name=sheet_name))
+    merged = pd.concat(dfs, ignore_index=True) if merge_type == "rows" else pd.concat(dfs, axis=1)
+    return merged.drop_duplicates() if remove_duplicates else merged
+
+
+@pytest.mark.parametrize("merge_type", ["rows", "columns"])
+@pytest.mark.parametrize("remove_duplicates", [False, True])
+def test_merge_matches_concat(tmp_path, workbooks, merge_type, remove_duplicates):
+    output_path = str(tmp_path / "merged.xlsx")
+    ExcelProcessor.merge_excel_files(workbooks, merge_type, output_path, remove_duplicates)
+    expected = baseline_merge(workbooks, merge_type, remove_duplicates).reset_index(drop=True)
+    expected_path = str(tmp_path / "expected.xlsx")
+    expected.to_excel(expected_path, index=False)
+    pd.testing.assert_frame_equal(pd.read_excel(output_path), pd.read_excel(expected_path))
+
+
+def test_rows_parse_each_sheet_once(tmp_path, workbooks, monkeypatch):
+    parsed = []
+    original = pd.ExcelFile.parse
+
+    def parse(self, sheet_name=0, *args, **kwargs):
+        parsed.append(sheet_name)
+        return original(self, sheet_name, *args, **kwargs)
+
+    monkeypatch.setattr(pd.ExcelFile, "parse", parse)
+    ExcelProcessor.merge_excel_files(workbooks, "rows", str(tmp_path / "merged.xlsx"))
+    assert parsed == ["A", "B", "C"]
+
+
+def test_stats_measure_this_merge(tmp_path, workbooks):
+    # 之前的大量分配不应计入本次合并的峰值
+    ballast = b"x" * (200 * 1024 * 1024)
+    del ballast
+    _, stats = ExcelProcessor.merge_excel_files(workbooks, "rows", str(tmp_path / "merged.xlsx"), True, True, True)
+    assert stats["sheets"] == 3
+    assert stats["rows"] == 5
+    assert stats["duplicates_removed"] == 1
+    assert 0 < stats["peak_memory_mb"] < 100
+    assert not tracemalloc.is_tracing()
+
+
+def test_memory_is_not_traced_by_default(tmp_path, workbooks, monkeypatch):
+    monkeypatch.setattr(tracemalloc, "start", lambda *args: pytest.fail("默认不应跟踪内存分配"))
+    _, stats = ExcelProcessor.merge_excel_files(workbooks, "rows", str(tmp_path / "merged.xlsx"), True, True)
+    assert stats["rows"] == 5
+    assert "seconds" in stats and "peak_memory_mb" not in stats
+
+
+def test_sheet_titles_use_upload_names(tmp_path, workbooks):
+    # 上传文件按内容的哈希保存，工作表名称应使用用户上传时的文件名
+    stored = []
+    for index, path in enumerate(workbooks):
+        blob = tmp_path / f"{index:064x}.xlsx"
+        blob.write_bytes(open(path, "rb").read())
+        stored.append(str(blob))
+    output_path = str(tmp_path / "merged.xlsx")
+    ExcelProcessor.merge_excel_files(stored, "sheets", output_path, file_names=["销售.xlsx", "库存.xlsx"])
+
+    assert openpyxl.load_workbook(output_path).sheetnames == ["销售.xlsx_A", "销售.xlsx_B", "库存.xlsx_C"]
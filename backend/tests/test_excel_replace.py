@@ -0,0 +1,87 @@
+import shutil
+import zipfile
+
+import openpyxl
+import pytest
+
+from modules.excel_processor import ExcelProcessor
+from xlsx_helpers import use_shared_strings
+
+RULES = [("foo", "bar"), ("bar", "baz!"), ("<x>", "&y")]
+
+
+def make_workbook(path):
+    """两个工作表，包含重复的共享字符串、数字、公式和一个内联字符串单元格"""
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = "Data"
+    rows = [
+        ["foo", "keep", 1, "foo bar"],
+        ["foo", "<x> foo", 2.5, None],
+        ["other", "foo", '=CONCATENATE("foo",A1)', "bar"],
+    ]
+    for row in rows:
+        sheet.append(row)
+    sheet["A4"] = "placeholder"
+    second = wb.create_sheet("Notes")
+    second.append(["foo notes", "nothing"])
+    wb.save(path)
+    use_shared_strings(path)
+
+    # 再把A4改写为内联字符串
+    patched = str(path) + ".patched"
+    with zipfile.ZipFile(path) as zin, zipfile.ZipFile(patched, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                start = data.index(b'<c r="A4"')
+                end = data.index(b"</c>", start) + len(b"</c>")
+                data = data[:start] + b'<c r="A4" t="inlineStr"><is><t>inline foo</t></is></c>' + data[end:]
+            zout.writestr(info, data)
+    shutil.move(patched, path)
+    return path
+
+
+def cell_values(path):
+    wb = openpyxl.load_workbook(path)
+    return {sheet.title: [[cell.value for cell in row] for row in sheet.iter_rows()] for sheet in wb.worksheets}
+
+
+def run_engine(source, tmp_path, engine, sheet_range=None):
+    output_dir = tmp_path / engine
+    output_dir.mkdir()
+    return ExcelProcessor.apply_replacements(str(source), RULES, sheet_range, False, str(output_dir), engine)
+
+
+@pytest.mark.parametrize("sheet_range", [None, "Data", "Data!A1:B2", "Data!B2:D3"])
+def test_stream_engine_matches_openpyxl(tmp_path, sheet_range):
+    source = make_workbook(tmp_path / "book.xlsx")
+    streamed = cell_values(run_engine(source, tmp_path, "stream", sheet_range))
+    loaded = cell_values(run_engine(source, tmp_path, "openpyxl", sheet_range))
+    assert streamed == loaded
+
+
+def test_whole_workbook_replacement(tmp_path):
+    source = make_workbook(tmp_path / "book.xlsx")
+    values = cell_values(run_engine(source, tmp_path, "stream"))
+    assert values["Data"][0] == ["baz!", "keep", 1, "baz! baz!"]
+    assert values["Data"][1] == ["baz!", "&y baz!", 2.5, None]
+    assert values["Data"][3][0] == "inline baz!"
+    assert values["Notes"][0] == ["baz! notes", "nothing"]
+
+
+@pytest.mark.parametrize("engine", ["stream", "openpyxl"])
+def test_formulas_are_not_rewritten(tmp_path, engine):
+    source = make_workbook(tmp_path / "book.xlsx")
+    values = cell_values(run_engine(source, tmp_path, engine))
+    assert values["Data"][2][2] == '=CONCATENATE("foo",A1)'
+
+
+def test_range_leaves_shared_strings_outside_untouched(tmp_path):
+    source = make_workbook(tmp_path / "book.xlsx")
+    values = cell_values(run_engine(source, tmp_path, "stream", "Data!A1:A1"))
+    # A2和C3与A1共用同一个共享字符串，但不在范围内
+    assert values["Data"][0][0] == "baz!"
+    assert values["Data"][1][0] == "foo"
+    assert values["Data"][2][1] == "foo"
+    assert values["Notes"][0][0] == "foo notes"
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+from PIL import Image
+
+from modules.image_processor import ImageProcessor
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "photo.png"
+    Image.new("RGB", (1500, 1000), (10, 20, 30)).save(path)
+    return str(path)
+
+
+def test_sizes_above_source_are_generated_once(image, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    outputs = ImageProcessor.generate_derivatives(
+        image, sizes=(4096, 2048, 1500, 1024, 128), formats=["png", "jpg"], output_dir=str(output_dir)
+    )
+
+    assert [os.path.basename(path) for path in outputs] == [
+        "photo_1500.png", "photo_1500.jpg", "photo_1024.png", "photo_1024.jpg", "photo_128.png", "photo_128.jpg",
+    ]
+    # 文件名中的尺寸是结果实际的最长边
+    for path in outputs:
+        with Image.open(path) as img:
+            assert max(img.size) == int(os.path.splitext(path)[0].rsplit("_", 1)[1])
+
+
+def test_invalid_sizes(image, tmp_path):
+    with pytest.raises(Exception, match="缩略图尺寸必须大于0"):
+        ImageProcessor.generate_derivatives(image, sizes=(256, 0), output_dir=str(tmp_path))
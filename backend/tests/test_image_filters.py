@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from modules.image_processor import ImageProcessor
+
+PILLOW_FILTERS = {"sharpen": ImageFilter.SHARPEN, "edge_enhance": ImageFilter.EDGE_ENHANCE}
+
+
+@pytest.fixture(scope="module")
+def noise():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (61, 73, 3), dtype=np.uint8))
+
+
+@pytest.fixture(scope="module")
+def photo():
+    """渐变背景上带文字和柔和边缘的色块，亮度在40～215之间"""
+    img = Image.new("RGB", (150, 120))
+    draw = ImageDraw.Draw(img)
+    for y in range(120):
+        draw.line([(0, y), (150, y)], fill=(40 + y, 100, 215 - y))
+    draw.ellipse((30, 20, 100, 90), fill=(215, 195, 60))
+    draw.rectangle((80, 50, 140, 110), fill=(40, 40, 90))
+    draw.text((10, 10), "Hello", fill=(40, 40, 40))
+    return img.filter(ImageFilter.GaussianBlur(1))
+
+
+def baseline(img, filter_type, intensity):
+    """原来的实现：重复int(intensity * 3)次ImageFilter的3×3卷积"""
+    for _ in range(int(intensity * 3)):
+        img = img.filter(PILLOW_FILTERS[filter_type])
+    return np.asarray(img).astype(int)
+
+
+def apply(img, filter_type, intensity):
+    return np.asarray(ImageProcessor._filter(img, filter_type, intensity)).astype(int)
+
+
+@pytest.mark.parametrize("filter_type", sorted(PILLOW_FILTERS))
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_single_step_matches_pillow(noise, filter_type, mode):
+    img = noise.convert(mode)
+
+    assert np.array_equal(apply(img, filter_type, 1 / 3), baseline(img, filter_type, 1 / 3))
+
+
+@pytest.mark.parametrize("filter_type, intensity, max_error", [
+    ("sharpen", 2 / 3, 2),
+    ("sharpen", 1.0, 4),
+    # 边缘增强的放大倍数大，强对比处第一次卷积的结果就会被截断，只比较平均误差
+    ("edge_enhance", 2 / 3, None),
+])
+def test_repeated_steps_match_baseline(photo, filter_type, intensity, max_error):
+    # 重复卷积的中间结果不超出0～255时，合成的卷积核与逐次卷积只有舍入误差
+    error = np.abs(apply(photo, filter_type, intensity) - baseline(photo, filter_type, intensity))
+
+    assert error.mean() < 0.5
+    if max_error is not None:
+        assert error.max() <= max_error
+
+
+@pytest.mark.parametrize("filter_type", sorted(PILLOW_FILTERS))
+def test_border_is_kept(noise, filter_type):
+    result = apply(noise, filter_type, 1.0)
+    source = np.asarray(noise).astype(int)
+
+    for edge in (np.s_[0], np.s_[-1], np.s_[:, 0], np.s_[:, -1]):
+        assert np.array_equal(result[edge], source[edge])
+
+
+def test_fractional_intensity_interpolates(photo):
+    lower = apply(photo, "sharpen", 1 / 3)
+    upper = apply(photo, "sharpen", 2 / 3)
+    middle = apply(photo, "sharpen", 0.5)
+
+    assert np.abs(middle - (lower + upper) / 2).max() <= 1
+    assert np.array_equal(apply(photo, "sharpen", 0), np.asarray(photo))
+
+
+def test_alpha_is_kept(noise):
+    rgba = noise.convert("RGBA")
+    rgba.putalpha(Image.linear_gradient("L").resize(noise.size))
+    result = ImageProcessor._filter(rgba, "edge_enhance", 1.0)
+
+    assert result.mode == "RGBA"
+    assert np.array_equal(np.asarray(result)[..., 3], np.asarray(rgba)[..., 3])
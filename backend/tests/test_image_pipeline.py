@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules.image_processor import ImageProcessor
+
+OPERATIONS = [
+    {"type": "resize", "width": 120, "resample_quality": "high"},
+    {"type": "apply_filter", "filter_type": "brightness", "intensity": 1.2},
+    {"type": "apply_filter", "filter_type": "contrast", "intensity": 0.8},
+    {"type": "apply_filter", "filter_type": "blur", "intensity": 0.5},
+    {"type": "apply_filter", "filter_type": "gamma", "intensity": 1.5},
+]
+
+
+@pytest.fixture
+def image(tmp_path):
+    rng = np.random.default_rng(1)
+    path = tmp_path / "photo.png"
+    Image.fromarray(rng.integers(0, 256, (90, 160, 3), dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def run_separately(path, operations, output_dir):
+    """逐个调用单项操作，每一步都解码和编码一次"""
+    for operation in operations:
+        if operation["type"] == "resize":
+            path = ImageProcessor.resize_image(
+                path, operation["width"], output_dir=output_dir, resample_quality=operation["resample_quality"]
+            )
+        else:
+            path = ImageProcessor.apply_filter(path, operation["filter_type"], operation["intensity"], output_dir)
+    return path
+
+
+def test_pipeline_matches_single_operations(image, tmp_path):
+    separate_dir, fused_dir = tmp_path / "separate", tmp_path / "fused"
+    separate_dir.mkdir()
+    fused_dir.mkdir()
+    separate = run_separately(image, OPERATIONS, str(separate_dir))
+    fused = ImageProcessor.process_image(image, OPERATIONS, str(fused_dir))
+
+    # 输出文件名与逐个调用单项操作时一致；PNG无损，连续的逐像素调整合并后结果也不变
+    assert os.path.basename(fused) == os.path.basename(separate) == "photo_resized_brightness_contrast_blur_gamma.png"
+    assert np.array_equal(np.asarray(Image.open(fused)), np.asarray(Image.open(separate)))
+
+
+def test_pipeline_decodes_and_encodes_once(image, tmp_path, monkeypatch):
+    calls = {"open": 0, "save": 0}
+    open_image, save_image = Image.open, Image.Image.save
+
+    def counting_open(*args, **kwargs):
+        calls["open"] += 1
+        return open_image(*args, **kwargs)
+
+    def counting_save(self, *args, **kwargs):
+        calls["save"] += 1
+        return save_image(self, *args, **kwargs)
+
+    monkeypatch.setattr(Image, "open", counting_open)
+    monkeypatch.setattr(Image.Image, "save", counting_save)
+    operations = OPERATIONS + [{"type": "convert_format", "target_format": "webp", "quality": 80}]
+    output = ImageProcessor.process_image(image, operations, str(tmp_path))
+
+    assert calls == {"open": 1, "save": 1}
+    # 格式转换只影响最终的编码
+    assert output.endswith("photo_resized_brightness_contrast_blur_gamma.webp")
+    assert not any(name.endswith(".png") and name != "photo.png" for name in os.listdir(tmp_path))
+
+
+def test_batch_process_and_invalid_operation(image, tmp_path):
+    outputs = ImageProcessor.batch_process([image, image], OPERATIONS[:1], str(tmp_path))
+
+    assert [os.path.basename(path) for path in outputs] == ["photo_resized.png"] * 2
+    with pytest.raises(Exception, match="不支持的操作类型: crop"):
+        ImageProcessor.process_image(image, [{"type": "crop"}], str(tmp_path))
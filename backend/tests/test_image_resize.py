@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter, JpegImagePlugin
+
+from modules.image_processor import ImageProcessor
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """1600×1200的平滑渐变JPEG"""
+    x = np.linspace(0, 255, 1600)
+    y = np.linspace(0, 255, 1200)[:, np.newaxis]
+    pixels = np.stack([np.broadcast_to(x, (1200, 1600)), np.broadcast_to(y, (1200, 1600)),
+                       (np.sin(x / 40) * np.cos(y / 40) + 1) * 127], axis=-1)
+    img = Image.fromarray(pixels.astype(np.uint8)).filter(ImageFilter.GaussianBlur(2))
+    path = tmp_path / "photo.jpg"
+    img.save(path, quality=95)
+    return str(path)
+
+
+@pytest.fixture
+def drafts(monkeypatch):
+    """记录JPEG缩放解码请求的尺寸和解码后的尺寸"""
+    calls = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+
+    def recording(self, mode, size):
+        result = draft(self, mode, size)
+        calls.append((size, self.size))
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", recording)
+    return calls
+
+
+def resize(photo, tmp_path, quality, width=200):
+    output_dir = tmp_path / quality
+    output_dir.mkdir()
+    output = ImageProcessor.resize_image(photo, width=width, output_dir=str(output_dir), resample_quality=quality)
+    with Image.open(output) as img:
+        return np.asarray(img).astype(int)
+
+
+@pytest.mark.parametrize("quality, decoded", [("balanced", (400, 300)), ("fast", (200, 150))])
+def test_jpeg_is_decoded_at_reduced_scale(photo, tmp_path, drafts, quality, decoded):
+    result = resize(photo, tmp_path, quality)
+
+    assert result.shape == (150, 200, 3)
+    # 请求的尺寸为目标尺寸的reducing_gap倍，按1/4、1/8缩放解码后正好不小于该尺寸
+    assert drafts == [(decoded, decoded)]
+
+
+def test_high_quality_decodes_full_resolution(photo, tmp_path, drafts):
+    resize(photo, tmp_path, "high")
+
+    assert drafts == []
+
+
+@pytest.mark.parametrize("quality, tolerance", [("balanced", 1.0), ("fast", 2.0)])
+def test_reduced_decoding_is_close_to_full_resolution(photo, tmp_path, quality, tolerance):
+    high = resize(photo, tmp_path, "high")
+
+    assert np.abs(resize(photo, tmp_path, quality) - high).mean() < tolerance
+
+
+def test_upscaling_does_not_draft(photo, tmp_path, drafts):
+    result = resize(photo, tmp_path, "balanced", width=2000)
+
+    assert result.shape == (1500, 2000, 3)
+    assert drafts == []
+
+
+def test_invalid_quality(photo, tmp_path):
+    with pytest.raises(Exception, match="不支持的缩放质量"):
+        ImageProcessor.resize_image(photo, width=100, output_dir=str(tmp_path), resample_quality="best")
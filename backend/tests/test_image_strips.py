@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import modules.image_processor as image_processor
+from modules.image_processor import ImageProcessor, ImageTooLarge
+from modules.image_strips import MappedImage, StripReader
+
+SIZE = (257, 301)
+# 可以按条带解码的格式和只能整体解码的格式
+FORMATS = {
+    "tif": {}, "bmp": {}, "ppm": {}, "png": {}, "tif_lzw": {"compression": "tiff_lzw"},
+}
+STREAMED = {"tif", "bmp", "ppm"}
+
+
+@pytest.fixture(scope="module")
+def images(tmp_path_factory):
+    """同一幅带有纯色块的随机RGB图像，保存为各种格式"""
+    directory = tmp_path_factory.mktemp("images")
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (SIZE[1], SIZE[0], 3), dtype=np.uint8)
+    pixels[100:200, 50:150] = (200, 30, 30)
+    img = Image.fromarray(pixels)
+    paths = {}
+    for name, params in FORMATS.items():
+        paths[name] = str(directory / f"{name}.{name.split('_')[0]}")
+        img.save(paths[name], **params)
+    return paths
+
+
+def run(monkeypatch, tmp_path, strips, func, *args, **kwargs):
+    """按条带（每个条带7行）或整幅图像执行处理，返回输出的像素"""
+    monkeypatch.setattr(image_processor, "LARGE_IMAGE_PIXELS", 0 if strips else 10 ** 12)
+    monkeypatch.setattr(image_processor, "STRIP_PIXELS", SIZE[0] * 7)
+    output_dir = tmp_path / ("strips" if strips else "full")
+    output_dir.mkdir(exist_ok=True)
+    with Image.open(func(*args, output_dir=str(output_dir), **kwargs)) as img:
+        return img.mode, np.asarray(img)
+
+
+@pytest.mark.parametrize("name", sorted(FORMATS))
+@pytest.mark.parametrize("operation, kwargs, tolerance", [
+    (ImageProcessor.apply_filter, {"filter_type": "blur"}, 0),
+    (ImageProcessor.apply_filter, {"filter_type": "sharpen", "intensity": 1.5}, 0),
+    (ImageProcessor.apply_filter, {"filter_type": "brightness", "intensity": 0.7}, 0),
+    # 按条带缩放与Image.resize的结果只有舍入误差
+    (ImageProcessor.resize_image, {"width": 100, "resample_quality": "high"}, 1),
+    (ImageProcessor.resize_image, {"width": 600, "height": 500, "keep_aspect_ratio": False}, 1),
+])
+def test_strips_match_full_image(images, monkeypatch, tmp_path, name, operation, kwargs, tolerance):
+    strips = run(monkeypatch, tmp_path, True, operation, images[name], **kwargs)
+    full = run(monkeypatch, tmp_path, False, operation, images[name], **kwargs)
+
+    assert strips[0] == full[0]
+    assert np.abs(strips[1].astype(int) - full[1].astype(int)).max() <= tolerance
+
+
+@pytest.mark.parametrize("name", sorted(FORMATS))
+def test_streamed_formats(images, tmp_path, name):
+    reader = StripReader(Image.open(images[name]), "RGB", str(tmp_path), 1000)
+
+    assert reader.streamed == (name in STREAMED)
+    assert np.array_equal(np.asarray(reader.read(10, 20)), np.asarray(Image.open(images[name]))[10:20])
+
+
+def test_default_pixel_limit_is_kept():
+    assert Image.MAX_IMAGE_PIXELS == int(1024 * 1024 * 1024 // 4 // 3)
+
+
+@pytest.mark.parametrize("name", sorted(FORMATS))
+def test_oversized_images_must_stream(images, monkeypatch, tmp_path, name):
+    # 测试图像超过默认限制的2倍，只有能按条带解码的图像可以打开
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    monkeypatch.setattr(image_processor, "STRIP_PIXELS", SIZE[0] * 7)
+
+    if name in STREAMED:
+        output = ImageProcessor.resize_image(images[name], width=20, output_dir=str(tmp_path))
+        assert Image.open(output).size == (20, 23)
+    else:
+        with pytest.raises(ImageTooLarge):
+            ImageProcessor.resize_image(images[name], width=100, output_dir=str(tmp_path))
+    assert Image.MAX_IMAGE_PIXELS == 1000
+
+    monkeypatch.setattr(image_processor, "MAX_STREAMED_PIXELS", SIZE[0] * SIZE[1] - 1)
+    with pytest.raises(ImageTooLarge):
+        ImageProcessor.resize_image(images[name], width=100, output_dir=str(tmp_path))
+
+
+def mapped_rgb(tmp_path):
+    mapped = MappedImage("RGB", (5, 3), str(tmp_path), 100)
+    rows = np.arange(45, dtype=np.uint8).reshape(3, 5, 3)
+    mapped.write(0, Image.fromarray(rows))
+    return mapped, rows
+
+
+def test_to_image_maps_temporary_file(tmp_path):
+    # to_image使用Pillow的底层接口，升级Pillow后这里失败说明需要修改MappedImage.to_image
+    mapped, rows = mapped_rgb(tmp_path)
+    img = mapped.to_image()
+
+    assert img.mode == "RGB" and img.size == (5, 3)
+    assert np.array_equal(np.asarray(img), rows)
+    # 不复制像素：修改临时文件中的像素后图像随之变化
+    mapped.array[0, 0, :3] = (255, 254, 253)
+    assert img.getpixel((0, 0)) == (255, 254, 253)
+
+
+def test_to_image_without_map_buffer(tmp_path, monkeypatch):
+    monkeypatch.delattr(Image.core, "map_buffer")
+    mapped, rows = mapped_rgb(tmp_path)
+    img = mapped.to_image()
+
+    assert img.mode == "RGB"
+    assert np.array_equal(np.asarray(img), rows)
@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+import modules.image_processor as image_processor
+from modules.image_processor import ImageProcessor
+
+
+def reference(img, text=None, mark_path=None, position="center", opacity=0.5, rotation=0):
+    """原来的实现：在整幅透明水印层上绘制水印，再与整幅图像合成"""
+    img = img.convert("RGBA")
+    layer = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    if text:
+        try:
+            font = ImageFont.truetype("arial.ttf", 36)
+        except IOError:
+            font = ImageFont.load_default()
+        draw = ImageDraw.Draw(layer)
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        draw.text(ImageProcessor._position(img.size, (right - left, bottom - top), position), text,
+                  fill=(255, 255, 255, int(255 * opacity)), font=font)
+        if rotation:
+            layer = layer.rotate(rotation, expand=1).resize(img.size)
+    else:
+        mark = Image.open(mark_path).convert("RGBA")
+        width, height = mark.size
+        if width > img.width // 4 or height > img.height // 4:
+            scale = min(img.width // 4 / width, img.height // 4 / height)
+            width, height = int(width * scale), int(height * scale)
+            mark = mark.resize((width, height), Image.LANCZOS)
+        if opacity < 1:
+            mark = ImageEnhance.Brightness(mark).enhance(opacity)
+        if rotation:
+            mark = mark.rotate(rotation, expand=1)
+        layer.paste(mark, ImageProcessor._position(img.size, (width, height), position), mark)
+    return np.asarray(Image.alpha_composite(img, layer).convert("RGB")).astype(int)
+
+
+@pytest.fixture
+def photo():
+    rng = np.random.default_rng(2)
+    return Image.fromarray(rng.integers(0, 256, (180, 240, 3), dtype=np.uint8))
+
+
+@pytest.fixture
+def mark(tmp_path):
+    """半透明的水印图像"""
+    rng = np.random.default_rng(3)
+    pixels = rng.integers(0, 256, (80, 100, 4), dtype=np.uint8)
+    path = tmp_path / "mark.png"
+    Image.fromarray(pixels, "RGBA").save(path)
+    return str(path)
+
+
+def watermark(img, *args, **kwargs):
+    return np.asarray(ImageProcessor._watermark(img.copy(), *args, **kwargs)).astype(int)
+
+
+@pytest.mark.parametrize("position", ["center", "top-left", "bottom-right"])
+@pytest.mark.parametrize("rotation", [0, 30])
+def test_text_matches_full_layer(photo, position, rotation):
+    result = watermark(photo, "样例 Sample", position=position, opacity=0.6, rotation=rotation)
+
+    assert np.array_equal(result, reference(photo, "样例 Sample", position=position, opacity=0.6, rotation=rotation))
+
+
+@pytest.mark.parametrize("opacity, rotation", [(0.5, 0), (1.0, 0), (0.7, 45)])
+def test_image_matches_full_layer(photo, mark, opacity, rotation):
+    result = watermark(photo, watermark_image=mark, position="bottom-left", opacity=opacity, rotation=rotation)
+    expected = reference(photo, mark_path=mark, position="bottom-left", opacity=opacity, rotation=rotation)
+
+    assert np.abs(result - expected).max() <= 1
+
+
+def test_large_rotated_text_is_close_to_full_layer(photo):
+    # 大图像只旋转文本图块，与旋转整个水印层的结果只有重采样误差：位置相同，墨迹总量接近
+    layers = []
+    for render in (image_processor._rotated_text_tile, image_processor._large_rotated_text_tile):
+        tile, position = render("Sample", "arial.ttf", 72, 0.8, 30, photo.size, "center")
+        layer = Image.new("RGBA", photo.size)
+        layer.alpha_composite(tile, position)
+        layers.append(np.asarray(layer)[..., 3].astype(float))
+    centers = [np.array([np.average(np.indices(alpha.shape)[axis], weights=alpha) for axis in (0, 1)])
+               for alpha in layers]
+
+    assert np.abs(centers[0] - centers[1]).max() < 1.5
+    assert abs(layers[0].sum() / layers[1].sum() - 1) < 0.1
+
+
+def test_tiles_are_rendered_once(photo, mark, tmp_path):
+    image_processor._text_tile.cache_clear()
+    image_processor._image_tile.cache_clear()
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(open(mark, "rb").read())
+
+    for _ in range(3):
+        ImageProcessor._watermark(photo.copy(), "Sample")
+    # 内容相同的水印图像按摘要共用同一个图块
+    ImageProcessor._watermark(photo.copy(), watermark_image=mark)
+    ImageProcessor._watermark(photo.copy(), watermark_image=str(copy))
+
+    assert image_processor._text_tile.cache_info()[:2] == (2, 1)
+    assert image_processor._image_tile.cache_info()[:2] == (1, 1)
+
+
+def full_layer(img, text):
+    """整幅图像与水印层合成后转换回原模式"""
+    layer = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    tile, size = image_processor._text_tile(text, "arial.ttf", 36, 0.5)
+    layer.paste(tile, ImageProcessor._position(img.size, size, "center"))
+    return Image.alpha_composite(img.convert("RGBA"), layer)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA"])
+def test_mode_is_kept(photo, mode):
+    img = photo.convert(mode)
+    if mode in ("RGBA", "LA"):
+        img.putalpha(Image.linear_gradient("L").resize(img.size))
+    result = ImageProcessor._watermark(img.copy(), "Sample")
+
+    assert result.mode == mode
+    assert np.array_equal(np.asarray(result), np.asarray(full_layer(img, "Sample").convert(mode)))
+
+
+@pytest.mark.parametrize("transparency, mode", [(True, "RGBA"), (False, "RGB")])
+def test_palette_images_are_converted(photo, transparency, mode):
+    img = photo.quantize(16)
+    if transparency:
+        img.info["transparency"] = 0
+
+    assert ImageProcessor._watermark(img, "Sample").mode == mode
+
+
+def test_only_covered_region_changes_in_place(photo):
+    img = photo.copy()
+    tile, size = image_processor._text_tile("Sample", "arial.ttf", 36, 0.5)
+    left, top = ImageProcessor._position(img.size, size, "center")
+    result = ImageProcessor._watermark(img, "Sample")
+
+    # 直接修改传入的图像，图块之外的像素不变
+    assert result is img
+    changed = np.argwhere((np.asarray(result) != np.asarray(photo)).any(axis=-1))
+    assert changed.size
+    assert changed[:, 0].min() >= top and changed[:, 0].max() < top + tile.height
+    assert changed[:, 1].min() >= left and changed[:, 1].max() < left + tile.width
+
+
+def test_tile_outside_image_is_clipped(photo):
+    tile = Image.new("RGBA", (50, 50), (255, 0, 0, 255))
+    img = photo.copy()
+    ImageProcessor._composite(img, tile, (-20, 160))
+    ImageProcessor._composite(img, tile, (300, 10))
+
+    result = np.asarray(img)
+    assert (result[160:, :30] == (255, 0, 0)).all()
+    assert np.array_equal(result[:160], np.asarray(photo)[:160])
+    assert np.array_equal(result[160:, 30:], np.asarray(photo)[160:, 30:])
+
+
+def test_png_transparency_is_saved(photo, tmp_path):
+    path = tmp_path / "logo.png"
+    transparent = photo.convert("RGBA")
+    transparent.putalpha(0)
+    transparent.save(path)
+
+    output = ImageProcessor.add_watermark(str(path), "Sample", output_dir=str(tmp_path))
+
+    with Image.open(output) as img:
+        assert img.mode == "RGBA"
+        alpha = np.asarray(img)[..., 3]
+        # 水印之外仍然完全透明，水印处的透明度来自水印本身
+        assert (alpha == 0).mean() > 0.9 and alpha.max() == 127
@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+from modules.janitor import TempJanitor
+
+NOW = time.time()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    uploads, outputs = tmp_path / "uploads", tmp_path / "outputs"
+    uploads.mkdir()
+    outputs.mkdir()
+    return uploads, outputs
+
+
+def entry(directory, name, age, size=10):
+    """创建修改时间为age秒前的文件，name以/结尾时创建包含该文件的目录"""
+    path = directory / name.rstrip("/")
+    if name.endswith("/"):
+        path.mkdir()
+        (path / "result.bin").write_bytes(b"x" * size)
+    else:
+        path.write_bytes(b"x" * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+def janitor(tmp_path, dirs, **kwargs):
+    params = dict(max_age=3600, max_bytes=1000, min_free_bytes=0, grace=300)
+    params.update(kwargs)
+    return TempJanitor(str(tmp_path), [str(directory) for directory in dirs], **params)
+
+
+def test_expired_entries_are_removed(tmp_path, dirs):
+    uploads, outputs = dirs
+    old_file = entry(uploads, "old.docx", 4000)
+    old_dir = entry(outputs, "old/", 5000, size=25)
+    fresh = entry(outputs, "fresh.zip", 100)
+    recent = entry(uploads, "recent.xlsx", 1000)
+    cleaner = janitor(tmp_path, dirs)
+
+    assert cleaner.sweep() == 35
+    assert not old_file.exists() and not old_dir.exists()
+    assert fresh.exists() and recent.exists()
+    metrics = cleaner.metrics()
+    assert (metrics["sweeps"], metrics["removed"], metrics["bytes_reclaimed"], metrics["tracked_bytes"]) == (1, 2, 35, 20)
+
+
+def test_quota_removes_oldest_first(tmp_path, dirs):
+    uploads, outputs = dirs
+    oldest = entry(uploads, "a", 3000, size=40)
+    middle = entry(outputs, "b", 2000, size=40)
+    newest = entry(uploads, "c", 1000, size=40)
+    protected = entry(outputs, "d", 10, size=40)
+
+    # 总大小160超过上限100，从最旧的开始删除；保护时间内的条目即使超出上限也保留
+    assert janitor(tmp_path, dirs, max_bytes=100).sweep() == 80
+    assert not oldest.exists() and not middle.exists()
+    assert newest.exists() and protected.exists()
+
+
+def test_in_use_and_excluded_entries_are_kept(tmp_path, dirs):
+    uploads, outputs = dirs
+    shared = entry(uploads, "shared.docx", 9000)
+    jobs = entry(outputs, "jobs/", 9000)
+    orphan = entry(uploads, "orphan.docx", 9000)
+    cleaner = janitor(tmp_path, dirs, exclude=["jobs"], in_use=lambda path: path == str(shared))
+
+    cleaner.sweep()
+
+    assert shared.exists() and jobs.exists() and not orphan.exists()
+
+
+def test_low_space(tmp_path, dirs, monkeypatch):
+    uploads, _ = dirs
+    first = entry(uploads, "first", 2000, size=30)
+    second = entry(uploads, "second", 1500, size=30)
+    third = entry(uploads, "third", 1000, size=30)
+    cleaner = janitor(tmp_path, dirs, min_free_bytes=150)
+    monkeypatch.setattr(cleaner, "free_bytes", lambda: 100)
+
+    assert not cleaner.check_space()
+    # 未过期、未超出上限的条目只在剩余空间不足时删除，删到剩余空间恢复为止
+    assert cleaner.sweep() == 0
+    assert cleaner.sweep(low_space=True) == 60
+    assert not first.exists() and not second.exists() and third.exists()
+    metrics = cleaner.metrics()
+    assert (metrics["low_space_rejections"], metrics["free_bytes"]) == (1, 100)
+
+
+def test_concurrent_sweep_returns_immediately(tmp_path, dirs):
+    uploads, _ = dirs
+    old = entry(uploads, "old", 9000)
+    cleaner = janitor(tmp_path, dirs)
+
+    with cleaner._sweep_lock:
+        assert cleaner.sweep() == 0
+    assert old.exists()
+    assert cleaner.sweep() == 10
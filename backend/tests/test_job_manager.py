@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+import zipfile
+
+import pytest
+
+from modules.dispatcher import Dispatcher
+from modules.job_manager import JobManager
+from modules.worker_pool import FileResult, WorkerPool
+
+
+@pytest.fixture
+def manager(tmp_path):
+    dispatcher = Dispatcher(WorkerPool(1), io_workers=1)
+    yield JobManager(dispatcher, str(tmp_path / "jobs"), ttl=60)
+    dispatcher.shutdown()
+
+
+def wait_until(condition, timeout=2):
+    """等待I/O线程池中的清理任务完成"""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def upload(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+async def results_for(items, gate=None):
+    for source, output, error in items:
+        if gate is not None:
+            await gate.wait()
+        yield FileResult(source, output, error)
+
+
+def test_job_completes_with_results_and_errors(manager, tmp_path):
+    ok = upload(tmp_path, "8f3a.txt", b"input")
+    bad = upload(tmp_path, "77c1.txt", b"input")
+    output = upload(tmp_path, "8f3a_out.txt", b"output")
+    results = results_for([(ok, output, None), (bad, None, f"cannot open {bad}")])
+
+    async def run():
+        job = manager.create("rename", ["报告.txt", "清单.txt"])
+        manager.start(job, results, [ok, bad], [output])
+        await job.task
+        return job
+
+    job = asyncio.run(run())
+    state = manager.describe(job)
+
+    assert state["status"] == "completed" and state["error"] is None
+    assert (state["total"], state["processed"], state["completed"], state["failed"]) == (2, 2, 1, 1)
+    assert state["progress"] == 1.0 and state["eta_seconds"] is None
+    assert state["expires_at"] == job.finished_at + 60
+    assert [item["status"] for item in state["files"]] == ["done", "failed"]
+    with zipfile.ZipFile(job.archive_path) as zf:
+        assert zf.read("报告_out.txt") == b"output"
+        # 错误信息使用上传时的文件名，不包含服务器路径
+        assert zf.read("errors.txt").decode("utf-8") == "清单.txt: cannot open 清单.txt\n"
+    wait_until(lambda: not os.path.exists(output))
+    assert manager.metrics()["by_status"] == {"completed": 1}
+
+
+def test_duplicate_uploads_map_to_their_own_entries(manager, tmp_path):
+    # 内容相同的上传文件共用同一路径
+    shared = upload(tmp_path, "5e5e.txt", b"same")
+    output = upload(tmp_path, "5e5e_out.txt", b"1")
+    results = results_for([(shared, output, None), (shared, None, "失败")])
+
+    async def run():
+        job = manager.create("rename", ["a.txt", "b.txt"])
+        manager.start(job, results, [shared, shared], [])
+        await job.task
+        return job
+
+    job = asyncio.run(run())
+
+    assert [(item["name"], item["status"]) for item in job.files] == [("a.txt", "done"), ("b.txt", "failed")]
+
+
+def test_delete_cancels_running_job(manager, tmp_path):
+    source = upload(tmp_path, "1a2b.txt", b"input")
+
+    async def run():
+        gate = asyncio.Event()
+        job = manager.create("rename", ["a.txt"])
+        manager.start(job, results_for([(source, source, None)], gate), [source], [])
+        await asyncio.sleep(0.01)
+        running = manager.describe(job)["status"]
+        assert manager.delete(job.id)
+        with pytest.raises(asyncio.CancelledError):
+            await job.task
+        return job, running
+
+    job, running = asyncio.run(run())
+
+    assert running == "running"
+    assert job.status == "cancelled"
+    assert manager.get(job.id) is None
+    assert not manager.delete(job.id)
+    wait_until(lambda: not os.path.exists(job.job_dir))
+
+
+def test_failed_job_reports_error(manager, tmp_path):
+    async def broken():
+        raise RuntimeError("磁盘已满")
+        yield
+
+    async def run():
+        job = manager.create("rename", ["a.txt"])
+        manager.start(job, broken(), [], [])
+        await job.task
+        return job
+
+    job = asyncio.run(run())
+
+    assert (job.status, job.error) == ("failed", "磁盘已满")
+
+
+def test_purge_expired(manager, tmp_path):
+    source = upload(tmp_path, "9d9d.txt", b"input")
+
+    async def run():
+        job = manager.create("rename", ["a.txt"])
+        manager.start(job, results_for([(source, source, None)]), [source], [])
+        await job.task
+        queued = manager.create("rename", ["b.txt"])
+        return job, queued
+
+    job, queued = asyncio.run(run())
+
+    assert manager.purge_expired() == 0
+    job.finished_at -= 61
+    # 只删除已结束且超过保留时间的任务
+    assert manager.purge_expired() == 1
+    assert manager.get(job.id) is None and manager.get(queued.id) is queued
+    wait_until(lambda: not os.path.exists(job.job_dir))
@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+
+from modules.result_cache import ResultCache
+
+DIGESTS = ["a" * 64, "b" * 64]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache"), max_bytes=10, ttl=60)
+
+
+def result(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_key_depends_on_route_params_and_inputs(cache):
+    key = cache.key("/api/word/merge", DIGESTS, {"b": 1, "a": [1, 2]})
+
+    # 参数的顺序不影响键，输入文件的顺序影响
+    assert key == cache.key("/api/word/merge", DIGESTS, {"a": [1, 2], "b": 1})
+    assert key != cache.key("/api/word/merge", DIGESTS[::-1], {"a": [1, 2], "b": 1})
+    assert key != cache.key("/api/excel/merge", DIGESTS, {"a": [1, 2], "b": 1})
+    assert key != cache.key("/api/word/merge", DIGESTS, {"a": [1, 2], "b": 2})
+
+
+def test_hit_and_miss(cache, tmp_path):
+    source = result(tmp_path, "out.docx", b"12345")
+    key = cache.key("/api/word/merge", DIGESTS, {})
+
+    assert cache.get(key) is None
+    path = cache.put(key, source, {"seconds": 1})
+
+    assert cache.get(key) == (path, {"seconds": 1})
+    # 原结果文件保持不变，可以照常删除
+    assert open(path, "rb").read() == b"12345"
+    os.remove(source)
+    assert cache.get(key) == (path, {"seconds": 1})
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["stores"], metrics["hit_rate"]) == (2, 1, 1, 0.667)
+    assert (metrics["entries"], metrics["bytes"]) == (1, 5)
+
+
+def test_least_recently_used_is_evicted(cache, tmp_path):
+    first = cache.put("first", result(tmp_path, "1", b"1234"))
+    cache.put("second", result(tmp_path, "2", b"1234"))
+    # 访问first后second成为最近最少使用的条目
+    assert cache.get("first") is not None
+    cache.put("third", result(tmp_path, "3", b"1234"))
+
+    assert cache.get("second") is None
+    assert cache.get("first") == (first, None) and cache.get("third") is not None
+    assert cache.metrics()["evictions"] == 1 and cache.metrics()["bytes"] == 8
+    assert sorted(os.listdir(cache.cache_dir)) == ["first", "third"]
+
+
+def test_oversized_results_are_not_cached(cache, tmp_path):
+    assert cache.put("big", result(tmp_path, "big", b"x" * 11)) is None
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_expired_results_are_removed(cache, tmp_path, monkeypatch):
+    path = cache.put("old", result(tmp_path, "old", b"1"))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert cache.get("old") is None
+    assert not os.path.exists(path)
+    assert cache.metrics()["expired"] == 1
+
+
+def test_writer_commit_and_discard(cache):
+    writer = cache.writer("streamed")
+    assert list(writer.tee([b"ab", b"cd"])) == [b"ab", b"cd"]
+    writer.write(b"e")
+    path = writer.commit({"files": 2})
+
+    assert cache.get("streamed") == (path, {"files": 2})
+    assert open(path, "rb").read() == b"abcde"
+
+    writer = cache.writer("cancelled")
+    writer.write(b"partial")
+    writer.discard()
+    assert cache.get("cancelled") is None
+    assert sorted(os.listdir(cache.cache_dir)) == ["streamed"]
+
+
+def test_disabled_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=0)
+
+    assert not cache.enabled
+    assert cache.put("key", result(tmp_path, "out", b"1")) is None
+    assert cache.writer("key") is None
@@ -0,0 +1,70 @@
+import random
+
+from modules.text_replacer import TextReplacer
+
+
+def replace_sequentially(text, replacements):
+    """原来的实现：逐条规则调用str.replace"""
+    for find_text, replace_text in replacements:
+        if find_text:
+            text = text.replace(find_text, replace_text)
+    return text
+
+
+def test_later_rules_see_earlier_output():
+    replacer = TextReplacer([("a", "b"), ("b", "c")])
+    assert replacer.apply("ab") == "cc"
+
+
+def test_first_rule_wins_on_overlapping_keys():
+    assert TextReplacer([("ab", "X"), ("abc", "Y")]).apply("abcd") == "Xcd"
+    assert TextReplacer([("abc", "Y"), ("ab", "X")]).apply("abcd") == "Yd"
+    assert TextReplacer([("bc", "X"), ("ab", "Y")]).apply("abc") == "aX"
+
+
+def test_duplicate_keys_apply_in_order():
+    assert TextReplacer([("a", "ab"), ("a", "c")]).apply("a") == "cb"
+
+
+def test_deletion_joins_text_for_later_rules():
+    assert TextReplacer([("-", ""), ("ab", "X")]).apply("a-b") == "X"
+
+
+def test_independent_rules_share_one_pass():
+    replacer = TextReplacer([(f"{{field{i}}}", f"value{i}") for i in range(100)])
+    assert len(replacer._passes) == 1
+    assert replacer.apply("{field1}-{field42}") == "value1-value42"
+
+
+def test_regex_rules_apply_in_order():
+    replacer = TextReplacer([(r"(\d+)", r"<\1>"), (r"<(\d)>", r"[\1]")], use_regex=True)
+    assert replacer.apply("7 and 42") == "[7] and <42>"
+
+
+def test_no_match_returns_none_for_segments():
+    assert TextReplacer([("zz", "y")]).replace_segments(["a", "b"]) is None
+
+
+def test_match_across_segments_keeps_other_segments():
+    replacer = TextReplacer([("lo wo", "LO-WO")])
+    assert replacer.replace_segments(["hel", "lo ", "world", "!"]) == ["hel", "LO-WO", "rld", "!"]
+
+
+def test_random_rules_match_sequential_replace():
+    rng = random.Random(0)
+    alphabet = "abc"
+
+    def word(low, high):
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+    for _ in range(3000):
+        replacements = [(word(1, 3), word(0, 3)) for _ in range(rng.randint(1, 6))]
+        text = "".join(rng.choice(alphabet + "x") for _ in range(rng.randint(0, 15)))
+        expected = replace_sequentially(text, replacements)
+        replacer = TextReplacer(replacements)
+        assert replacer.apply(text) == expected
+
+        cuts = sorted(rng.sample(range(len(text) + 1), min(3, len(text) + 1)))
+        segments = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        result = replacer.replace_segments(segments)
+        assert "".join(segments if result is None else result) == expected
@@ -0,0 +1,97 @@
+from typing import List
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from modules.upload_limits import UploadLimits, UploadLimitMiddleware, _FileCounter
+
+
+@pytest.fixture
+def limits():
+    return UploadLimits(max_bytes=2048, max_files=2, max_concurrent=1)
+
+
+@pytest.fixture
+def client(limits):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(files: List[UploadFile] = File(...)):
+        return {"sizes": [len(await file.read()) for file in files]}
+
+    @app.get("/status")
+    async def status():
+        return {"ok": True}
+
+    app.add_middleware(UploadLimitMiddleware, limits=limits)
+    return TestClient(app)
+
+
+def files(count, size=10):
+    return [("files", (f"{index}.txt", b"x" * size, "text/plain")) for index in range(count)]
+
+
+def test_upload_within_limits(client, limits):
+    response = client.post("/upload", files=files(2))
+
+    assert response.status_code == 200
+    assert response.json() == {"sizes": [10, 10]}
+    assert client.get("/status").status_code == 200
+    metrics = limits.metrics()
+    assert (metrics["completed"], metrics["rejected"], metrics["receiving"], metrics["waiting"]) == (1, 0, 0, 0)
+
+
+def test_content_length_over_limit(client, limits):
+    response = client.post("/upload", files=files(1, 4096))
+
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith("请求体超过上限")
+    assert limits.metrics()["rejected"] == 1
+
+
+def test_streamed_body_over_limit(client, limits):
+    # 没有Content-Length的分块请求体在超出上限时中止
+    def chunks():
+        yield b'--b0undary\r\nContent-Disposition: form-data; name="files"; filename="a.txt"\r\n\r\n'
+        for _ in range(10):
+            yield b"x" * 512
+        yield b"\r\n--b0undary--\r\n"
+
+    response = client.post("/upload", content=chunks(), headers={"content-type": "multipart/form-data; boundary=b0undary"})
+
+    assert response.status_code == 413
+    assert limits.metrics()["rejected"] == 1 and limits.metrics()["receiving"] == 0
+
+
+def test_too_many_files(client, limits):
+    response = client.post("/upload", files=files(3))
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "上传文件数超过上限2"}
+    # 名额已经释放，之后的上传不受影响
+    assert client.post("/upload", files=files(1)).status_code == 200
+
+
+def test_low_disk_space(client, limits):
+    limits.disk_guard = lambda: False
+
+    response = client.post("/upload", files=files(1))
+
+    assert response.status_code == 503
+    assert client.get("/status").status_code == 200
+
+
+def test_file_counter_across_chunks():
+    boundary = b"b0undary"
+    body = b"".join(
+        b"--" + boundary + b'\r\nContent-Disposition: form-data; name="files"; filename="' + name + b'"\r\n\r\ndata\r\n'
+        for name in (b"a.txt", b"b.txt", b"c.txt")
+    ) + b"--" + boundary + b'\r\nContent-Disposition: form-data; name="mode"\r\n\r\nrows\r\n--' + boundary + b"--\r\n"
+
+    counter = _FileCounter(boundary)
+    for index in range(len(body)):
+        counter.feed(body[index:index + 1])
+
+    assert counter.files == 3
+    assert _FileCounter(boundary).feed(body) == 3
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from modules.upload_store import UploadStore
+
+
+class ReadOnly:
+    """只有read方法的文件对象"""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+
+    def read(self, size):
+        return self._file.read(size)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / "uploads"), chunk_size=4)
+
+
+def test_save_names_file_by_digest(store):
+    data = b"hello world"
+    path = store.save(io.BytesIO(data), "报告.DOCX")
+
+    assert os.path.basename(path) == hashlib.sha256(data).hexdigest() + ".DOCX"
+    assert open(path, "rb").read() == data
+    assert store.owns(path) and store.digest(path) == hashlib.sha256(data).hexdigest()
+    # 只留下最终的文件，不留临时文件
+    assert os.listdir(store.upload_dir) == [os.path.basename(path)]
+
+
+@pytest.mark.parametrize("file_obj", [io.BytesIO, ReadOnly])
+def test_chunked_copy(store, file_obj):
+    data = bytes(range(256)) * 3
+    path = store.save(file_obj(data), "data.bin")
+
+    assert open(path, "rb").read() == data
+
+
+def test_duplicates_share_one_file_until_released(store):
+    first = store.save(io.BytesIO(b"same"), "a.xlsx")
+    second = store.save(io.BytesIO(b"same"), "b.xlsx")
+    other_extension = store.save(io.BytesIO(b"same"), "c.csv")
+
+    assert first == second != other_extension
+    metrics = store.metrics()
+    assert (metrics["saved"], metrics["deduplicated"], metrics["bytes_saved"]) == (2, 1, 4)
+    assert (metrics["blobs"], metrics["references"], metrics["bytes"]) == (2, 3, 8)
+
+    # 最后一个引用释放后才删除文件
+    store.release([first])
+    assert os.path.exists(first) and store.owns(first)
+    store.release([second, other_extension])
+    assert not os.path.exists(first) and not store.owns(first)
+    assert os.listdir(store.upload_dir) == []
+
+
+def test_release_ignores_unknown_paths(store, tmp_path):
+    outside = tmp_path / "output.txt"
+    outside.write_bytes(b"result")
+    path = store.save(io.BytesIO(b"data"), "a.txt")
+
+    store.release([None, str(outside), path, path])
+
+    assert outside.exists()
+    assert store.metrics()["references"] == 0
+    # 不在本存储中的文件重新计算摘要
+    assert store.digest(str(outside)) == hashlib.sha256(b"result").hexdigest()
+
+
+def test_failed_upload_leaves_nothing(store):
+    class Broken(ReadOnly):
+        def read(self, size):
+            if self._file.tell():
+                raise OSError("连接中断")
+            return super().read(size)
+
+    with pytest.raises(OSError):
+        store.save(Broken(b"partial data"), "a.txt")
+
+    assert os.listdir(store.upload_dir) == []
+    assert store.metrics()["blobs"] == 0
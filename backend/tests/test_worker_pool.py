@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+import pytest
+
+from modules.worker_pool import WorkerPool, FileResult
+
+
+def process(item):
+    """模拟处理单个文件：crash使工作进程直接退出（如被OOM终止），bad抛出异常"""
+    if item == "crash":
+        os._exit(1)
+    if item == "bad":
+        raise ValueError("无法处理")
+    return item.upper()
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(2)
+    yield pool
+    pool.shutdown()
+
+
+def test_map_keeps_order_and_isolates_failures(pool):
+    results = asyncio.run(pool.map(process, ["a", "bad", "b", "a"]))
+
+    assert results == [
+        FileResult("a", "A", None),
+        FileResult("bad", None, "无法处理"),
+        FileResult("b", "B", None),
+        FileResult("a", "A", None),
+    ]
+
+
+def test_pool_recovers_after_worker_crash(pool):
+    async def run():
+        crashed = await pool.map(process, ["crash", "x"])
+        # 进程池损坏后提交的批次和单个任务使用重新创建的进程池
+        return crashed, await pool.map(process, ["c", "d"]), await pool.submit(process, "e")
+
+    crashed, results, single = asyncio.run(run())
+
+    assert crashed[0].source == "crash" and crashed[0].output is None and crashed[0].error
+    assert all(isinstance(result, FileResult) for result in crashed)
+    assert results == [FileResult("c", "C", None), FileResult("d", "D", None)]
+    assert single == "E"
+
+
+def test_submit_after_broken_pool_is_detected_late(pool):
+    async def run():
+        # 不等待任务结果时进程池的损坏只在下一次提交时才被发现
+        executor = pool.executor
+        with pytest.raises(Exception):
+            await asyncio.wrap_future(executor.submit(process, "crash"))
+        return await pool.submit(process, "f")
+
+    assert asyncio.run(run()) == "F"
@@ -0,0 +1,99 @@
+import datetime
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.styles import Font
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from modules.excel_processor import ExcelProcessor
+from modules.xlsx_merger import XlsxMerger
+from xlsx_helpers import use_shared_strings
+
+DATE = datetime.datetime(2024, 2, 29, 13, 30)
+TIME = datetime.time(6, 15)
+
+
+def make_workbook(path, label, date1904=False):
+    wb = openpyxl.Workbook()
+    if date1904:
+        wb.epoch = CALENDAR_MAC_1904
+    sheet = wb.active
+    sheet.title = "Data"
+    sheet.append(["name", "when", "time", "amount"])
+    sheet.append([label, DATE, TIME, 1234.5])
+    sheet.append(["shared", datetime.date(1999, 12, 31), None, 7])
+    sheet["A1"].font = Font(bold=True)
+    sheet["B2"].number_format = "yyyy-mm-dd hh:mm"
+    sheet["D2"].number_format = "#,##0.00"
+    sheet.merge_cells("A5:B5")
+    sheet.column_dimensions["A"].width = 30
+    wb.create_sheet("Other").append(["shared", label])
+    wb.save(path)
+    return use_shared_strings(path)
+
+
+def sheet_values(sheet):
+    # 合并单元格在容器层合并的结果中保留为空单元格，比较时去掉末尾的空行
+    rows = [[cell.value for cell in row] for row in sheet.iter_rows()]
+    while rows and all(value is None for value in rows[-1]):
+        rows.pop()
+    return rows
+
+
+def merge(tmp_path, sources):
+    output_path = str(tmp_path / "merged.xlsx")
+    XlsxMerger().merge(sources, output_path)
+    return openpyxl.load_workbook(output_path)
+
+
+def test_merge_matches_openpyxl_copy(tmp_path):
+    sources = [(make_workbook(tmp_path / f"{label}.xlsx", label), label) for label in ("a", "b")]
+    merged = merge(tmp_path, sources)
+
+    fallback_path = str(tmp_path / "fallback.xlsx")
+    ExcelProcessor._merge_sheets_with_openpyxl(sources, fallback_path)
+    fallback = openpyxl.load_workbook(fallback_path)
+
+    assert merged.sheetnames == fallback.sheetnames == ["a_Data", "a_Other", "b_Data", "b_Other"]
+    for title in merged.sheetnames:
+        assert sheet_values(merged[title]) == sheet_values(fallback[title])
+
+
+def test_styles_and_layout_are_kept(tmp_path):
+    sources = [(make_workbook(tmp_path / f"{label}.xlsx", label), label) for label in ("a", "b")]
+    merged = merge(tmp_path, sources)
+    for title in ("a_Data", "b_Data"):
+        sheet = merged[title]
+        assert sheet["A1"].font.bold
+        assert not sheet["A2"].font.bold
+        assert sheet["B2"].number_format == "yyyy-mm-dd hh:mm"
+        assert sheet["D2"].number_format == "#,##0.00"
+        assert [str(cell_range) for cell_range in sheet.merged_cells.ranges] == ["A5:B5"]
+        assert sheet.column_dimensions["A"].width == 30
+
+
+def test_shared_strings_are_deduplicated(tmp_path):
+    sources = [(make_workbook(tmp_path / f"{label}.xlsx", label), label) for label in ("a", "b")]
+    merge(tmp_path, sources)
+    with zipfile.ZipFile(tmp_path / "merged.xlsx") as package:
+        shared_strings = package.read("xl/sharedStrings.xml")
+    assert shared_strings.count(b">shared<") == 1
+
+
+@pytest.mark.parametrize("systems", [(False, True), (True, False), (True, True)])
+def test_mixed_date_systems_keep_dates(tmp_path, systems):
+    sources = [
+        (make_workbook(tmp_path / f"{label}.xlsx", label, date1904), label)
+        for label, date1904 in zip(("a", "b"), systems)
+    ]
+    merged = merge(tmp_path, sources)
+    assert (merged.epoch == CALENDAR_MAC_1904) == all(systems)
+    for title in ("a_Data", "b_Data"):
+        sheet = merged[title]
+        assert sheet["B2"].value == DATE
+        assert sheet["B3"].value == datetime.datetime(1999, 12, 31)
+        # 只有时间的单元格和普通数值不换算
+        assert sheet["C2"].value == TIME
+        assert sheet["D2"].value == 1234.5
+        assert sheet["D3"].value == 7
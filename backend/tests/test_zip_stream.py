@@ -0,0 +1,34 @@
+import io
+import zipfile
+
+from modules.zip_stream import ZipStream, output_arcname, public_error
+
+SOURCE = "/tmp/batch-toolbox/uploads/2d711642b726b044.docx"
+
+
+def test_output_arcname():
+    assert output_arcname("report.docx", SOURCE, "/out/2d711642b726b044_resized.docx") == "report_resized.docx"
+    assert output_arcname(None, SOURCE, "/out/2d711642b726b044.docx") == "2d711642b726b044.docx"
+
+
+def test_public_error_hides_server_paths():
+    error = f"Package not found at '{SOURCE}'"
+    assert public_error("bad.docx", SOURCE, error) == "Package not found at 'bad.docx'"
+
+    error = "cannot write /tmp/batch-toolbox/outputs/abc/2d711642b726b044_resized.png: disk full"
+    assert public_error("photo.png", SOURCE, error) == "cannot write photo_resized.png: disk full"
+
+    assert public_error("a.xlsx", SOURCE, "比例1/2无效") == "比例1/2无效"
+
+
+def test_zip_stream_roundtrip(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"hello" * 1000)
+    zip_stream = ZipStream()
+    data = b"".join(zip_stream.add_file(str(path), "data.txt"))
+    data += b"".join(zip_stream.add_bytes("oops\n", "errors.txt"))
+    data += zip_stream.close()
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read("data.txt") == b"hello" * 1000
+        assert zf.read("errors.txt") == b"oops\n"
@@ -0,0 +1,44 @@
+import re
+import shutil
+import zipfile
+from xml.sax.saxutils import escape
+from html import unescape
+
+_INLINE_CELL_RE = re.compile(rb'<c ([^>]*?)t="inlineStr"([^>]*)><is><t>([^<]*)</t></is></c>')
+_SHARED_STRINGS_TYPE = b"application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+_SHARED_STRINGS_REL = b"http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+
+
+def use_shared_strings(path):
+    """
+    把openpyxl写出的内联字符串单元格改为共享字符串，与Excel保存的文件一致
+
+    相同的文本只保存一份，单元格通过索引引用
+    """
+    strings = {}
+
+    def to_shared(match):
+        text = unescape(match.group(3).decode("utf-8"))
+        index = strings.setdefault(text, len(strings))
+        return b'<c %st="s"%s><v>%d</v></c>' % (match.group(1), match.group(2), index)
+
+    patched = str(path) + ".shared"
+    with zipfile.ZipFile(path) as zin, zipfile.ZipFile(patched, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename.startswith("xl/worksheets/sheet"):
+                data = _INLINE_CELL_RE.sub(to_shared, data)
+            elif info.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", b'<Override PartName="/xl/sharedStrings.xml" ContentType="%s"/></Types>'
+                                    % _SHARED_STRINGS_TYPE)
+            elif info.filename == "xl/_rels/workbook.xml.rels":
+                data = data.replace(b"</Relationships>", b'<Relationship Type="%s" Target="sharedStrings.xml" '
+                                    b'Id="rIdShared"/></Relationships>' % _SHARED_STRINGS_REL)
+            zout.writestr(info, data)
+        items = "".join(f"<si><t>{escape(text)}</t></si>" for text in strings)
+        zout.writestr("xl/sharedStrings.xml", (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{len(strings)}" uniqueCount="{len(strings)}">{items}</sst>'
+        ).encode("utf-8"))
+    shutil.move(patched, path)
+    return str(path)